@@ -1,14 +1,214 @@
-from django.contrib import admin
-from .models import Category, Product
+from django.contrib import admin, messages
+from .models import (Category, Product, Customer, Order, OrderDetail, Task, DailySales, IpnReconciliation,
+                     RelatedProduct)
+from .exports import orders_csv_response
+from .forms import ProductAdminForm
+from .inventory import OutOfStockError, adjust_stock
+from .orders import change_orders_status
+from .pagination import EstimatedCountPaginator
+from .search import search_queryset
+
+
+def _status_action(status: str):
+    """
+    Builds the changelist action moving the selected orders to `status` with a single UPDATE.
+    """
+    @admin.action(description=f'Mark selected orders as {status.lower()}')
+    def action(modeladmin, request, queryset) -> None:
+        try:
+            count = change_orders_status(queryset, status)
+        except OutOfStockError as error:
+            modeladmin.message_user(request, str(error), messages.ERROR)
+            return
+        modeladmin.message_user(request, f'{count} orders marked as {status.lower()}.')
+    action.__name__ = f'mark_{status.lower()}'
+    return action
+
+
+@admin.action(description='Export selected orders as CSV')
+def export_orders_csv(modeladmin, request, queryset):
+    """
+    Streams the selected orders with their lines as a CSV download.
+    """
+    return orders_csv_response(request, queryset)
 
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'created_at', 'updated_at')
+    search_fields = ('name',)
 
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'price', 'category', 'created_at', 'updated_at')
+    list_display = ('id', 'sku', 'name', 'price', 'stock', 'category', 'created_at', 'updated_at')
+    # The stock moves with the orders, it is only changed by relative adjustments (see ProductAdminForm).
     list_editable = ('price',)
+    list_select_related = ('category',)
+    list_filter = ('category',)
+    search_fields = ('name',)
+    autocomplete_fields = ('category',)
     ordering = ('id',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    form = ProductAdminForm
+
+    def get_readonly_fields(self, request, obj=None):
+        return ('stock',) if obj else ()
+
+    def get_fields(self, request, obj=None):
+        fields = super().get_fields(request, obj)
+        return fields if obj else [field for field in fields if field != 'stock_adjustment']
+
+    def save_model(self, request, obj, form, change) -> None:
+        if not change:
+            super().save_model(request, obj, form, change)
+            return
+        # Saving every field would write back the stock read with the form over the orders placed meanwhile,
+        # and the derivatives read with it over the ones the image task stored meanwhile.
+        skipped = {'stock', 'created_at'}
+        if 'image' in form.changed_data:
+            # The derivatives of the previous image are dropped, the original is shown until the new ones exist.
+            obj.image_variants = {}
+        else:
+            skipped.add('image_variants')
+        obj.save(update_fields=[field.name for field in obj._meta.concrete_fields
+                                if not field.primary_key and field.name not in skipped])
+        if (delta := form.cleaned_data.get('stock_adjustment')) and not adjust_stock(obj.pk, delta):
+            self.message_user(request, f'The stock of {obj} changed meanwhile and was not adjusted.', messages.ERROR)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Searches go through the full-text index instead of a name__icontains scan.
+        if not search_term:
+            return queryset, False
+        return search_queryset(search_term, queryset), False
+
+
+@admin.register(Customer)
+class CustomerAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'document_id', 'gender', 'phone')
+    list_select_related = ('user',)
+    search_fields = ('=document_id', '^user__username', '^user__email')
+    raw_id_fields = ('user',)
+    ordering = ('-id',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class OrderDetailInline(admin.TabularInline):
+    model = OrderDetail
+    fields = ('product', 'quantity', 'subtotal')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None) -> bool:
+        return False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+
+
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ('order_number', 'customer', 'status', 'total_amount', 'created_at')
+    list_select_related = ('customer__user',)
+    list_filter = ('status', 'created_at')
+    search_fields = ('=order_number',)
+    autocomplete_fields = ('customer',)
+    readonly_fields = ('order_number', 'total_amount', 'created_at')
+    inlines = (OrderDetailInline,)
+    actions = [*(_status_action(status) for status, _ in Order.STATUS_CHOICES), export_orders_csv]
+    ordering = ('-created_at',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def save_model(self, request, obj, form, change) -> None:
+        # Status changes go through the order service, which keeps the stock and the rollups in step.
+        status = obj.status
+        if change and 'status' in form.changed_data:
+            obj.status = form.initial['status']
+        super().save_model(request, obj, form, change)
+        if obj.status != status:
+            try:
+                change_orders_status(Order.objects.filter(pk=obj.pk), status)
+            except OutOfStockError as error:
+                self.message_user(request, f'{error} The order stays {obj.status.lower()}.', messages.ERROR)
+                return
+            obj.status = status
+
+
+@admin.register(OrderDetail)
+class OrderDetailAdmin(admin.ModelAdmin):
+    list_display = ('id', 'order', 'product', 'quantity', 'subtotal')
+    list_select_related = ('order', 'product')
+    search_fields = ('=order__order_number',)
+    raw_id_fields = ('order', 'product')
+    ordering = ('-id',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request) -> bool:
+        return False
+
+    def has_change_permission(self, request, obj=None) -> bool:
+        return False
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'run_at', 'updated_at')
+    list_filter = ('status',)
+    search_fields = ('=name',)
+    readonly_fields = ('payload', 'idempotency_key', 'attempts', 'locked_at', 'last_error')
+    ordering = ('-run_at',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(DailySales)
+class DailySalesAdmin(admin.ModelAdmin):
+    list_display = ('date', 'product', 'category', 'status', 'orders', 'quantity', 'revenue')
+    list_filter = ('status', 'date')
+    list_select_related = ('product', 'category')
+    date_hierarchy = 'date'
+    ordering = ('-date',)
+
+    def has_add_permission(self, request) -> bool:
+        return False
+
+    def has_change_permission(self, request, obj=None) -> bool:
+        return False
+
+
+@admin.register(IpnReconciliation)
+class IpnReconciliationAdmin(admin.ModelAdmin):
+    list_display = ('ipn', 'order', 'status', 'note', 'created_at')
+    list_select_related = ('ipn', 'order')
+    list_filter = ('status',)
+    search_fields = ('=order__order_number',)
+    ordering = ('-created_at',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request) -> bool:
+        return False
+
+    def has_change_permission(self, request, obj=None) -> bool:
+        return False
+
+
+@admin.register(RelatedProduct)
+class RelatedProductAdmin(admin.ModelAdmin):
+    list_display = ('product', 'rank', 'related', 'score')
+    list_select_related = ('product', 'related')
+    raw_id_fields = ('product', 'related')
+    ordering = ('product', 'rank')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request) -> bool:
+        return False
+
+    def has_change_permission(self, request, obj=None) -> bool:
+        return False
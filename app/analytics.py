@@ -0,0 +1,188 @@
+"""
+Daily sales rollups of the orders.
+
+Every order adds its details to the DailySales row of its day, product and
+status, and moves them between status rows when its status changes, so the
+reports aggregate a few summary rows instead of the whole order history.
+`rebuild_rollups` recomputes the rows from the orders for backfills and
+repairs.
+"""
+
+# Python imports.
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Iterable, Optional
+
+# Django imports.
+from django.db import transaction
+from django.db.models import Count, QuerySet, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+# Project imports.
+from app.models import DailySales, Order, OrderDetail
+
+
+BATCH_SIZE = 1000
+
+CENTS = Decimal('0.01')
+
+REPORT_GROUPS = {
+    'day': ('date',),
+    'category': ('category_id', 'category__name'),
+    'product': ('product_id', 'product__name'),
+    'status': ('status',),
+}
+
+
+Line = tuple[int, int, int, int, Decimal]
+
+
+def _order_lines(order: Order) -> list[Line]:
+    """
+    Returns the (product_id, category_id, orders, quantity, revenue) lines of an order, one per product.
+    """
+    return [(row['product_id'], row['product__category_id'], 1, row['quantity'], row['revenue'])
+            for row in OrderDetail.objects.filter(order=order)
+                                          .values('product_id', 'product__category_id')
+                                          .annotate(quantity=Sum('quantity'), revenue=Sum('subtotal'))
+                                          .order_by()]
+
+
+def _apply(day: date, changes: dict[str, int], lines: list[Line]) -> None:
+    """
+    Adds (sign 1) or subtracts (sign -1) the order lines to the rollup rows of a day for each status in `changes`.
+
+    The existing rows are locked and updated in one statement, so a status
+    change costs a handful of queries whatever the number of products. Missing
+    rows are first inserted empty, ignoring those a concurrent order inserted
+    first, then locked and updated like the others.
+    """
+    product_ids = [line[0] for line in lines]
+    rows = {(row.status, row.product_id): row
+            for row in DailySales.objects.select_for_update()
+                                         .filter(date=day, status__in=changes, product_id__in=product_ids)}
+    missing = [DailySales(date=day, status=status, product_id=product_id, category_id=category_id)
+               for status, sign in changes.items() if sign > 0
+               for product_id, category_id, *_ in lines if (status, product_id) not in rows]
+    if missing:
+        DailySales.objects.bulk_create(missing, ignore_conflicts=True)
+        rows.update(((row.status, row.product_id), row)
+                    for row in DailySales.objects.select_for_update()
+                                                 .filter(date=day, status__in={row.status for row in missing},
+                                                         product_id__in={row.product_id for row in missing}))
+    updated, emptied = [], []
+    for status, sign in changes.items():
+        for product_id, category_id, orders, quantity, revenue in lines:
+            row = rows.get((status, product_id))
+            if row is None:
+                continue
+            row.orders += sign * orders
+            row.quantity += sign * quantity
+            row.revenue += sign * revenue
+            (emptied if row.orders <= 0 else updated).append(row)
+
+    if updated:
+        DailySales.objects.bulk_update(updated, ['orders', 'quantity', 'revenue'])
+    if emptied:
+        DailySales.objects.filter(pk__in=[row.pk for row in emptied]).delete()
+
+
+def record_order(order: Order, details: Optional[Iterable[OrderDetail]] = None) -> None:
+    """
+    Adds a new order to the rollups, `details` avoids fetching its details again.
+    """
+    if details is None:
+        lines = _order_lines(order)
+    else:
+        merged: dict[int, list] = {}
+        for detail in details:
+            line = merged.setdefault(detail.product_id, [detail.product.category_id, 1, 0, Decimal('0')])
+            line[2] += detail.quantity
+            line[3] += detail.subtotal
+        lines = [(product_id, *line) for product_id, line in merged.items()]
+    if lines:
+        with transaction.atomic(savepoint=False):
+            _apply(timezone.localdate(order.created_at), {order.status: 1}, lines)
+
+
+def record_status_change(order: Order, previous_status: str) -> None:
+    """
+    Moves an order from its previous status rollups to its current status ones.
+    """
+    if previous_status == order.status:
+        return
+    lines = _order_lines(order)
+    if lines:
+        with transaction.atomic(savepoint=False):
+            _apply(timezone.localdate(order.created_at), {previous_status: -1, order.status: 1}, lines)
+
+
+def record_bulk_status_change(orders: QuerySet, status: str) -> None:
+    """
+    Moves the orders of a queryset that are not in `status` yet to its rollups, before their status is updated.
+    """
+    rows = (OrderDetail.objects.filter(order__in=orders.exclude(status=status))
+                               .annotate(date=TruncDate('order__created_at', tzinfo=timezone.get_current_timezone()))
+                               .values('date', 'order__status', 'product_id', 'product__category_id')
+                               .annotate(orders=Count('order_id', distinct=True), quantity=Sum('quantity'),
+                                         revenue=Sum('subtotal'))
+                               .order_by())
+    groups: dict[tuple[date, str], list[Line]] = {}
+    for row in rows:
+        groups.setdefault((row['date'], row['order__status']), []).append(
+            (row['product_id'], row['product__category_id'], row['orders'], row['quantity'], row['revenue']))
+    with transaction.atomic(savepoint=False):
+        for (day, previous_status), lines in groups.items():
+            _apply(day, {previous_status: -1, status: 1}, lines)
+
+
+def rebuild_rollups(start: Optional[date] = None, end: Optional[date] = None) -> int:
+    """
+    Recomputes the rollup rows of the days between `start` and `end` (inclusive) from the orders.
+
+    Returns the number of rows written.
+    """
+    rollups = DailySales.objects.all()
+    details = OrderDetail.objects.annotate(date=TruncDate('order__created_at', tzinfo=timezone.get_current_timezone()))
+    if start:
+        rollups = rollups.filter(date__gte=start)
+        details = details.filter(date__gte=start)
+    if end:
+        rollups = rollups.filter(date__lte=end)
+        details = details.filter(date__lte=end)
+
+    rows = (details.values('date', 'product_id', 'product__category_id', 'order__status')
+                   .annotate(orders=Count('order_id', distinct=True), quantity=Sum('quantity'), revenue=Sum('subtotal'))
+                   .order_by())
+    written = 0
+    with transaction.atomic():
+        rollups.delete()
+        batch = []
+        for row in rows.iterator(chunk_size=BATCH_SIZE):
+            batch.append(DailySales(date=row['date'], product_id=row['product_id'],
+                                    category_id=row['product__category_id'], status=row['order__status'],
+                                    orders=row['orders'], quantity=row['quantity'], revenue=row['revenue']))
+            if len(batch) == BATCH_SIZE:
+                DailySales.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        DailySales.objects.bulk_create(batch)
+        written += len(batch)
+    return written
+
+
+def sales_report(days: int, group: str, status: Optional[str] = None) -> list[dict]:
+    """
+    Returns the orders, quantity and revenue of the last `days` days grouped by day, category, product or status.
+    """
+    fields = REPORT_GROUPS[group]
+    rollups = DailySales.objects.filter(date__gt=timezone.localdate() - timedelta(days=days))
+    if status:
+        rollups = rollups.filter(status=status)
+    rows = list(rollups.values(*fields)
+                       .annotate(orders=Sum('orders'), quantity=Sum('quantity'), revenue=Sum('revenue'))
+                       .order_by('-revenue' if group != 'day' else 'date'))
+    for row in rows:
+        row['revenue'] = row['revenue'].quantize(CENTS)
+    return rows
@@ -0,0 +1,95 @@
+"""
+JSON API views for the shopping cart.
+
+Every write returns the updated cart summary, so the storefront can update
+the page without reloading it. Reads support ETag conditional requests.
+"""
+
+# Python imports.
+import json
+
+# Django imports.
+from django.http import HttpRequest, HttpResponse, JsonResponse, QueryDict
+from django.views.decorators.http import require_http_methods
+from django.utils.cache import patch_cache_control
+
+# Project imports.
+from app.models import Product
+from app.cart import Cart, parse_quantity
+from app.instrumentation import query_budget
+
+
+def _requested_quantity(request: HttpRequest, minimum: int = 1, default: int = 1) -> int:
+    """
+    Reads the `quantity` field of a JSON or form encoded request body.
+
+    Raises ValueError for a malformed body or a quantity out of the allowed range, see app.cart.parse_quantity.
+    """
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or '{}')
+        except json.JSONDecodeError:
+            raise ValueError('The request body is not valid JSON.')
+        if not isinstance(data, dict):
+            raise ValueError('The request body must be a JSON object.')
+    elif request.method == 'POST':
+        data = request.POST
+    else:
+        data = QueryDict(request.body)
+    return parse_quantity(data.get('quantity', default), minimum)
+
+
+def _cart_response(cart: Cart, status: int = 200) -> JsonResponse:
+    """
+    Returns the cart summary with its validator.
+    """
+    response = JsonResponse(cart.summary(), status=status)
+    response['ETag'] = cart.etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@query_budget(4)
+@require_http_methods(['GET', 'HEAD', 'DELETE'])
+def cart(request: HttpRequest) -> HttpResponse:
+    """
+    Returns the cart summary (GET) or clears the cart (DELETE).
+    """
+    cart = Cart(request)
+    if request.method == 'DELETE':
+        cart.clear()
+        return _cart_response(cart)
+
+    etag = cart.etag
+    if etag in (tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')):
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+    return _cart_response(cart)
+
+
+@query_budget(8)
+@require_http_methods(['POST', 'PUT', 'DELETE'])
+def cart_item(request: HttpRequest, product_id: int) -> JsonResponse:
+    """
+    Adds a quantity of a product (POST), sets its quantity (PUT) or removes it (DELETE).
+
+    An invalid quantity is answered with a 400 JSON error.
+    """
+    cart = Cart(request)
+    if request.method == 'DELETE':
+        cart.remove(product_id)
+        return _cart_response(cart)
+
+    if not (product := Product.objects.only('id').filter(pk=product_id).first()):
+        return JsonResponse({'error': 'Product not found.'}, status=404)
+    try:
+        # POST adds at least one unit, PUT may set 0 to remove the line.
+        quantity = _requested_quantity(request, minimum=1 if request.method == 'POST' else 0)
+        if request.method == 'POST':
+            cart.add(product, quantity)
+        else:
+            cart.update(product_id, quantity)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    return _cart_response(cart)
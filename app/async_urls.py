@@ -0,0 +1,26 @@
+"""
+Url router for the main application with the async views, used under ASGI.
+"""
+
+# Django imports.
+from django.urls import path
+
+# Project imports.
+from app import async_views
+from app.urls import app_name, urlpatterns as sync_urlpatterns
+
+
+def _async_version(view):
+    """
+    Returns the async version of an app.views view if there is one, the view itself otherwise.
+    """
+    if view.__module__ == 'app.views':
+        return getattr(async_views, view.__name__, view)
+    return view
+
+
+# Same routes as app.urls, replacing every view that has an async version.
+urlpatterns = [
+    path(str(pattern.pattern), _async_version(pattern.callback), name=pattern.name)
+    for pattern in sync_urlpatterns
+]
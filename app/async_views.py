@@ -0,0 +1,128 @@
+"""
+Async views for the catalog, product detail and cart endpoints, served when
+the project runs under ASGI (see config.async_urls).
+
+Queries go through Django's async ORM. Sessions and template rendering are
+still synchronous in Django 4.2, so those steps run in the thread pool via
+`sync_to_async`.
+"""
+
+# Django imports.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse, HttpResponseBadRequest, Http404
+from django.shortcuts import render, redirect
+from django.utils.functional import SimpleLazyObject
+
+# Project imports.
+from app.models import Product
+from app.cart import Cart, parse_quantity
+from app.catalog import aget_cached_product, get_category_summary, get_catalog_version
+from app.search import search_queryset
+from app.recommendations import get_related_products
+from app.instrumentation import query_budget
+from app.pagination import CursorPage, RankedPage
+from app.views import _catalog_page, _catalog_json, _catalog_html
+
+
+async def _render_catalog(request: HttpRequest, products, categories: list[dict],
+                          page_class: type = CursorPage) -> HttpResponse:
+    """
+    Async counterpart of app.views._render_catalog.
+    """
+    page = _catalog_page(request, products, page_class)
+    if request.GET.get('format') == 'json':
+        await page.aload()
+        return _catalog_json(page)
+    # The page stays lazy so a cached catalog fragment skips the query.
+    return await sync_to_async(_catalog_html)(request, page, categories)
+
+
+@query_budget(5)
+async def index(request: HttpRequest) -> HttpResponse:
+    """
+    Async view function for the product catalog index page.
+    """
+    categories = await sync_to_async(get_category_summary)()
+    if name := request.GET.get('name'):
+        # Search results are paged by relevance.
+        return await _render_catalog(request, search_queryset(name), categories, RankedPage)
+    return await _render_catalog(request, Product.objects.all(), categories)
+
+
+@query_budget(5)
+async def products_by_category(request: HttpRequest, category_id: int) -> HttpResponse:
+    """
+    Async view function for the product catalog by category id.
+    """
+    categories = await sync_to_async(get_category_summary)()
+    if not any(category['id'] == category_id for category in categories):
+        raise Http404('Category not found.')
+    return await _render_catalog(request, Product.objects.filter(category_id=category_id), categories)
+
+
+@query_budget(4)
+async def get_product_by_id(request: HttpRequest, product_id: int) -> HttpResponse:
+    """
+    Async view function for the product catalog by product id.
+    """
+    try:
+        product = await aget_cached_product(product_id)
+    except Product.DoesNotExist:
+        raise Http404('Product not found.')
+    version = await sync_to_async(get_catalog_version)()
+    # Lazy, queried in the rendering thread only when the related products fragment is not cached.
+    related_products = SimpleLazyObject(lambda: get_related_products(product))
+    return await sync_to_async(render)(request, 'product.html', {'product': product,
+                                                                  'related_products': related_products,
+                                                                  'catalog_version': version,
+                                                                  'catalog_cache_timeout': settings.CATALOG_CACHE_TIMEOUT},
+                                       using=settings.CATALOG_TEMPLATE_ENGINE)
+
+
+@query_budget(4)
+async def get_cart(request: HttpRequest) -> HttpResponse:
+    """
+    Async view function for the cart page.
+    """
+    # Built here rather than by the context processor, so an unreachable cart storage fails the page.
+    cart = await sync_to_async(Cart)(request)
+    return await sync_to_async(render)(request, 'cart.html', {'cart': cart})
+
+
+@query_budget(8)
+async def add_to_cart(request: HttpRequest, product_id: int) -> HttpResponse:
+    """
+    Async view function to add a product to the cart.
+    """
+    try:
+        quantity = parse_quantity(request.POST.get('quantity', 1))
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    try:
+        product = await Product.objects.aget(pk=product_id)
+    except Product.DoesNotExist:
+        raise Http404('Product not found.')
+    try:
+        await sync_to_async(lambda: Cart(request).add(product, quantity))()
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    return redirect(request.META.get('HTTP_REFERER', '/'))
+
+
+@query_budget(4)
+async def remove_from_cart(request: HttpRequest, product_id: int) -> HttpResponse:
+    """
+    Async view function to remove a product from the cart.
+    """
+    await sync_to_async(lambda: Cart(request).remove(product_id))()
+    return redirect(request.META.get('HTTP_REFERER', '/'))
+
+
+@query_budget(4)
+async def clear_cart(request: HttpRequest) -> HttpResponse:
+    """
+    Async view function to clear the cart.
+    """
+    await sync_to_async(lambda: Cart(request).clear())()
+    return redirect(request.META.get('HTTP_REFERER', '/'))
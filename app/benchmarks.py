@@ -0,0 +1,317 @@
+"""
+Benchmark dataset seeding and in-process load driver for the storefront.
+
+The driver replays the storefront and checkout flow (catalog, search,
+category, product, add to cart, confirm order, thanks) with Django's test
+client, so it needs no running server, and reports latency percentiles,
+query counts and allocations per endpoint. `benchmark_templates` times the
+storefront templates alone with every configured template engine.
+"""
+
+# Python imports.
+import asyncio
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+# Django imports.
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.backends.cache import SessionStore
+from django.db import connection, transaction
+from django.http import HttpRequest
+from django.template import engines
+from django.test import AsyncClient, Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+
+# Project imports.
+from app.models import Category, Product, Customer, Order, OrderDetail
+from app.cart import Cart
+from app.catalog import bump_catalog_version, get_category_summary, invalidate_category_summary
+from app.search import rebuild_index
+
+
+WORDS = ['shirt', 'jacket', 'shoes', 'hat', 'dress', 'jeans', 'socks', 'scarf', 'bag', 'watch',
+         'red', 'blue', 'black', 'white', 'green', 'classic', 'sport', 'summer', 'winter', 'cotton']
+
+BATCH_SIZE = 1000
+
+# Storefront templates timed by benchmark_templates, their includes are also timed alone.
+BENCHMARK_TEMPLATES = ['index.html', 'product.html', 'includes/catalog/catalog.html',
+                       'includes/catalog/categories.html', 'includes/header_cart.html', 'includes/relacionados.html']
+
+
+def seed(categories: int = 20, products: int = 1000, customers: int = 50, orders: int = 500,
+         seed_value: int = 0) -> None:
+    """
+    Populates the database with a synthetic catalog, customers and order history.
+
+    Bulk inserts skip the model signals, so the search index is rebuilt and
+    the catalog caches are invalidated here.
+    """
+    rng = random.Random(seed_value)
+
+    with transaction.atomic():
+        offset = Category.objects.count()
+        Category.objects.bulk_create([Category(name=f'Category {offset + index}') for index in range(categories)])
+        category_ids = list(Category.objects.values_list('id', flat=True))
+
+        Product.objects.bulk_create([
+            Product(name=' '.join(rng.choices(WORDS, k=3)).capitalize(),
+                    description=' '.join(rng.choices(WORDS, k=20)),
+                    price=rng.randint(100, 100000) / 100,
+                    image='products/seed.jpg',
+                    category_id=rng.choice(category_ids))
+            for _ in range(products)
+        ], batch_size=BATCH_SIZE)
+        product_prices = dict(Product.objects.values_list('id', 'price'))
+        product_ids = list(product_prices)
+
+        offset = User.objects.count()
+        usernames = [f'bench{offset + index}' for index in range(customers)]
+        User.objects.bulk_create([User(username=username, first_name=username, email=f'{username}@example.com',
+                                       password='!') for username in usernames], batch_size=BATCH_SIZE)
+        Customer.objects.bulk_create([
+            Customer(document_id=str(user_id), phone='3000000000', address='Bench street', user_id=user_id)
+            for user_id in User.objects.filter(username__in=usernames).values_list('id', flat=True)
+        ], batch_size=BATCH_SIZE)
+        customer_ids = list(Customer.objects.values_list('id', flat=True))
+
+        offset = Order.objects.count()
+        new_orders = Order.objects.bulk_create([
+            Order(order_number=f'SEED-{offset + index}', customer_id=rng.choice(customer_ids),
+                  status=rng.choice(Order.STATUS_CHOICES)[0])
+            for index in range(orders)
+        ], batch_size=BATCH_SIZE)
+
+        details = []
+        for order in new_orders:
+            for product_id in rng.sample(product_ids, k=min(len(product_ids), rng.randint(1, 5))):
+                quantity = rng.randint(1, 3)
+                details.append(OrderDetail(order=order, product_id=product_id, quantity=quantity,
+                                           subtotal=product_prices[product_id] * quantity))
+        OrderDetail.objects.bulk_create(details, batch_size=BATCH_SIZE)
+
+        rebuild_index()
+        transaction.on_commit(invalidate_category_summary)
+        transaction.on_commit(bump_catalog_version)
+
+
+class Sample:
+    """
+    Measurement of a single request.
+    """
+
+    __slots__ = ('endpoint', 'status', 'seconds', 'queries', 'allocated')
+
+    def __init__(self, endpoint: str, status: int, seconds: float, queries: int, allocated: Optional[int]) -> None:
+        self.endpoint = endpoint
+        self.status = status
+        self.seconds = seconds
+        self.queries = queries
+        self.allocated = allocated
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """
+    Returns the nearest-rank percentile of the values.
+    """
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+class LoadDriver:
+    """
+    Runs virtual users through the storefront flow and collects samples.
+    """
+
+    def __init__(self, host: str = 'localhost', trace_allocations: bool = False) -> None:
+        self.host = host
+        self.trace_allocations = trace_allocations
+        self.samples: list[Sample] = []
+        self.lock = threading.Lock()
+        self.product_ids = list(Product.objects.values_list('id', flat=True))
+        self.category_ids = list(Category.objects.values_list('id', flat=True))
+        self.users = list(User.objects.filter(customer__isnull=False))
+        if not self.product_ids or not self.users:
+            raise ValueError('The database has no products or customers, seed it first.')
+
+    def measure(self, endpoint: str, request: Callable):
+        """
+        Executes a request and records its latency, query count and allocations.
+        """
+        if self.trace_allocations:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = request()
+            seconds = time.perf_counter() - start
+        allocated = tracemalloc.get_traced_memory()[1] - before if self.trace_allocations else None
+
+        with self.lock:
+            self.samples.append(Sample(endpoint, response.status_code, seconds, len(queries), allocated))
+        return response
+
+    def user_session(self, user: User, iterations: int) -> None:
+        """
+        Replays the storefront and checkout flow for one virtual user.
+        """
+        # Failing requests are recorded as 500 responses instead of stopping the user.
+        client = Client(HTTP_HOST=self.host, raise_request_exception=False)
+        client.force_login(user)
+        rng = random.Random(user.id)
+        for _ in range(iterations):
+            product_id = rng.choice(self.product_ids)
+            self.measure('index', lambda: client.get('/'))
+            self.measure('search', lambda: client.get('/', {'name': rng.choice(WORDS)}))
+            self.measure('products_by_category',
+                         lambda: client.get(f'/products/category/{rng.choice(self.category_ids)}'))
+            self.measure('product', lambda: client.get(f'/products/{product_id}'))
+            self.measure('add_to_cart', lambda: client.post(f'/cart/add/{product_id}', {'quantity': 1}))
+            self.measure('confirm_order', lambda: client.post('/order/confirm/'))
+            self.measure('thanks', lambda: client.get('/order/thanks/', {'PayerID': 'BENCH'}))
+
+    def _threaded_user_session(self, user: User, iterations: int) -> None:
+        try:
+            self.user_session(user, iterations)
+        finally:
+            connection.close()
+
+    def run(self, users: int = 1, iterations: int = 10) -> dict[str, dict]:
+        """
+        Runs the given number of concurrent virtual users and returns the per-endpoint report.
+        """
+        if self.trace_allocations:
+            tracemalloc.start()
+        try:
+            selected = [self.users[index % len(self.users)] for index in range(users)]
+            if users == 1:
+                self.user_session(selected[0], iterations)
+            else:
+                threads = [threading.Thread(target=self._threaded_user_session, args=(user, iterations)) for user in selected]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+        finally:
+            if self.trace_allocations:
+                tracemalloc.stop()
+        return self.report()
+
+    def report(self) -> dict[str, dict]:
+        """
+        Summarizes the samples per endpoint.
+        """
+        grouped = defaultdict(list)
+        for sample in self.samples:
+            grouped[sample.endpoint].append(sample)
+
+        report = {}
+        for endpoint, samples in grouped.items():
+            latencies = [sample.seconds * 1000 for sample in samples]
+            allocations = [sample.allocated for sample in samples if sample.allocated is not None]
+            report[endpoint] = {
+                'requests': len(samples),
+                'errors': sum(sample.status >= 500 for sample in samples),
+                'p50_ms': percentile(latencies, 50),
+                'p95_ms': percentile(latencies, 95),
+                'p99_ms': percentile(latencies, 99),
+                'mean_ms': statistics.fmean(latencies),
+                'queries': statistics.fmean(sample.queries for sample in samples),
+                'peak_kib': statistics.fmean(allocations) / 1024 if allocations else None,
+            }
+        return report
+
+
+def compare_sync_async(paths: list[str], concurrency: int = 10, requests: int = 200) -> dict[str, float]:
+    """
+    Measures the requests per second of the sync views (WSGI handler, one thread per
+    client) against the async views (ASGI handler, one task per client) on the same paths.
+    """
+    per_client = max(1, requests // concurrency)
+
+    def sync_client(index: int) -> None:
+        client = Client()
+        try:
+            for number in range(per_client):
+                client.get(paths[(index + number) % len(paths)])
+        finally:
+            connection.close()
+
+    async def async_client(index: int) -> None:
+        client = AsyncClient()
+        for number in range(per_client):
+            await client.get(paths[(index + number) % len(paths)])
+
+    async def run_async() -> None:
+        await asyncio.gather(*(async_client(index) for index in range(concurrency)))
+
+    results = {}
+    allowed_hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+    with override_settings(ROOT_URLCONF='config.urls', ALLOWED_HOSTS=allowed_hosts):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(sync_client, range(concurrency)))
+        results['sync_rps'] = per_client * concurrency / (time.perf_counter() - start)
+
+    with override_settings(ROOT_URLCONF='config.async_urls', ALLOWED_HOSTS=allowed_hosts):
+        start = time.perf_counter()
+        asyncio.run(run_async())
+        results['async_rps'] = per_client * concurrency / (time.perf_counter() - start)
+    return results
+
+
+def template_context() -> tuple[dict, HttpRequest]:
+    """
+    Returns a catalog page context and an anonymous request to render the storefront templates with.
+    """
+    request = RequestFactory().get('/')
+    request.session = SessionStore()
+    request.user = AnonymousUser()
+    products = list(Product.objects.select_related('category').order_by('-id')[:settings.CATALOG_PAGE_SIZE])
+    if not products:
+        raise ValueError('The database has no products, seed it first.')
+    context = {'products': products,
+               'product': products[0],
+               'related_products': products[1:5],
+               'categories': get_category_summary(),
+               # A zero timeout never stores the fragments, every render does the full work.
+               'catalog_version': 0,
+               'catalog_cache_timeout': 0,
+               'catalog_fragment_key': '/?',
+               'next_url': lambda: '?after=cursor',
+               'previous_url': lambda: ''}
+    return context, request
+
+
+def benchmark_templates(iterations: int = 200) -> dict[str, dict[str, dict]]:
+    """
+    Renders every storefront template `iterations` times with each configured engine and returns,
+    per engine and template, the first (load and compile) and the mean steady state render times.
+    """
+    context, request = template_context()
+    # Load the cart lines once, the query is not part of the render time.
+    list(Cart(request))
+    report = {}
+    for engine in engines.all():
+        report[engine.name] = {}
+        for name in BENCHMARK_TEMPLATES:
+            start = time.perf_counter()
+            engine.get_template(name).render(context, request)
+            first = time.perf_counter() - start
+            latencies = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                engine.get_template(name).render(context, request)
+                latencies.append((time.perf_counter() - start) * 1000)
+            report[engine.name][name] = {'first_ms': first * 1000,
+                                         'mean_ms': statistics.fmean(latencies),
+                                         'p95_ms': percentile(latencies, 95)}
+    return report
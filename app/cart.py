@@ -2,71 +2,182 @@
 Definition of the Cart class representing the shopping cart.
 """
 
+# Python imports.
+import hashlib
+from decimal import Decimal
+
 # Django imports.
+from django.conf import settings
 from django.http import HttpRequest
 
 # Project imports.
 from app.models import Product
+from app.cart_storage import get_cart_storage, encode_lines
+from app.catalog import get_catalog_version
+from app.images import variant_url
+
+
+def get_max_quantity() -> int:
+    return getattr(settings, 'CART_MAX_QUANTITY', 999)
+
+
+def parse_quantity(value, minimum: int = 1) -> int:
+    """
+    Returns a requested line quantity, raises ValueError unless it is an integer from `minimum` to CART_MAX_QUANTITY.
+    """
+    if isinstance(value, str) and value.strip().lstrip('-').isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or not minimum <= value <= get_max_quantity():
+        raise ValueError(f'The quantity must be an integer from {minimum} to {get_max_quantity()}.')
+    return value
+
+
+class CartLine:
+    """
+    A cart line priced against the current product data.
+    """
+
+    def __init__(self, product: Product, quantity: int) -> None:
+        self.product = product
+        self.quantity = quantity
+
+    @property
+    def product_id(self) -> int:
+        return self.product.id
+
+    @property
+    def name(self) -> str:
+        return self.product.name
+
+    @property
+    def price(self) -> Decimal:
+        return self.product.price
+
+    @property
+    def image(self) -> str:
+        return variant_url(self.product, 160)
+
+    @property
+    def category(self) -> str:
+        return self.product.category.name
+
+    @property
+    def subtotal(self) -> Decimal:
+        return self.product.price * self.quantity
 
 
 class Cart:
+    """
+    Shopping cart stored as {product_id: quantity} by the configured cart storage.
+
+    Prices, names and images are never copied into the session, the lines are
+    priced in one query against the products table the first time they are
+    needed and the result is memoized on the request.
+    """
 
     def __init__(self, request: HttpRequest) -> None:
         """
         Initializes the Cart object.
         """
         self.request = request
-        self.session = request.session
-        cart = self.session.get('cart')
-        total_amount = self.session.get('cart_total_amount')
+        self.storage = get_cart_storage(request)
+        self.cart = self.storage.load()
+        self.saved = dict(self.cart)
 
-        if not cart:
-            cart = self.session['cart'] = {}
-            total_amount = self.session['cart_total_amount'] = '0'
+    def __iter__(self):
+        return iter(self.lines)
 
-        self.cart = cart
-        self.total_amount = float(total_amount)
-        
+    def __len__(self) -> int:
+        return len(self.cart)
 
-    def add(self, product: Product, quantity: int) -> None:
+    @property
+    def lines(self) -> list[CartLine]:
         """
-        Adds a product to the cart.
-        """
-        product_id = str(product.id)
-        if not product_id in self.cart:
-            self.cart[product_id] = {
-                'product_id': product.id,
-                'name': product.name,
-                'price': str(product.price),
-                'image': product.image.url,
-                'quantity': quantity,
-                'category': str(product.category),
-                'subtotal': str(product.price * quantity)
-            }
-        else:
-            self.cart[product_id]['quantity'] += quantity
-            self.cart[product_id]['subtotal'] = str(product.price * self.cart[product_id]['quantity'])
+        Returns the cart lines priced in a single batched query, memoized per request.
+        """
+        lines = getattr(self.request, '_cart_lines', None)
+        if lines is None:
+            products = Product.objects.select_related('category').in_bulk(list(self.cart))
+            lines = [CartLine(products[product_id], quantity)
+                     for product_id, quantity in self.cart.items()
+                     if product_id in products]
+            self.request._cart_lines = lines
+        return lines
 
+    @property
+    def total_amount(self) -> Decimal:
+        """
+        Returns the cart total amount.
+        """
+        return sum((line.subtotal for line in self.lines), Decimal('0'))
+
+    @property
+    def etag(self) -> str:
+        """
+        Returns a validator that changes whenever the cart content or the catalog prices change.
+        """
+        digest = hashlib.sha1(encode_lines(self.cart) + str(get_catalog_version()).encode()).hexdigest()
+        return f'"{digest}"'
+
+    def summary(self) -> dict:
+        """
+        Returns the JSON serializable summary of the cart.
+        """
+        return {'count': len(self.lines),
+                'total_amount': str(self.total_amount),
+                'lines': [{'product_id': line.product_id,
+                           'name': line.name,
+                           'price': str(line.price),
+                           'quantity': line.quantity,
+                           'subtotal': str(line.subtotal),
+                           'image': line.image,
+                           'category': line.category} for line in self.lines]}
+
+    def quantities(self) -> dict[int, int]:
+        """
+        Returns the cart content as {product_id: quantity}.
+        """
+        return dict(self.cart)
+
+    def add(self, product: Product, quantity: int) -> None:
+        """
+        Adds a product to the cart, raises ValueError when its quantity would leave the allowed range.
+        """
+        self.cart[product.id] = parse_quantity(self.cart.get(product.id, 0) + parse_quantity(quantity))
         self.save()
         
+    def update(self, product_id: int, quantity: int) -> None:
+        """
+        Sets the quantity of a product in the cart, removing it when the quantity is 0.
+
+        Raises ValueError when the quantity is out of the allowed range.
+        """
+        if quantity := parse_quantity(quantity, minimum=0):
+            self.cart[product_id] = quantity
+        else:
+            self.cart.pop(product_id, None)
+        self.save()
+
     def remove(self, product_id: int) -> None:
         """
         Removes a product from the cart.
         """
-        if self.cart.pop(str(product_id)):
+        if self.cart.pop(product_id, None) is not None:
             self.save()
 
     def clear(self) -> None:
         """
         Clears the cart.
         """
-        self.session['cart'] = {}
-        self.session['cart_total_amount'] = '0'
+        self.cart = {}
+        self.save()
 
     def save(self) -> None:
         """
-        Saves the cart.
+        Saves the cart, skipping the write when nothing changed.
         """
-        self.session['cart_total_amount'] = str(sum([float(product['subtotal']) for product in self.cart.values()]))
-        self.session['cart'] = self.cart
-        self.session.modified = True
+        if self.cart == self.saved:
+            return
+        self.storage.save(self.cart)
+        self.saved = dict(self.cart)
+        self.request._cart_lines = None
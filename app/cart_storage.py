@@ -0,0 +1,245 @@
+"""
+Storage backends for the shopping cart.
+
+A cart is a {product_id: quantity} mapping encoded as a compact sequence of
+unsigned LEB128 varints (id, quantity, id, quantity, ...), usually a couple
+of bytes per line. The backend is selected with the `CART_STORAGE` setting.
+`python manage.py runcartstore` serves a local stand-in for Redis, see
+app.resp_server.
+"""
+
+# Python imports.
+import base64
+import secrets
+import socket
+import threading
+from typing import Optional
+from urllib.parse import urlparse
+
+# Django imports.
+from django.conf import settings
+from django.http import HttpRequest
+from django.utils.module_loading import import_string
+
+
+def encode_lines(lines: dict[int, int]) -> bytes:
+    """
+    Encodes cart lines as a flat sequence of varints, raises ValueError for ids or quantities below 1.
+    """
+    encoded = bytearray()
+    for product_id, quantity in lines.items():
+        for value in (product_id, quantity):
+            if not isinstance(value, int) or value < 1:
+                raise ValueError(f'Cart lines must be positive integers, got {value!r}.')
+            while value > 0x7f:
+                encoded.append((value & 0x7f) | 0x80)
+                value >>= 7
+            encoded.append(value)
+    return bytes(encoded)
+
+
+def decode_lines(data: bytes) -> dict[int, int]:
+    """
+    Decodes cart lines encoded by `encode_lines`.
+    """
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            values.append(value)
+            value = shift = 0
+    return dict(zip(values[::2], values[1::2]))
+
+
+class CartStorage:
+    """
+    Base class of the cart storage backends.
+    """
+
+    def __init__(self, request: HttpRequest) -> None:
+        self.request = request
+
+    def load(self) -> dict[int, int]:
+        raise NotImplementedError
+
+    def save(self, lines: dict[int, int]) -> None:
+        raise NotImplementedError
+
+
+class SessionCartStorage(CartStorage):
+    """
+    Keeps the encoded cart in the session, so it follows `SESSION_ENGINE`
+    (e.g. cached_db to serve reads from the cache instead of the database).
+    """
+
+    session_key = 'cart'
+
+    def load(self) -> dict[int, int]:
+        value = self.request.session.get(self.session_key)
+        if isinstance(value, dict):
+            # Carts saved as JSON objects before the binary encoding.
+            return {int(product_id): line['quantity'] if isinstance(line, dict) else line
+                    for product_id, line in value.items()}
+        return decode_lines(base64.b64decode(value)) if value else {}
+
+    def save(self, lines: dict[int, int]) -> None:
+        self.request.session[self.session_key] = base64.b64encode(encode_lines(lines)).decode()
+        self.request.session.pop('cart_total_amount', None)
+
+
+class RespError(Exception):
+    """
+    Raised for error replies and malformed replies of a RESP server.
+    """
+
+
+class RespClient:
+    """
+    Minimal client for servers speaking the Redis protocol (RESP).
+
+    A client holds one connection and is not thread safe, get_resp_client
+    hands every thread its own.
+    """
+
+    def __init__(self, url: str, timeout: float = 1.0) -> None:
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or 'localhost', parsed.port or 6379)
+        self.database = int(parsed.path.strip('/') or 0)
+        self.password = parsed.password
+        self.timeout = timeout
+        self.connection: Optional[socket.socket] = None
+        self.reader = None
+
+    def _connect(self) -> None:
+        self.connection = socket.create_connection(self.address, timeout=self.timeout)
+        self.reader = self.connection.makefile('rb')
+        try:
+            if self.password:
+                self._command('AUTH', self.password)
+            if self.database:
+                self._command('SELECT', self.database)
+        except Exception:
+            self.close()
+            raise
+
+    def _read(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError('Connection closed by the server.')
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b'+':
+            return payload
+        if prefix == b'-':
+            raise RespError(payload.decode())
+        if prefix == b':':
+            return int(payload)
+        if prefix == b'$':
+            length = int(payload)
+            return None if length < 0 else self.reader.read(length + 2)[:-2]
+        if prefix == b'*':
+            length = int(payload)
+            return None if length < 0 else [self._read() for _ in range(length)]
+        # The rest of the stream cannot be trusted anymore.
+        self.close()
+        raise RespError(f'Unexpected reply {line!r}.')
+
+    def _command(self, *args):
+        parts = [arg if isinstance(arg, bytes) else str(arg).encode() for arg in args]
+        payload = b''.join([b'*%d\r\n' % len(parts)] + [b'$%d\r\n%s\r\n' % (len(part), part) for part in parts])
+        self.connection.sendall(payload)
+        return self._read()
+
+    def execute(self, *args):
+        """
+        Sends a command and returns its reply, reconnecting once if the connection dropped.
+
+        Only network errors are retried, error replies raise RespError right away.
+        """
+        for attempt in range(2):
+            try:
+                if self.connection is None:
+                    self._connect()
+                return self._command(*args)
+            except OSError:
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+        self.connection = self.reader = None
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.execute('GET', key)
+
+    def set(self, key: str, value: bytes, timeout: Optional[int] = None) -> None:
+        if timeout:
+            self.execute('SET', key, value, 'EX', timeout)
+        else:
+            self.execute('SET', key, value)
+
+    def delete(self, key: str) -> None:
+        self.execute('DEL', key)
+
+
+_clients = threading.local()
+
+
+def get_resp_client(url: str) -> RespClient:
+    """
+    Returns the client of the current thread for the given url.
+    """
+    clients = getattr(_clients, 'by_url', None)
+    if clients is None:
+        clients = _clients.by_url = {}
+    if url not in clients:
+        clients[url] = RespClient(url)
+    return clients[url]
+
+
+class RedisCartStorage(CartStorage):
+    """
+    Keeps the encoded cart in a Redis-compatible server under a random cart
+    id stored in the session, so cart writes never touch the session store.
+
+    The id is session data rather than the session key, which `login()`
+    cycles: the cart of an anonymous customer follows them when they log in
+    to check out.
+    """
+
+    key_prefix = 'cart:'
+    session_key = 'cart_id'
+
+    def __init__(self, request: HttpRequest) -> None:
+        super().__init__(request)
+        self.client = get_resp_client(settings.CART_REDIS_URL)
+
+    def _key(self, create: bool = False) -> Optional[str]:
+        session = self.request.session
+        if session.get(self.session_key) is None and create:
+            session[self.session_key] = secrets.token_urlsafe(16)
+        cart_id = session.get(self.session_key)
+        return self.key_prefix + cart_id if cart_id else None
+
+    def load(self) -> dict[int, int]:
+        key = self._key()
+        data = self.client.get(key) if key else None
+        return decode_lines(data) if data else {}
+
+    def save(self, lines: dict[int, int]) -> None:
+        key = self._key(create=True)
+        if lines:
+            self.client.set(key, encode_lines(lines), settings.SESSION_COOKIE_AGE)
+        else:
+            self.client.delete(key)
+
+
+def get_cart_storage(request: HttpRequest) -> CartStorage:
+    """
+    Instantiates the storage backend configured in `CART_STORAGE`.
+    """
+    storage_class = import_string(getattr(settings, 'CART_STORAGE', 'app.cart_storage.SessionCartStorage'))
+    return storage_class(request)
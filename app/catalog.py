@@ -0,0 +1,76 @@
+"""
+Cached read models for the product catalog.
+"""
+
+# Django imports.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+# Project imports.
+from app.models import Category, Product
+
+
+CATEGORY_SUMMARY_KEY = 'catalog:category_summary'
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def get_category_summary() -> list[dict]:
+    """
+    Returns every category with its product count, computed in one aggregated query and cached.
+    """
+    summary = cache.get(CATEGORY_SUMMARY_KEY)
+    if summary is None:
+        summary = list(Category.objects.annotate(product_count=Count('products'))
+                                       .order_by('name')
+                                       .values('id', 'name', 'product_count'))
+        cache.set(CATEGORY_SUMMARY_KEY, summary, getattr(settings, 'CATEGORY_SUMMARY_TIMEOUT', None))
+    return summary
+
+
+def invalidate_category_summary() -> None:
+    """
+    Drops the cached category summary so the next request rebuilds it.
+    """
+    cache.delete(CATEGORY_SUMMARY_KEY)
+
+
+def get_catalog_version() -> int:
+    """
+    Returns the catalog version, part of every catalog cache key.
+    """
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, 1, None)
+        version = cache.get(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version() -> None:
+    """
+    Moves the catalog to a new version so every cached catalog page and product is stale.
+    """
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, 2, None)
+
+
+def get_cached_product(product_id: int) -> Product:
+    """
+    Returns the product with its category from the cache of the current catalog version.
+    """
+    key = f'catalog:{get_catalog_version()}:product:{product_id}'
+    product = cache.get(key)
+    if product is None:
+        product = Product.objects.select_related('category').get(pk=product_id)
+        cache.set(key, product, settings.CATALOG_CACHE_TIMEOUT)
+    return product
+
+
+async def aget_cached_product(product_id: int) -> Product:
+    """
+    Async counterpart of get_cached_product, for the async views.
+    """
+    return await sync_to_async(get_cached_product)(product_id)
@@ -0,0 +1,269 @@
+"""
+Streaming catalog import and export.
+
+Files are CSV or JSON lines with the columns of FIELDS and are read and
+written row by row, so their size does not matter. Imports upsert the
+products by SKU in batches, each batch is a single
+`bulk_create(update_conflicts=True)` in its own transaction followed by one
+search index refresh, and categories are created by name on first sight.
+Bulk writes skip the model signals, so the catalog caches are invalidated
+and the image derivatives queued here instead.
+"""
+
+# Python imports.
+import csv
+import hashlib
+import json
+import os
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from typing import Callable, IO, Iterable, Iterator, Optional
+
+# Django imports.
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+# Project imports.
+from app.models import Category, Product
+from app.catalog import bump_catalog_version, invalidate_category_summary
+from app.images import schedule_product_images
+from app.search import index_product_ids
+
+
+FIELDS = ['sku', 'name', 'description', 'price', 'stock', 'category', 'image']
+FORMATS = ('csv', 'jsonl')
+# Columns overwritten on existing SKUs, only when the row has them.
+UPDATE_FIELDS = ('name', 'description', 'price', 'stock', 'category', 'image')
+MAX_PRICE = Decimal('99999999.99')
+BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 2000
+# Invalid rows reported with their error, the following ones are only counted as skipped.
+MAX_ERRORS = 100
+
+
+class TransferStats:
+    """
+    Progress of an import or export.
+    """
+
+    def __init__(self) -> None:
+        self.rows = 0
+        self.skipped = 0
+        self.errors: list[str] = []
+        self.started = time.perf_counter()
+
+    def skip(self, error: str) -> None:
+        """
+        Counts a skipped row, keeping its error among the first MAX_ERRORS ones.
+        """
+        self.skipped += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(error)
+
+    @property
+    def seconds(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / max(self.seconds, 1e-9)
+
+
+def get_format(path: str, format: Optional[str] = None) -> str:
+    """
+    Returns the explicit format or the one of the file extension, CSV by default.
+    """
+    format = format or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    if format not in FORMATS:
+        raise ValueError(f'Unknown format {format!r}, use one of {", ".join(FORMATS)}.')
+    return format
+
+
+def read_rows(file: IO[str], format: str) -> Iterator[tuple[int, dict]]:
+    """
+    Yields the line number and the values of every row of a catalog file.
+    """
+    if format == 'csv':
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(file, 1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError:
+                    # Reported as an invalid row, the rest of the file is still imported.
+                    yield line_number, None
+
+
+def batched(rows: Iterable, size: int) -> Iterator[list]:
+    """
+    Splits an iterable in lists of `size` items without reading it ahead.
+    """
+    iterator = iter(rows)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class CatalogImporter:
+    """
+    Upserts the products of a catalog file by SKU, `batch_size` rows per transaction.
+    """
+
+    def __init__(self, batch_size: int = BATCH_SIZE, images_dir: Optional[str] = None,
+                 progress: Optional[Callable[[TransferStats], None]] = None) -> None:
+        self.batch_size = batch_size
+        self.images_dir = images_dir
+        self.progress = progress
+        self.stats = TransferStats()
+        # Category ids by name, categories are few and looked up once per import.
+        self.categories: dict[str, int] = {}
+        # Stored names of the images already attached by this import, by their name in the file.
+        self.images: dict[str, str] = {}
+
+    def run(self, file: IO[str], format: str) -> TransferStats:
+        """
+        Imports every row of the file and returns the import stats.
+        """
+        for batch in batched(read_rows(file, format), self.batch_size):
+            self.import_batch(batch)
+            if self.progress:
+                self.progress(self.stats)
+        return self.stats
+
+    def import_batch(self, rows: list[tuple[int, Optional[dict]]]) -> None:
+        """
+        Upserts the valid rows of a batch in one transaction, invalid rows are counted and reported.
+        """
+        products = {}
+        for line_number, row in rows:
+            try:
+                product = self.parse(row)
+            except ValueError as error:
+                self.stats.skip(f'Line {line_number}: {error}')
+                continue
+            # The last row of a repeated SKU wins, an upsert cannot touch a row twice.
+            columns = frozenset(field for field in UPDATE_FIELDS if self.present(row, field))
+            products[product.sku] = (product, columns)
+        if not products:
+            return
+
+        # Rows missing a column (JSON lines may omit keys) keep the current value of the product.
+        groups = {}
+        for product, columns in products.values():
+            groups.setdefault(columns, []).append(product)
+        with transaction.atomic():
+            self.resolve_categories(product for product, _ in products.values())
+            for columns, group in groups.items():
+                Product.objects.bulk_create(group, batch_size=self.batch_size, update_conflicts=True,
+                                            unique_fields=['sku'],
+                                            update_fields=[*(field for field in UPDATE_FIELDS if field in columns),
+                                                           'updated_at'])
+            # Upserted rows get no primary key back, they are read again by SKU.
+            saved = list(Product.objects.filter(sku__in=list(products)).only('id', 'image', 'image_variants'))
+            index_product_ids([product.id for product in saved])
+            schedule_product_images(saved)
+            transaction.on_commit(invalidate_category_summary)
+            transaction.on_commit(bump_catalog_version)
+        self.stats.rows += len(products)
+
+    @staticmethod
+    def present(row: dict, field: str) -> bool:
+        """
+        Returns whether a row sets a column of the existing products.
+
+        An empty stock cell keeps the current stock, clearing it would stop
+        tracking the product, and an empty image cell keeps the current image.
+        """
+        value = row.get(field)
+        return value is not None and not (field in ('stock', 'image') and value == '')
+
+    def parse(self, row: Optional[dict]) -> Product:
+        """
+        Builds the (unsaved) product of a row, raises ValueError when the row is invalid.
+        """
+        if not isinstance(row, dict):
+            raise ValueError('Not a JSON object.')
+        sku, name, category = (str(row.get(field) or '').strip() for field in ('sku', 'name', 'category'))
+        if not sku or not name or not category:
+            raise ValueError('sku, name and category are required.')
+        try:
+            price = Decimal(str(row.get('price'))).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            price = None
+        if price is None or not price.is_finite() or not 0 <= price <= MAX_PRICE:
+            raise ValueError(f'Invalid price {row.get("price")!r}.')
+        stock = row.get('stock')
+        try:
+            stock = int(stock) if stock not in (None, '') else None
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid stock {stock!r}.')
+        if stock is not None and stock < 0:
+            raise ValueError(f'Invalid stock {stock!r}.')
+        product = Product(sku=sku[:64], name=name[:255], description=str(row.get('description') or ''), price=price,
+                          stock=stock, image=self.attach_image(str(row.get('image') or '')))
+        # Resolved to category_id with the rest of the batch.
+        product._category_name = category[:255]
+        return product
+
+    def attach_image(self, image: str) -> str:
+        """
+        Returns the stored name of a row image, copying it from `images_dir` to the media storage when given.
+        """
+        if not image or not self.images_dir:
+            return image
+        source = os.path.join(self.images_dir, image)
+        if not os.path.isfile(source):
+            raise ValueError(f'Image {image!r} not found in {self.images_dir}.')
+        if image not in self.images:
+            with open(source, 'rb') as file:
+                digest = hashlib.file_digest(file, 'sha256').hexdigest()[:16]
+                stem, extension = os.path.splitext(os.path.basename(image))
+                # Named after the content: a picture is stored once, pictures sharing a file name stay apart.
+                name = f'products/{stem[:50]}-{digest}{extension}'
+                if not default_storage.exists(name):
+                    file.seek(0)
+                    name = default_storage.save(name, File(file))
+            self.images[image] = name
+        return self.images[image]
+
+    def resolve_categories(self, products: Iterable[Product]) -> None:
+        """
+        Sets the category of the products, creating the categories not seen before.
+        """
+        products = list(products)
+        missing = {product._category_name for product in products} - self.categories.keys()
+        if missing:
+            Category.objects.bulk_create([Category(name=name) for name in missing], ignore_conflicts=True)
+            self.categories.update(Category.objects.filter(name__in=missing).values_list('name', 'id'))
+        for product in products:
+            product.category_id = self.categories[product._category_name]
+
+
+def export_catalog(file: IO[str], format: str, chunk_size: int = EXPORT_CHUNK_SIZE,
+                   progress: Optional[Callable[[TransferStats], None]] = None) -> TransferStats:
+    """
+    Writes every product to a catalog file, reading them `chunk_size` at a time.
+    """
+    stats = TransferStats()
+    products = (Product.objects.select_related('category')
+                               .only('sku', 'name', 'description', 'price', 'stock', 'image', 'category__name')
+                               .order_by('pk')
+                               .iterator(chunk_size=chunk_size))
+    writer = csv.writer(file) if format == 'csv' else None
+    if writer:
+        writer.writerow(FIELDS)
+    for product in products:
+        values = [product.sku or '', product.name, product.description, str(product.price),
+                  product.stock, product.category.name, product.image.name or '']
+        if writer:
+            writer.writerow(['' if value is None else value for value in values])
+        else:
+            file.write(json.dumps(dict(zip(FIELDS, values)), ensure_ascii=False) + '\n')
+        stats.rows += 1
+        if progress and stats.rows % chunk_size == 0:
+            progress(stats)
+    return stats
@@ -0,0 +1,44 @@
+"""
+Template context processors for the application.
+"""
+
+# Python imports.
+import logging
+from decimal import Decimal
+
+# Django imports.
+from django.http import HttpRequest
+
+# Project imports.
+from app.cart import Cart
+
+
+logger = logging.getLogger(__name__)
+
+
+class _EmptyCart:
+    """
+    Cart shown in the header while the cart storage is unreachable.
+    """
+
+    total_amount = Decimal('0')
+
+    def __iter__(self):
+        return iter(())
+
+    def __len__(self) -> int:
+        return 0
+
+
+def cart(request: HttpRequest) -> dict:
+    """
+    Exposes the request cart to every template as `cart`.
+
+    An unreachable cart storage shows an empty header cart instead of failing
+    every page, the cart and checkout views still fail on it.
+    """
+    try:
+        return {'cart': Cart(request)}
+    except OSError:
+        logger.warning('The cart storage is unreachable, the header cart is shown empty.', exc_info=True)
+        return {'cart': _EmptyCart()}
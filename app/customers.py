@@ -0,0 +1,33 @@
+"""
+Customer of the current request, loaded at most once per request by get_customer.
+"""
+
+# Python imports.
+from typing import Optional
+
+# Django imports.
+from django.http import HttpRequest
+
+# Project imports.
+from app.models import Customer
+
+
+def get_customer(request: HttpRequest) -> Optional[Customer]:
+    """
+    Returns the customer profile of the logged in user, None for anonymous users or users without one.
+    """
+    if not hasattr(request, '_cached_customer'):
+        user = request.user
+        customer = Customer.objects.filter(user=user).first() if user.is_authenticated else None
+        if customer is not None:
+            # The user is already loaded, Customer.__str__ must not fetch it again.
+            customer.user = user
+        request._cached_customer = customer
+    return request._cached_customer
+
+
+def set_customer(request: HttpRequest, customer: Customer) -> None:
+    """
+    Replaces the cached customer of the request after it was created or updated.
+    """
+    request._cached_customer = customer
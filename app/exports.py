@@ -0,0 +1,130 @@
+"""
+Streaming CSV export of the orders with their lines, for finance.
+
+Every order line is a row, an order without lines is a row with empty line
+columns. Free text starting like a spreadsheet formula is quoted. Orders are read in keyset chunks of ORDER_EXPORT_CHUNK_SIZE ordered by
+(created_at, id): each chunk is one query for the orders with their
+customer and one for their lines with the product, and is written out as
+soon as it is read. Memory stays flat whatever the number of orders, and no
+cursor or transaction stays open while a slow client downloads the file.
+Under ASGI the chunks are produced by an async iterator, Django would
+otherwise consume a synchronous one whole before sending it.
+"""
+
+# Python imports.
+import csv
+from datetime import date, datetime, time, timedelta
+from typing import AsyncIterator, Iterator, Optional
+
+# Django imports.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Q, QuerySet
+from django.http import HttpRequest, StreamingHttpResponse
+from django.utils import timezone
+
+# Project imports.
+from app.models import Order, OrderDetail
+
+
+COLUMNS = ['order_number', 'created_at', 'status', 'customer_document_id', 'customer_name', 'customer_email',
+           'order_total', 'product_id', 'product_sku', 'product_name', 'quantity', 'subtotal']
+
+
+# Leading characters making a spreadsheet read a cell as a formula.
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _text(value: str) -> str:
+    """
+    Neutralises a free text cell starting like a formula by quoting it, so spreadsheets show it as text.
+    """
+    return f"'{value}" if value.startswith(FORMULA_PREFIXES) else value
+
+
+class _Line:
+    """
+    File-like object handing back what the csv writer writes.
+    """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def filter_orders(orders: QuerySet, since: Optional[date] = None, until: Optional[date] = None,
+                  status: Optional[str] = None) -> QuerySet:
+    """
+    Restricts the orders to the days from `since` to `until` (both included, local time) and to a status.
+    """
+    if since:
+        orders = orders.filter(created_at__gte=timezone.make_aware(datetime.combine(since, time.min)))
+    if until:
+        orders = orders.filter(created_at__lt=timezone.make_aware(datetime.combine(until + timedelta(days=1), time.min)))
+    if status:
+        orders = orders.filter(status=status)
+    return orders
+
+
+def export_chunks(orders: QuerySet, chunk_size: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Yields the CSV of the orders and their lines, one encoded chunk of `chunk_size` orders at a time.
+    """
+    chunk_size = chunk_size or getattr(settings, 'ORDER_EXPORT_CHUNK_SIZE', 2000)
+    writer = csv.writer(_Line())
+    yield writer.writerow(COLUMNS).encode()
+
+    orders = (orders.select_related('customer__user')
+                    .only('order_number', 'created_at', 'status', 'total_amount', 'customer__document_id',
+                          'customer__user__first_name', 'customer__user__last_name', 'customer__user__email')
+                    .order_by('created_at', 'id'))
+    last = None
+    while True:
+        page = orders
+        if last is not None:
+            page = orders.filter(Q(created_at__gt=last.created_at) | Q(created_at=last.created_at, id__gt=last.id))
+        chunk = list(page[:chunk_size])
+        if not chunk:
+            return
+        lines = {}
+        for detail in (OrderDetail.objects.filter(order_id__in=[order.id for order in chunk])
+                                          .select_related('product')
+                                          .only('order_id', 'quantity', 'subtotal', 'product__sku', 'product__name')
+                                          .order_by('order_id', 'id')):
+            lines.setdefault(detail.order_id, []).append(detail)
+
+        rows = []
+        for order in chunk:
+            user = order.customer.user
+            prefix = [order.order_number, timezone.localtime(order.created_at).isoformat(), order.status,
+                      _text(order.customer.document_id), _text(f'{user.first_name} {user.last_name}'.strip()),
+                      _text(user.email), order.total_amount]
+            details = lines.get(order.id)
+            if not details:
+                # An order without lines still gets its row, with the line columns left empty.
+                rows.append(writer.writerow([*prefix, '', '', '', '', '']))
+            for detail in details or ():
+                rows.append(writer.writerow([*prefix, detail.product_id, _text(detail.product.sku or ''),
+                                             _text(detail.product.name), detail.quantity, detail.subtotal]))
+        yield ''.join(rows).encode()
+        last = chunk[-1]
+
+
+async def _aexport_chunks(orders: QuerySet, chunk_size: Optional[int] = None) -> AsyncIterator[bytes]:
+    """
+    Async counterpart of export_chunks, every chunk is read in the thread the ORM is used from.
+    """
+    chunks = export_chunks(orders, chunk_size)
+    next_chunk = sync_to_async(next)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
+
+
+def orders_csv_response(request: HttpRequest, orders: QuerySet, filename: str = 'orders.csv') -> StreamingHttpResponse:
+    """
+    Returns a streamed CSV download of the orders, fit for the handler (WSGI or ASGI) serving the request.
+    """
+    chunks = _aexport_chunks(orders) if isinstance(request, ASGIRequest) else export_chunks(orders)
+    response = StreamingHttpResponse(chunks, content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
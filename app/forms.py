@@ -1,12 +1,12 @@
 """
-Implements the forms to Customer and Order models.
+Implements the forms to Customer, Order and Product models.
 """
 
 # Django imports.
 from django import forms
 
 # Project imports.
-from app.models import Customer
+from app.models import Customer, Product
 
 
 class CustomerForm(forms.ModelForm):
@@ -36,3 +36,23 @@ class CustomerForm(forms.ModelForm):
                    'address': forms.Textarea()}
 
 
+
+
+class ProductAdminForm(forms.ModelForm):
+    """
+    Admin form of the products, whose stock is corrected by a relative adjustment once they exist.
+    """
+
+    stock_adjustment = forms.IntegerField(required=False,
+                                          help_text='Units received, or written off when negative. Applied to '
+                                                    'the current stock, so units taken by orders meanwhile are kept.')
+
+    class Meta:
+        model = Product
+        fields = '__all__'
+
+    def clean_stock_adjustment(self):
+        delta = self.cleaned_data['stock_adjustment']
+        if delta and delta < 0 and (self.instance.stock or 0) < -delta:
+            raise forms.ValidationError(f'Only {self.instance.stock or 0} units are in stock.')
+        return delta
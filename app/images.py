@@ -0,0 +1,151 @@
+"""
+Derivative image pipeline for the product pictures.
+
+Every uploaded product image is resized to the widths in
+`PRODUCT_IMAGE_WIDTHS` as WebP and JPEG. Derivatives are named after a hash
+of the original content, so they never change once written and can be
+served with far-future cache headers. Generation is queued as a task in the
+saving transaction and runs in the `run_tasks` workers, never in the admin
+request.
+"""
+
+# Python imports.
+import hashlib
+import io
+from collections import defaultdict
+from functools import partial
+from typing import Iterable
+
+# Django imports.
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+
+# Project imports.
+from app.models import Product
+from app.catalog import bump_catalog_version
+from app.tasks import enqueue, task
+
+
+FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+# Formats able to store the alpha channel of transparent sources.
+ALPHA_FORMATS = {'WEBP'}
+
+
+def get_widths() -> list[int]:
+    """
+    Returns the configured derivative widths in ascending order.
+    """
+    return sorted(getattr(settings, 'PRODUCT_IMAGE_WIDTHS', [160, 320, 640]))
+
+
+def _flatten(image: Image.Image) -> Image.Image:
+    """
+    Composites an RGBA image onto a white background.
+    """
+    background = Image.new('RGB', image.size, 'white')
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def generate_variants(name: str) -> dict:
+    """
+    Writes the derivatives of the stored image `name` and returns their manifest.
+    """
+    with default_storage.open(name, 'rb') as original:
+        content = original.read()
+    digest = hashlib.sha256(content).hexdigest()[:16]
+    quality = getattr(settings, 'PRODUCT_IMAGE_QUALITY', 80)
+
+    with Image.open(io.BytesIO(content)) as source:
+        transparent = source.mode in ('RGBA', 'LA', 'PA') or 'transparency' in source.info
+        source = source.convert('RGBA' if transparent else 'RGB')
+        variants = {'source': name, 'width': source.width}
+        for extension, image_format in FORMATS.items():
+            variants[extension] = {}
+            # WebP keeps the transparency, JPEG has no alpha channel so it is composited onto white.
+            image = _flatten(source) if transparent and image_format not in ALPHA_FORMATS else source
+            for width in get_widths():
+                width = min(width, source.width)
+                path = f'products/derived/{digest}-{width}.{extension}'
+                if not default_storage.exists(path):
+                    resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+                    buffer = io.BytesIO()
+                    resized.save(buffer, image_format, quality=quality, optimize=True)
+                    default_storage.save(path, ContentFile(buffer.getvalue()))
+                variants[extension][str(width)] = path
+    return variants
+
+
+def process_image(name: str, product_ids: list[int]) -> int:
+    """
+    Generates the derivatives of the stored image `name` once and stores the manifest on the products still using it.
+
+    Returns the number of products updated, the caller bumps the catalog version.
+    """
+    variants = generate_variants(name)
+    return Product.objects.filter(pk__in=product_ids, image=name).update(image_variants=variants)
+
+
+@task
+def process_images(images: dict[str, list[int]]) -> None:
+    """
+    Generates the derivatives of a batch of images, given as {image name: product ids}.
+
+    Derivatives already written are skipped, so a retried batch only redoes the missing ones.
+    """
+    updated = 0
+    try:
+        for name, product_ids in images.items():
+            updated += process_image(name, product_ids)
+    finally:
+        # update() skips the save signals, so the catalog version is bumped here, once per batch.
+        if updated:
+            bump_catalog_version()
+
+
+def schedule_product_image(product: Product) -> None:
+    """
+    Queues the derivative generation of a product whose image changed.
+    """
+    schedule_product_images([product])
+
+
+def schedule_product_images(products: Iterable[Product]) -> None:
+    """
+    Queues one task generating the derivatives of the products whose image changed, once per distinct image.
+
+    The task is inserted in the current transaction, so it is only run once the products are committed.
+    """
+    pending = defaultdict(list)
+    for product in products:
+        if product.image and product.image_variants.get('source') != product.image.name:
+            pending[product.image.name].append(product.pk)
+    if not pending:
+        return
+    if getattr(settings, 'PRODUCT_IMAGE_SYNC', False):
+        transaction.on_commit(partial(process_images, dict(pending)))
+    else:
+        enqueue('process_images', {'images': dict(pending)})
+
+
+def variant_srcset(product: Product, extension: str) -> str:
+    """
+    Returns the `srcset` attribute value of a product image in the given format.
+    """
+    variants = product.image_variants.get(extension, {})
+    return ', '.join(f'{default_storage.url(path)} {width}w' for width, path in variants.items())
+
+
+def variant_url(product: Product, width: int, extension: str = 'jpeg') -> str:
+    """
+    Returns the url of the smallest derivative at least `width` wide, the original while none exists.
+    """
+    variants = product.image_variants.get(extension)
+    if not variants:
+        return product.image.url if product.image else ''
+    widths = sorted(int(key) for key in variants)
+    chosen = next((candidate for candidate in widths if candidate >= width), widths[-1])
+    return default_storage.url(variants[str(chosen)])
@@ -0,0 +1,226 @@
+"""
+Per-request instrumentation: query count, database time, template render
+time and total latency, reported as Server-Timing headers and aggregated
+per view in a Prometheus text endpoint.
+"""
+
+# Python imports.
+import bisect
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Optional
+
+# Django imports.
+from django.conf import settings
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpRequest, HttpResponse, Http404
+from django.template.backends.django import Template
+
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    Raised when a view issues more queries than its declared budget.
+    """
+
+
+class RequestStats:
+    """
+    Measurements collected while serving one request.
+    """
+
+    __slots__ = ('queries', 'db_time', 'template_time')
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar('request_stats', default=None)
+
+
+def query_budget(max_queries: int) -> Callable:
+    """
+    Declares the maximum number of queries a view may issue per request.
+    """
+    def decorator(view: Callable) -> Callable:
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def _instrument_template_render() -> None:
+    """
+    Wraps the template backend render once so render time lands in the current request stats.
+    """
+    if getattr(Template.render, 'instrumented', False):
+        return
+    render = Template.render
+
+    @wraps(render)
+    def instrumented_render(self, *args, **kwargs):
+        stats = _current.get()
+        if stats is None:
+            return render(self, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            stats.template_time += time.perf_counter() - start
+
+    instrumented_render.instrumented = True
+    Template.render = instrumented_render
+
+
+class Metrics:
+    """
+    Thread safe per-view aggregates exported in the Prometheus text format.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.views: dict[str, dict] = {}
+
+    def observe(self, view: str, status: int, latency: float, stats: RequestStats) -> None:
+        with self.lock:
+            data = self.views.setdefault(view, {'requests': 0, 'errors': 0, 'latency_sum': 0.0, 'db_sum': 0.0,
+                                                'template_sum': 0.0, 'queries_sum': 0,
+                                                'buckets': [0] * (len(LATENCY_BUCKETS) + 1)})
+            data['requests'] += 1
+            data['errors'] += status >= 500
+            data['latency_sum'] += latency
+            data['db_sum'] += stats.db_time
+            data['template_sum'] += stats.template_time
+            data['queries_sum'] += stats.queries
+            data['buckets'][bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+
+    def reset(self) -> None:
+        with self.lock:
+            self.views.clear()
+
+    def render(self) -> str:
+        lines = ['# TYPE dpshop_request_duration_seconds histogram']
+        with self.lock:
+            views = {view: {**data, 'buckets': list(data['buckets'])} for view, data in self.views.items()}
+
+        for view, data in views.items():
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), data['buckets']):
+                cumulative += count
+                lines.append(f'dpshop_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+            lines.append(f'dpshop_request_duration_seconds_sum{{view="{view}"}} {data["latency_sum"]}')
+            lines.append(f'dpshop_request_duration_seconds_count{{view="{view}"}} {data["requests"]}')
+
+        for name, key, kind in (('dpshop_request_errors_total', 'errors', 'counter'),
+                                ('dpshop_db_queries_total', 'queries_sum', 'counter'),
+                                ('dpshop_db_duration_seconds_total', 'db_sum', 'counter'),
+                                ('dpshop_template_duration_seconds_total', 'template_sum', 'counter')):
+            lines.append(f'# TYPE {name} {kind}')
+            for view, data in views.items():
+                lines.append(f'{name}{{view="{view}"}} {data[key]}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def _count_query(execute, sql, params, many, context):
+    stats = _current.get()
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += time.perf_counter() - start
+
+
+@receiver(connection_created)
+def _instrument_connection(sender, connection, **kwargs) -> None:
+    """
+    Counts the queries of every connection, including the ones used by the async ORM thread.
+    """
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+class InstrumentationMiddleware:
+    """
+    Measures every request, adds a Server-Timing header and logs the views exceeding their query budget.
+
+    The view has already run when its queries are counted, so the budget only raises
+    when QUERY_BUDGET_RAISE is enabled by the test runner, see config.test_runner.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable) -> None:
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.instrument_templates = getattr(settings, 'INSTRUMENT_TEMPLATES', False)
+        if self.instrument_templates:
+            _instrument_template_render()
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, stats, time.perf_counter() - start)
+
+    def _finish(self, request: HttpRequest, response: HttpResponse, stats: RequestStats,
+                latency: float) -> HttpResponse:
+        timings = [f'db;dur={stats.db_time * 1000:.2f};desc="{stats.queries} queries"']
+        if self.instrument_templates:
+            timings.append(f'tpl;dur={stats.template_time * 1000:.2f}')
+        timings.append(f'total;dur={latency * 1000:.2f}')
+        response['Server-Timing'] = ', '.join(timings)
+        match = getattr(request, 'resolver_match', None)
+        metrics.observe(match.view_name if match else 'unresolved', response.status_code, latency, stats)
+
+        budget = getattr(request, 'query_budget', None)
+        if budget is not None and stats.queries > budget:
+            message = f'{request.path} issued {stats.queries} queries, budget is {budget}.'
+            if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request: HttpRequest, view_func: Callable, view_args, view_kwargs) -> None:
+        request.query_budget = getattr(view_func, 'query_budget', None)
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """
+    View function exposing the metrics in the Prometheus text format to local scrapers only.
+    """
+    if request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1')):
+        raise Http404()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,94 @@
+"""
+Product stock reservation.
+
+Stock is taken when an order is placed and given back when the order is
+canceled or rejected. A reservation locks the product rows in primary key
+order and decrements them all with a single UPDATE, so concurrent checkouts
+of the same product never oversell nor deadlock. Products whose stock is
+NULL are not tracked and can always be ordered.
+
+Stock is only ever changed by relative updates, manual corrections go
+through `adjust_stock` so they never overwrite units taken meanwhile.
+"""
+
+# Python imports.
+from typing import Iterable
+
+# Django imports.
+from django.db.models import Case, F, IntegerField, QuerySet, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+# Project imports.
+from app.models import OrderDetail, Product
+
+
+# Orders in these statuses do not hold stock.
+RELEASED_STATUSES = ('Canceled', 'Rejected')
+
+
+class OutOfStockError(Exception):
+    """
+    Raised when an order asks for more units than a product has in stock.
+    """
+
+    def __init__(self, products: Iterable[Product]) -> None:
+        self.products = list(products)
+        super().__init__('Not enough stock of ' + ', '.join(product.name for product in self.products) + '.')
+
+
+def _delta(quantities: dict[int, int]) -> Case:
+    return Case(*[When(pk=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+                default=Value(0), output_field=IntegerField())
+
+
+def reserve(quantities: dict[int, int]) -> None:
+    """
+    Takes {product_id: quantity} units from the tracked products, all or nothing.
+
+    Must run inside the order transaction, which keeps the product rows
+    locked until the order is committed.
+    """
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+    if not quantities:
+        return
+    tracked = Product.objects.filter(pk__in=quantities, stock__isnull=False)
+    # Locking in primary key order means concurrent orders of several products cannot deadlock.
+    stock = dict(tracked.select_for_update().order_by('pk').values_list('pk', 'stock'))
+    if short := [product_id for product_id, available in stock.items() if available < quantities[product_id]]:
+        raise OutOfStockError(Product.objects.filter(pk__in=short).order_by('pk'))
+    if stock:
+        delta = _delta(quantities)
+        tracked.update(stock=F('stock') - delta)
+
+
+def release(quantities: dict[int, int]) -> None:
+    """
+    Gives {product_id: quantity} units back to the tracked products.
+    """
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+    if quantities:
+        delta = _delta(quantities)
+        Product.objects.filter(pk__in=quantities, stock__isnull=False).update(stock=F('stock') + delta)
+
+
+def adjust_stock(product_id: int, delta: int) -> bool:
+    """
+    Adds `delta` units to the stock of a product (takes them when negative), tracking it from 0 if it was not.
+
+    Returns False, changing nothing, when the product has fewer than -`delta` units.
+    """
+    products = Product.objects.filter(pk=product_id)
+    if delta < 0:
+        products = products.filter(stock__gte=-delta)
+    return bool(products.update(stock=Coalesce(F('stock'), 0) + delta))
+
+
+def order_quantities(orders: QuerySet) -> dict[int, int]:
+    """
+    Returns the {product_id: quantity} units ordered by a queryset of orders.
+    """
+    return dict(OrderDetail.objects.filter(order__in=orders)
+                                   .values('product_id')
+                                   .annotate(quantity=Sum('quantity'))
+                                   .order_by()
+                                   .values_list('product_id', 'quantity'))
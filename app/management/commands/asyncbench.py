@@ -0,0 +1,28 @@
+"""
+Management command comparing the throughput of the sync and async views.
+"""
+
+# Django imports.
+from django.core.management.base import BaseCommand, CommandError
+
+# Project imports.
+from app.benchmarks import compare_sync_async
+from app.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = 'Compares requests per second of the sync (WSGI) and async (ASGI) catalog views.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--concurrency', type=int, default=10, help='Concurrent clients.')
+        parser.add_argument('--requests', type=int, default=200, help='Total requests per mode.')
+
+    def handle(self, *args, **options) -> None:
+        product = Product.objects.first()
+        category = Category.objects.first()
+        if not product or not category:
+            raise CommandError('The database has no products, seed it first.')
+        paths = ['/', '/?format=json', f'/products/category/{category.id}', f'/products/{product.id}', '/cart/']
+        results = compare_sync_async(paths, options['concurrency'], options['requests'])
+        self.stdout.write(f"sync:  {results['sync_rps']:.1f} req/s")
+        self.stdout.write(f"async: {results['async_rps']:.1f} req/s")
@@ -0,0 +1,44 @@
+"""
+Management command exporting the catalog to a CSV or JSON lines file.
+"""
+
+# Python imports.
+import sys
+
+# Django imports.
+from django.core.management.base import BaseCommand, CommandError
+
+# Project imports.
+from app.catalog_io import EXPORT_CHUNK_SIZE, FORMATS, TransferStats, export_catalog, get_format
+
+
+class Command(BaseCommand):
+    help = 'Streams every product to a CSV or JSON lines file that import_catalog reads back.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('path', help='Output file, - writes to standard output.')
+        parser.add_argument('--format', choices=FORMATS, help='File format, guessed from the extension by default.')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help='Products read per query.')
+
+    def handle(self, *args, **options) -> None:
+        try:
+            format = get_format(options['path'], options['format'])
+        except ValueError as error:
+            raise CommandError(error)
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive.')
+        progress = self.report if options['verbosity'] > 1 else None
+
+        if options['path'] == '-':
+            export_catalog(sys.stdout, format, options['chunk_size'])
+            return
+        try:
+            with open(options['path'], 'w', newline='', encoding='utf-8') as file:
+                stats = export_catalog(file, format, options['chunk_size'], progress)
+        except OSError as error:
+            raise CommandError(error)
+        self.stdout.write(self.style.SUCCESS(f'Exported {stats.rows} products in {stats.seconds:.1f}s '
+                                             f'({stats.rows_per_second:.0f} rows/s).'))
+
+    def report(self, stats: TransferStats) -> None:
+        self.stdout.write(f'{stats.rows} products, {stats.rows_per_second:.0f} rows/s')
@@ -0,0 +1,30 @@
+"""
+Management command generating the missing product image derivatives.
+"""
+
+# Python imports.
+from collections import defaultdict
+
+# Django imports.
+from django.core.management.base import BaseCommand
+
+# Project imports.
+from app.models import Product
+from app.images import process_images
+
+
+class Command(BaseCommand):
+    help = 'Generates the resized WebP/JPEG derivatives of the product images.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--all', action='store_true', help='Regenerate the derivatives of every product.')
+
+    def handle(self, *args, **options) -> None:
+        products = Product.objects.exclude(image='').only('id', 'image', 'image_variants')
+        pending = defaultdict(list)
+        for product in products.iterator(chunk_size=500):
+            if options['all'] or product.image_variants.get('source') != product.image.name:
+                pending[product.image.name].append(product.id)
+        process_images(pending)
+        count = sum(len(product_ids) for product_ids in pending.values())
+        self.stdout.write(self.style.SUCCESS(f'Processed {count} product images.'))
@@ -0,0 +1,51 @@
+"""
+Management command importing a CSV or JSON lines catalog file.
+"""
+
+# Python imports.
+import sys
+
+# Django imports.
+from django.core.management.base import BaseCommand, CommandError
+
+# Project imports.
+from app.catalog_io import BATCH_SIZE, FIELDS, FORMATS, CatalogImporter, TransferStats, get_format
+
+
+class Command(BaseCommand):
+    help = f'Upserts products by SKU from a CSV or JSON lines file with the columns {", ".join(FIELDS)}.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('path', help='Catalog file, - reads standard input.')
+        parser.add_argument('--format', choices=FORMATS, help='File format, guessed from the extension by default.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows upserted per transaction.')
+        parser.add_argument('--images', help='Directory the image column is relative to, images are copied to the media storage.')
+
+    def handle(self, *args, **options) -> None:
+        try:
+            format = get_format(options['path'], options['format'])
+        except ValueError as error:
+            raise CommandError(error)
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+        importer = CatalogImporter(batch_size=options['batch_size'], images_dir=options['images'],
+                                   progress=self.report if options['verbosity'] > 1 else None)
+
+        if options['path'] == '-':
+            stats = importer.run(sys.stdin, format)
+        else:
+            try:
+                with open(options['path'], newline='', encoding='utf-8') as file:
+                    stats = importer.run(file, format)
+            except OSError as error:
+                raise CommandError(error)
+
+        for error in stats.errors:
+            self.stderr.write(error)
+        if stats.skipped > len(stats.errors):
+            self.stderr.write(f'{stats.skipped - len(stats.errors)} more invalid rows.')
+        self.stdout.write(self.style.SUCCESS(f'Imported {stats.rows} products in {stats.seconds:.1f}s '
+                                             f'({stats.rows_per_second:.0f} rows/s), skipped {stats.skipped} rows.'))
+
+    def report(self, stats: TransferStats) -> None:
+        self.stdout.write(f'{stats.rows} products, {stats.rows_per_second:.0f} rows/s')
@@ -0,0 +1,41 @@
+"""
+Management command running the in-process storefront load test.
+"""
+
+# Python imports.
+import json
+
+# Django imports.
+from django.core.management.base import BaseCommand, CommandError
+
+# Project imports.
+from app.benchmarks import LoadDriver
+
+
+class Command(BaseCommand):
+    help = 'Replays the storefront and checkout flow and reports per-endpoint latency, queries and allocations.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--users', type=int, default=1, help='Concurrent virtual users.')
+        parser.add_argument('--iterations', type=int, default=10, help='Flow iterations per user.')
+        parser.add_argument('--host', default='localhost', help='Host header sent with the requests.')
+        parser.add_argument('--allocations', action='store_true', help='Trace memory allocations (slower, only meaningful with one user).')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON.')
+
+    def handle(self, *args, **options) -> None:
+        try:
+            driver = LoadDriver(host=options['host'], trace_allocations=options['allocations'])
+        except ValueError as error:
+            raise CommandError(error)
+        report = driver.run(users=options['users'], iterations=options['iterations'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(f"{'endpoint':<22}{'reqs':>6}{'errs':>6}{'p50 ms':>9}{'p95 ms':>9}"
+                          f"{'p99 ms':>9}{'queries':>9}{'peak KiB':>10}")
+        for endpoint, stats in report.items():
+            peak = f"{stats['peak_kib']:.1f}" if stats['peak_kib'] is not None else '-'
+            self.stdout.write(f"{endpoint:<22}{stats['requests']:>6}{stats['errors']:>6}{stats['p50_ms']:>9.2f}"
+                              f"{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}{stats['queries']:>9.1f}{peak:>10}")
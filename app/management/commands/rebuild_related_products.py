@@ -0,0 +1,17 @@
+"""
+Management command recomputing the related products from the order history.
+"""
+
+# Django imports.
+from django.core.management.base import BaseCommand
+
+# Project imports.
+from app.recommendations import rebuild_related_products
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the related products of every product from the co-purchases of the orders.'
+
+    def handle(self, *args, **options) -> None:
+        count = rebuild_related_products()
+        self.stdout.write(self.style.SUCCESS(f'Wrote {count} related products.'))
@@ -0,0 +1,24 @@
+"""
+Management command recomputing the daily sales rollups from the orders.
+"""
+
+# Python imports.
+from datetime import date
+
+# Django imports.
+from django.core.management.base import BaseCommand
+
+# Project imports.
+from app.analytics import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the daily sales rollups from the orders, all days unless a range is given.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--since', type=date.fromisoformat, help='First day to rebuild (YYYY-MM-DD).')
+        parser.add_argument('--until', type=date.fromisoformat, help='Last day to rebuild (YYYY-MM-DD).')
+
+    def handle(self, *args, **options) -> None:
+        count = rebuild_rollups(options['since'], options['until'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {count} daily sales rows.'))
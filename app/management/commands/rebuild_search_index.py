@@ -0,0 +1,17 @@
+"""
+Management command rebuilding the product full-text search index.
+"""
+
+# Django imports.
+from django.core.management.base import BaseCommand
+
+# Project imports.
+from app.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the product full-text search index.'
+
+    def handle(self, *args, **options) -> None:
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} products.'))
@@ -0,0 +1,20 @@
+"""
+Management command applying the stored PayPal IPNs to their orders.
+"""
+
+# Django imports.
+from django.core.management.base import BaseCommand
+
+# Project imports.
+from app.payments import reconcile_payments
+
+
+class Command(BaseCommand):
+    help = 'Applies the stored PayPal IPNs not reconciled yet to their orders, in batches.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--batch-size', type=int, help='IPNs applied per transaction.')
+
+    def handle(self, *args, **options) -> None:
+        count = reconcile_payments(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Reconciled {count} IPNs.'))
@@ -0,0 +1,44 @@
+"""
+Management command running the background task workers.
+"""
+
+# Python imports.
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Django imports.
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+# Project imports.
+from app.tasks import claim_tasks, run_task
+
+
+def _run_in_worker(queued) -> bool:
+    close_old_connections()
+    try:
+        return run_task(queued)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Drains the background task queue.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--workers', type=int, default=4, help='Worker threads.')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Exit once no task is due.')
+
+    def handle(self, *args, **options) -> None:
+        workers = options['workers']
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tasks') as executor:
+            while True:
+                tasks = claim_tasks(limit=workers * 2)
+                if tasks:
+                    results = list(executor.map(_run_in_worker, tasks))
+                    self.stdout.write(f'Ran {len(results)} tasks, {results.count(False)} failed.')
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['sleep'])
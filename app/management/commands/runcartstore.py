@@ -0,0 +1,26 @@
+"""
+Management command serving the local Redis stand-in of app.resp_server.
+"""
+
+# Django imports.
+from django.core.management.base import BaseCommand
+
+# Project imports.
+from app.resp_server import RespServer
+
+
+class Command(BaseCommand):
+    help = 'Serves a local Redis-protocol store for CART_STORAGE=app.cart_storage.RedisCartStorage.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on.')
+        parser.add_argument('--port', type=int, default=6379, help='Port to listen on.')
+        parser.add_argument('--password', help='Password clients must AUTH with.')
+
+    def handle(self, *args, **options) -> None:
+        with RespServer((options['host'], options['port']), options['password']) as server:
+            self.stdout.write(f"Serving carts on {options['host']}:{server.server_address[1]}.")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
@@ -0,0 +1,25 @@
+"""
+Management command seeding a synthetic dataset for benchmarks and load tests.
+"""
+
+# Django imports.
+from django.core.management.base import BaseCommand
+
+# Project imports.
+from app.benchmarks import seed
+
+
+class Command(BaseCommand):
+    help = 'Seeds synthetic categories, products, customers and orders.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--customers', type=int, default=50)
+        parser.add_argument('--orders', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options) -> None:
+        seed(categories=options['categories'], products=options['products'],
+             customers=options['customers'], orders=options['orders'], seed_value=options['seed'])
+        self.stdout.write(self.style.SUCCESS('Dataset seeded.'))
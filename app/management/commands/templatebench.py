@@ -0,0 +1,36 @@
+"""
+Management command timing the storefront templates with every template engine.
+"""
+
+# Python imports.
+import json
+
+# Django imports.
+from django.core.management.base import BaseCommand, CommandError
+
+# Project imports.
+from app.benchmarks import benchmark_templates
+
+
+class Command(BaseCommand):
+    help = 'Renders the storefront templates with each configured engine and reports the render times.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--iterations', type=int, default=200, help='Renders per template and engine.')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON.')
+
+    def handle(self, *args, **options) -> None:
+        try:
+            report = benchmark_templates(options['iterations'])
+        except ValueError as error:
+            raise CommandError(error)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(f"{'engine':<8}{'template':<34}{'first ms':>10}{'mean ms':>10}{'p95 ms':>10}")
+        for engine, templates in report.items():
+            for name, stats in templates.items():
+                self.stdout.write(f"{engine:<8}{name:<34}{stats['first_ms']:>10.3f}"
+                                  f"{stats['mean_ms']:>10.3f}{stats['p95_ms']:>10.3f}")
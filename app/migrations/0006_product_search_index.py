@@ -0,0 +1,30 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS app_product_fts USING fts5("
+                              "name, description, tokenize = 'unicode61 remove_diacritics 2')")
+        schema_editor.execute('INSERT INTO app_product_fts(rowid, name, description) '
+                              'SELECT id, name, description FROM app_product')
+    elif schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("CREATE INDEX IF NOT EXISTS app_product_search_gin ON app_product USING GIN "
+                              "(to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(description, '')))")
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS app_product_fts')
+    elif schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS app_product_search_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_alter_customer_gender'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
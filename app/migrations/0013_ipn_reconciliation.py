@@ -0,0 +1,29 @@
+# Generated by Django 4.2 on 2026-10-17 17:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ipn', '0008_auto_20181128_1032'),
+        ('app', '0012_order_sequence_and_checkout_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IpnReconciliation',
+            fields=[
+                ('ipn', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='reconciliation', serialize=False, to='ipn.paypalipn')),
+                ('status', models.CharField(blank=True, choices=[('Pending', 'Pending'), ('Delivered', 'Delivered'), ('Canceled', 'Canceled'), ('Rejected', 'Rejected')], max_length=10)),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reconciliations', to='app.order')),
+            ],
+            options={
+                'verbose_name': 'IPN Reconciliation',
+                'verbose_name_plural': 'IPN Reconciliations',
+            },
+        ),
+    ]
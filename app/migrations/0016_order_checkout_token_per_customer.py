@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-17 17:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_related_product'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='checkout_token',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(fields=('customer', 'checkout_token'), name='order_customer_checkout_token_uniq'),
+        ),
+    ]
@@ -5,6 +5,8 @@ Definition of models to the application.
 # Django imports.
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+from paypal.standard.ipn.models import PayPalIPN
 
 
 class Category(models.Model):
@@ -26,11 +28,21 @@ class Product(models.Model):
     class Meta:
         verbose_name = 'Product'
         verbose_name_plural = 'Products'
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='product_created_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='product_category_created_idx'),
+        ]
 
+    # Stock keeping unit, the key matching catalog imports to existing products, see app.catalog_io.
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     name = models.CharField(max_length=255)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     image = models.ImageField(upload_to='products/', blank=True)
+    # Resized derivatives of `image` by format and width, filled by app.images.
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    # Units available to order, NULL when the stock of the product is not tracked, see app.inventory.
+    stock = models.PositiveIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
@@ -39,6 +51,27 @@ class Product(models.Model):
         return self.name
     
 
+class RelatedProduct(models.Model):
+
+    class Meta:
+        verbose_name = 'Related Product'
+        verbose_name_plural = 'Related Products'
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='related_product_rank_uniq'),
+        ]
+
+    # Products most often bought together with `product`, ranked from 0, see app.recommendations.
+    # The (product, rank) constraint indexes the lookups, the foreign key needs no index of its own.
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_products', db_index=False)
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommended_with')
+    # Orders containing both products.
+    score = models.PositiveIntegerField()
+    rank = models.PositiveSmallIntegerField()
+
+    def __str__(self) -> str:
+        return f'{self.product_id} - {self.related_id}'
+
+
 class Customer(models.Model):
 
     class Meta:
@@ -66,6 +99,14 @@ class Order(models.Model):
     class Meta:
         verbose_name = 'Order'
         verbose_name_plural = 'Orders'
+        indexes = [
+            models.Index(fields=['customer', '-created_at'], name='order_customer_created_idx'),
+            models.Index(fields=['status', '-created_at'], name='order_status_created_idx'),
+            models.Index(fields=['-created_at'], name='order_created_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['customer', 'checkout_token'], name='order_customer_checkout_token_uniq'),
+        ]
     
     STATUS_CHOICES = (
         ('Pending', 'Pending'),
@@ -75,6 +116,8 @@ class Order(models.Model):
     )
          
     order_number = models.CharField(max_length=20, unique=True)
+    # Token of the checkout form that placed the order, a resubmitted form returns the same order of the customer.
+    checkout_token = models.CharField(max_length=32, null=True, blank=True, editable=False)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Pending')
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -84,6 +127,20 @@ class Order(models.Model):
         return self.order_number
     
 
+class OrderSequence(models.Model):
+
+    class Meta:
+        verbose_name = 'Order Sequence'
+        verbose_name_plural = 'Order Sequences'
+
+    # Last order number handed out for the day, in blocks, by app.orders.OrderNumberAllocator.
+    date = models.DateField(unique=True)
+    last = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.date} - {self.last}'
+
+
 class OrderDetail(models.Model):
     
     class Meta:
@@ -97,3 +154,77 @@ class OrderDetail(models.Model):
 
     def __str__(self):
         return self.product.name
+    
+
+class Task(models.Model):
+
+    class Meta:
+        verbose_name = 'Task'
+        verbose_name_plural = 'Tasks'
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='task_status_run_at_idx'),
+        ]
+
+    STATUS_CHOICES = (
+        ('Pending', 'Pending'),
+        ('Running', 'Running'),
+        ('Done', 'Done'),
+        ('Failed', 'Failed'),
+    )
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    idempotency_key = models.CharField(max_length=100, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.name} #{self.pk}'
+
+
+class DailySales(models.Model):
+
+    class Meta:
+        verbose_name = 'Daily Sales'
+        verbose_name_plural = 'Daily Sales'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product', 'status'], name='daily_sales_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['date', 'category'], name='daily_sales_date_category_idx'),
+        ]
+
+    # Rollup of the order details per day, product and order status, kept by app.analytics.
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='daily_sales')
+    status = models.CharField(max_length=10, choices=Order.STATUS_CHOICES)
+    orders = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f'{self.date} - {self.product_id} - {self.status}'
+
+
+class IpnReconciliation(models.Model):
+
+    class Meta:
+        verbose_name = 'IPN Reconciliation'
+        verbose_name_plural = 'IPN Reconciliations'
+
+    # Outcome of a stored PayPal IPN once applied to its order by app.payments.
+    ipn = models.OneToOneField(PayPalIPN, on_delete=models.CASCADE, primary_key=True, related_name='reconciliation')
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='reconciliations')
+    status = models.CharField(max_length=10, choices=Order.STATUS_CHOICES, blank=True)
+    note = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'IPN {self.ipn_id} - {self.status or self.note}'
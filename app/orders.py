@@ -0,0 +1,175 @@
+"""
+Order placement service.
+"""
+
+# Python imports.
+import threading
+from datetime import date
+from decimal import Decimal
+from functools import partial
+from typing import Optional
+
+# Django imports.
+from django.conf import settings
+from django.db import connection, transaction, IntegrityError
+from django.db.models import F, QuerySet
+from django.utils import timezone
+
+# Project imports.
+from app.models import Customer, Order, OrderDetail, OrderSequence, Product
+from app.tasks import order_placed
+from app.analytics import record_order, record_bulk_status_change
+from app.inventory import RELEASED_STATUSES, OutOfStockError, reserve, release, order_quantities
+
+
+class EmptyOrderError(Exception):
+    """
+    Raised when an order is placed without any purchasable line.
+    """
+
+
+class OrderNumberAllocator:
+    """
+    Hands out order numbers like PED-20241201-0000042 from a per-day sequence.
+
+    Each process reserves a block of ORDER_NUMBER_BLOCK_SIZE numbers with one
+    short transaction and serves the following orders from memory, so orders
+    are inserted once with their final number and workers barely contend on
+    the sequence row. Numbers of a block left unused when a worker stops are
+    skipped.
+
+    A block reserved inside a caller's transaction commits or rolls back with
+    it, so the rest of such a block is only served once that transaction has
+    committed. A rolled back reservation is reserved again by another worker
+    and its numbers were never used.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._date: Optional[date] = None
+        self._next = 0
+        self._end = 0
+
+    def _reserve_block(self, day: date) -> tuple[int, int]:
+        """
+        Reserves the next block of numbers of the day and returns its first and last numbers.
+        """
+        size = getattr(settings, 'ORDER_NUMBER_BLOCK_SIZE', 20)
+        sequence = OrderSequence.objects.filter(date=day)
+        with transaction.atomic():
+            if not sequence.update(last=F('last') + size):
+                # First block of the day, another worker may be creating the row too.
+                OrderSequence.objects.bulk_create([OrderSequence(date=day)], ignore_conflicts=True)
+                sequence.update(last=F('last') + size)
+            end = sequence.values_list('last', flat=True).get()
+        return end - size + 1, end
+
+    def _serve_block(self, day: date, start: int, end: int) -> None:
+        with self._lock:
+            self._date, self._next, self._end = day, start, end
+
+    def next(self) -> str:
+        """
+        Returns the next order number of the current day.
+        """
+        today = timezone.localdate()
+        with self._lock:
+            if self._date == today and self._next <= self._end:
+                number = self._next
+                self._next += 1
+            else:
+                number, end = self._reserve_block(today)
+                if connection.in_atomic_block:
+                    transaction.on_commit(partial(self._serve_block, today, number + 1, end))
+                else:
+                    self._date, self._next, self._end = today, number + 1, end
+        return f"PED-{today.strftime('%Y%m%d')}-{number:07d}"
+
+
+order_numbers = OrderNumberAllocator()
+
+
+def generate_order_number() -> str:
+    """
+    Allocates the number of a new order.
+    """
+    return order_numbers.next()
+
+
+def _placed_order(customer: Customer, checkout_token: str) -> Optional[Order]:
+    return Order.objects.filter(customer=customer, checkout_token=checkout_token).first()
+
+
+def _create_order(customer: Customer, quantities: dict[int, int], checkout_token: Optional[str]) -> Order:
+    order_number = generate_order_number()
+    with transaction.atomic():
+        products = Product.objects.in_bulk(list(quantities))
+        lines = [(products[product_id], quantity)
+                 for product_id, quantity in quantities.items()
+                 if product_id in products and quantity > 0]
+        if not lines:
+            raise EmptyOrderError('The order has no products.')
+        reserve({product.id: quantity for product, quantity in lines if product.stock is not None})
+
+        details = [OrderDetail(product=product, quantity=quantity, subtotal=product.price * quantity)
+                   for product, quantity in lines]
+        order = Order(customer=customer, order_number=order_number, checkout_token=checkout_token,
+                      total_amount=sum((detail.subtotal for detail in details), Decimal('0')))
+        order.save(force_insert=True)
+
+        for detail in details:
+            detail.order = order
+        OrderDetail.objects.bulk_create(details)
+        record_order(order, details)
+        order_placed(order)
+
+    return order
+
+
+def place_order(customer: Customer, quantities: dict[int, int], checkout_token: Optional[str] = None) -> Order:
+    """
+    Creates an order and its details for the given {product_id: quantity} mapping.
+
+    Products are fetched in one query and priced server-side, their stock is
+    reserved, the details are inserted in one batch and everything runs in a
+    single transaction, so no partial order is left behind if anything fails.
+    Raises OutOfStockError when a product lacks the requested units.
+
+    An order already placed with the same `checkout_token` by the customer is
+    returned instead of creating a new one, so resubmitted checkouts are safe.
+    Tokens are unique per customer, a concurrent resubmission losing the race
+    on the constraint returns the order of the winner.
+    """
+    if checkout_token and (order := _placed_order(customer, checkout_token)):
+        return order
+    try:
+        return _create_order(customer, quantities, checkout_token)
+    except (IntegrityError, OutOfStockError):
+        # A concurrent submission of the same checkout placed its order first.
+        if checkout_token and (order := _placed_order(customer, checkout_token)):
+            return order
+        raise
+
+
+def change_orders_status(orders: QuerySet, status: str) -> int:
+    """
+    Sets the status of every order of a queryset with a single UPDATE and returns the number of changed orders.
+
+    The daily sales rollups are moved and the stock of orders being canceled
+    or rejected is released, or reserved again for orders coming back from
+    those statuses, in the same transaction.
+    """
+    with transaction.atomic():
+        previous = dict(Order.objects.select_for_update()
+                                     .filter(pk__in=orders.values('pk'))
+                                     .exclude(status=status)
+                                     .values_list('pk', 'status'))
+        changed = Order.objects.filter(pk__in=list(previous))
+        moving = [pk for pk, previous_status in previous.items()
+                  if (previous_status in RELEASED_STATUSES) != (status in RELEASED_STATUSES)]
+        if moving and status in RELEASED_STATUSES:
+            release(order_quantities(Order.objects.filter(pk__in=moving)))
+        elif moving:
+            reserve(order_quantities(Order.objects.filter(pk__in=moving)))
+        record_bulk_status_change(changed, status)
+        return changed.update(status=status)
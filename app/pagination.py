@@ -0,0 +1,242 @@
+"""
+Keyset (cursor) pagination for the product catalog, and an estimated count
+paginator for the admin changelists of the big tables.
+"""
+
+# Python imports.
+import base64
+import binascii
+from datetime import datetime
+from math import isfinite
+from typing import Any, Callable, Iterable, Optional, Union
+
+# Django imports.
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.http import HttpRequest
+from django.utils.functional import cached_property
+
+
+MAX_ID = 2 ** 63 - 1
+
+
+class InvalidCursor(BadRequest):
+    """
+    Raised for a malformed or tampered cursor, answered with a 400 response.
+    """
+
+
+def encode_cursor(value: Union[datetime, float], pk: int) -> str:
+    """
+    Encodes a (key value, id) position as an opaque url-safe cursor.
+    """
+    value = value.isoformat() if isinstance(value, datetime) else repr(value)
+    raw = f'{value}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, parse: Callable[[str], Any] = datetime.fromisoformat) -> Optional[tuple[Any, int]]:
+    """
+    Decodes a cursor into its (key value, id) position, None if it is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        value, pk = raw.rsplit('|', 1)
+        value, pk = parse(value), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    # Ids are positive 64-bit integers, larger ones overflow the database parameters.
+    return (value, pk) if 0 < pk <= MAX_ID else None
+
+
+def get_page_size(value: Optional[str]) -> int:
+    """
+    Returns the requested page size clamped to the configured maximum.
+    """
+    default = getattr(settings, 'CATALOG_PAGE_SIZE', 24)
+    maximum = getattr(settings, 'CATALOG_MAX_PAGE_SIZE', 100)
+    try:
+        page_size = int(value) if value else default
+    except ValueError:
+        page_size = default
+    return max(1, min(page_size, maximum))
+
+
+class CursorPage:
+    """
+    A page of objects ordered by (created_at, id) descending, newest first.
+
+    The page is fetched lazily on first access, so a page whose rendering is
+    served from a template fragment cache never hits the database.
+    """
+
+    # Field the objects are ordered by, then by id, and how cursors parse its values.
+    key = 'created_at'
+    descending = True
+    parse_key = staticmethod(datetime.fromisoformat)
+
+    def __init__(self, queryset: QuerySet, after: Optional[str] = None,
+                 before: Optional[str] = None, page_size: int = 24) -> None:
+        """
+        Prepares the page following the `after` cursor or preceding the `before` cursor.
+
+        The cursors are decoded right away, so a malformed one raises InvalidCursor from the view.
+        """
+        self.queryset = queryset
+        self.after = after
+        self.before = before
+        self.page_size = page_size
+        self.positions = {name: self._decode(cursor) for name, cursor in (('after', after), ('before', before))
+                          if cursor}
+
+    def _decode(self, cursor: str) -> tuple[Any, int]:
+        if (position := decode_cursor(cursor, self.parse_key)) is None:
+            raise InvalidCursor('Invalid pagination cursor.')
+        return position
+
+    def _ordering(self, backwards: bool) -> tuple[str, str]:
+        prefix = '-' if self.descending != backwards else ''
+        return prefix + self.key, prefix + 'id'
+
+    def _seek(self, position: tuple[Any, int], backwards: bool) -> QuerySet:
+        """
+        Returns the queryset of the objects after a position, or before it when running backwards.
+        """
+        value, pk = position
+        lookup = 'lt' if self.descending != backwards else 'gt'
+        return (self.queryset.filter(Q(**{f'{self.key}__{lookup}': value}) | Q(**{self.key: value, f'id__{lookup}': pk}))
+                             .order_by(*self._ordering(backwards)))
+
+    def _query(self) -> tuple[QuerySet, bool, bool]:
+        """
+        Returns the limited queryset fetching the page, whether it runs backwards and whether a cursor applied.
+        """
+        page_size = self.page_size
+        if position := self.positions.get('before'):
+            return self._seek(position, True)[:page_size + 1], True, True
+        if position := self.positions.get('after'):
+            return self._seek(position, False)[:page_size + 1], False, True
+        return self.queryset.order_by(*self._ordering(False))[:page_size + 1], False, False
+
+    def _build(self, rows: list, backwards: bool, cursor_applied: bool) -> tuple[list, bool, bool]:
+        """
+        Turns the fetched rows into the page rows and its has_next and has_previous flags.
+        """
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if backwards:
+            return rows[::-1], True, has_more
+        return rows, has_more, cursor_applied
+
+    @cached_property
+    def _page(self) -> tuple[list, bool, bool]:
+        queryset, backwards, cursor_applied = self._query()
+        return self._build(list(queryset), backwards, cursor_applied)
+
+    async def aload(self) -> 'CursorPage':
+        """
+        Fetches the page with the async ORM, for use from async views.
+        """
+        if '_page' not in self.__dict__:
+            queryset, backwards, cursor_applied = self._query()
+            self.__dict__['_page'] = self._build([row async for row in queryset], backwards, cursor_applied)
+        return self
+
+    @property
+    def object_list(self) -> list:
+        return self._page[0]
+
+    @property
+    def has_next(self) -> bool:
+        return self._page[1]
+
+    @property
+    def has_previous(self) -> bool:
+        return self._page[2]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+    @property
+    def next_cursor(self) -> Optional[str]:
+        """
+        Cursor pointing after the last object of the page.
+        """
+        if self.has_next and self.object_list:
+            last = self.object_list[-1]
+            return encode_cursor(getattr(last, self.key), last.id)
+        return None
+
+    @property
+    def previous_cursor(self) -> Optional[str]:
+        """
+        Cursor pointing before the first object of the page.
+        """
+        if self.has_previous and self.object_list:
+            first = self.object_list[0]
+            return encode_cursor(getattr(first, self.key), first.id)
+        return None
+
+    def url(self, request: HttpRequest, direction: str, keep: Optional[Iterable[str]] = None) -> Optional[str]:
+        """
+        Returns the current url pointing to the `next` or `previous` page, None if there is none.
+
+        `keep` restricts the query parameters carried over, all of them by default.
+        """
+        param, cursor = ('after', self.next_cursor) if direction == 'next' else ('before', self.previous_cursor)
+        if not cursor:
+            return None
+        query = request.GET.copy()
+        for name in list(query):
+            if name in ('after', 'before', 'format') or (keep is not None and name not in keep):
+                query.pop(name)
+        query[param] = cursor
+        return '?' + query.urlencode()
+
+
+def _parse_rank(value: str) -> float:
+    rank = float(value)
+    if not isfinite(rank):
+        raise ValueError(value)
+    return rank
+
+
+class RankedPage(CursorPage):
+    """
+    A page of search results ordered by their `search_rank` annotation (see app.search), best first.
+    """
+
+    key = 'search_rank'
+    descending = False
+    parse_key = staticmethod(_parse_rank)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator counting unfiltered PostgreSQL tables from the planner statistics.
+
+    `COUNT(*)` scans the whole table on PostgreSQL, so above
+    ADMIN_ESTIMATED_COUNT_THRESHOLD rows the admin shows the `reltuples`
+    estimate instead. Filtered querysets and other backends count exactly.
+    """
+
+    @cached_property
+    def count(self) -> int:
+        queryset = self.object_list
+        if isinstance(queryset, QuerySet) and not queryset.query.where:
+            connection = connections[queryset.db]
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                                   [connection.ops.quote_name(queryset.model._meta.db_table)])
+                    row = cursor.fetchone()
+                estimate = int(row[0]) if row else -1
+                if estimate >= getattr(settings, 'ADMIN_ESTIMATED_COUNT_THRESHOLD', 100000):
+                    return estimate
+        return super().count
@@ -0,0 +1,147 @@
+"""
+PayPal IPN reconciliation.
+
+The IPN endpoint only stores the notification and queues one coalesced
+`reconcile_payments` task per time window, so a burst of payment
+confirmations never locks orders from the request path. The task and the
+`reconcile_payments` management command apply the stored IPNs in batches:
+orders are matched by their indexed order number and every status change
+is a single bulk UPDATE per batch. Each processed IPN is recorded in
+IpnReconciliation with its outcome.
+"""
+
+# Python imports.
+import time
+from typing import Optional
+
+# Django imports.
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import receiver
+from paypal.standard.ipn.models import PayPalIPN
+from paypal.standard.ipn.signals import valid_ipn_received, invalid_ipn_received
+
+# Project imports.
+from app.models import IpnReconciliation, Order
+from app.inventory import OutOfStockError
+from app.orders import change_orders_status
+from app.tasks import enqueue, order_paid, task
+
+
+# Order status set by each PayPal payment status, other statuses leave the order as it is.
+PAYMENT_STATUSES = {
+    'Completed': 'Delivered',
+    'Denied': 'Rejected',
+    'Expired': 'Rejected',
+    'Failed': 'Rejected',
+    'Voided': 'Rejected',
+    'Refunded': 'Canceled',
+    'Reversed': 'Canceled',
+}
+
+
+def _resolve(ipn: PayPalIPN, order: Optional[Order]) -> tuple[str, str]:
+    """
+    Returns the status an IPN moves its order to, or a blank status and the reason it is ignored.
+    """
+    if ipn.flag:
+        return '', f'Flagged: {ipn.flag_info}'[:255]
+    if order is None:
+        return '', f'No order numbered {ipn.invoice!r}.'[:255]
+    if ipn.receiver_email.lower() != settings.PAYPAL_RECEIVER_EMAIL.lower():
+        return '', f'Paid to {ipn.receiver_email}.'[:255]
+    status = PAYMENT_STATUSES.get(ipn.payment_status, '')
+    if not status:
+        return '', f'Payment {ipn.payment_status}.'
+    currency = getattr(settings, 'PAYPAL_CURRENCY', 'USD')
+    if ipn.mc_currency.upper() != currency:
+        # Orders are priced in one currency, an amount in another one cannot be compared nor refunded as is.
+        return '', f'Paid in {ipn.mc_currency} for an order in {currency}.'[:255]
+    if status == 'Delivered' and ipn.mc_gross != order.total_amount:
+        return '', f'Paid {ipn.mc_gross} for an order of {order.total_amount}.'
+    return status, ''
+
+
+def _change_status(order_ids: list[int], status: str) -> set[int]:
+    """
+    Moves the orders to `status` in one UPDATE, returns the orders left out for lack of stock.
+    """
+    try:
+        with transaction.atomic():
+            change_orders_status(Order.objects.filter(pk__in=order_ids), status)
+        return set()
+    except OutOfStockError:
+        pass
+    # Some order canceled on expiry can no longer get its stock back, retry them one by one.
+    failed = set()
+    for order_id in order_ids:
+        try:
+            with transaction.atomic():
+                change_orders_status(Order.objects.filter(pk=order_id), status)
+        except OutOfStockError:
+            failed.add(order_id)
+    return failed
+
+
+def reconcile_batch(batch_size: int) -> int:
+    """
+    Applies up to `batch_size` stored IPNs not reconciled yet and returns how many were processed.
+    """
+    with transaction.atomic():
+        ipns = list(PayPalIPN.objects.select_for_update(skip_locked=True, of=('self',))
+                                     .filter(reconciliation__isnull=True)
+                                     .order_by('id')
+                                     .only('id', 'invoice', 'payment_status', 'mc_gross', 'mc_currency',
+                                           'receiver_email', 'flag', 'flag_info')[:batch_size])
+        if not ipns:
+            return 0
+        orders = {order.order_number: order
+                  for order in Order.objects.filter(order_number__in={ipn.invoice for ipn in ipns if ipn.invoice})
+                                            .only('id', 'order_number', 'status', 'total_amount')}
+
+        records, targets = [], {}
+        for ipn in ipns:
+            order = orders.get(ipn.invoice)
+            status, note = _resolve(ipn, order)
+            if status:
+                # Notifications are applied in arrival order, the last one of an order wins.
+                targets[order] = status
+            records.append(IpnReconciliation(ipn=ipn, order=order, status=status, note=note))
+
+        failed = set()
+        for status in set(targets.values()):
+            order_ids = [order.id for order, target in targets.items() if target == status]
+            failed |= _change_status(order_ids, status)
+        for record in records:
+            if record.order_id in failed and record.status:
+                record.status, record.note = '', 'Paid without stock left, to refund.'
+        for order, status in targets.items():
+            if status == 'Delivered' and order.status != 'Delivered' and order.id not in failed:
+                order_paid(order)
+
+        IpnReconciliation.objects.bulk_create(records)
+    return len(ipns)
+
+
+@task
+def reconcile_payments(batch_size: Optional[int] = None) -> int:
+    """
+    Applies every stored IPN not reconciled yet, batch by batch, and returns how many were processed.
+    """
+    batch_size = batch_size or getattr(settings, 'PAYPAL_RECONCILE_BATCH_SIZE', 500)
+    total = 0
+    while processed := reconcile_batch(batch_size):
+        total += processed
+    return total
+
+
+@receiver([valid_ipn_received, invalid_ipn_received], dispatch_uid='app.payments.ipn_received')
+def ipn_received(sender: PayPalIPN, **kwargs) -> None:
+    """
+    Queues the reconciliation of the window the IPN arrived in, one task per window.
+    """
+    window = getattr(settings, 'PAYPAL_RECONCILE_WINDOW', 5)
+    now = time.time()
+    slot = int(now // window)
+    enqueue('reconcile_payments', idempotency_key=f'reconcile-payments:{slot}',
+            delay=int((slot + 1) * window - now) + 1)
@@ -0,0 +1,170 @@
+"""
+Related products from co-purchases.
+
+The co-purchase matrix counts, for every pair of products, the orders
+containing both. Only the RELATED_PRODUCTS_TOP_K best related products of
+each product are kept, ranked, in RelatedProduct, so the product page reads
+its related products with one query on the (product, rank) index and falls
+back to the newest products of the same category when there are not enough.
+
+`rebuild_related_products` computes the whole matrix from the order lines,
+vectorized with NumPy when it is installed. Placed orders queue one
+`refresh_related_products` task per RELATED_PRODUCTS_WINDOW seconds which
+recomputes, in SQL, only the products of the orders of that window: the
+counts of the other products did not change.
+"""
+
+# Python imports.
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+# Django imports.
+from django.conf import settings
+from django.db import connection, transaction
+
+# Project imports.
+from app.models import OrderDetail, Product, RelatedProduct
+from app.tasks import task
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - rebuilds fall back to the SQL refresh.
+    np = None
+
+
+BATCH_SIZE = 5000
+# Products refreshed per co-purchase query.
+REFRESH_CHUNK_SIZE = 500
+READ_CHUNK_SIZE = 20000
+
+
+def get_top_k() -> int:
+    return getattr(settings, 'RELATED_PRODUCTS_TOP_K', 8)
+
+
+def _chunks(values: list, size: int) -> Iterator[list]:
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def co_purchases(product_ids: list[int], top_k: int) -> list[tuple[int, int, int, int]]:
+    """
+    Returns the (product, related, score, rank) rows of the `top_k` products most bought with each product.
+    """
+    table = OrderDetail._meta.db_table
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    sql = (f'SELECT product_id, related_id, score, position - 1 FROM ('
+           f'  SELECT line.product_id, other.product_id AS related_id, COUNT(DISTINCT line.order_id) AS score,'
+           f'         ROW_NUMBER() OVER (PARTITION BY line.product_id'
+           f'                            ORDER BY COUNT(DISTINCT line.order_id) DESC, other.product_id) AS position'
+           f'  FROM {table} line JOIN {table} other'
+           f'    ON other.order_id = line.order_id AND other.product_id <> line.product_id'
+           f'  WHERE line.product_id IN ({placeholders})'
+           f'  GROUP BY line.product_id, other.product_id'
+           f') ranked WHERE position <= %s')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*product_ids, top_k])
+        return cursor.fetchall()
+
+
+def refresh_related(product_ids: list[int]) -> int:
+    """
+    Recomputes the related products of the given products and returns how many rows were written.
+    """
+    top_k = get_top_k()
+    written = 0
+    for chunk in _chunks(sorted(set(product_ids)), REFRESH_CHUNK_SIZE):
+        rows = co_purchases(chunk, top_k)
+        with transaction.atomic():
+            RelatedProduct.objects.filter(product_id__in=chunk).delete()
+            RelatedProduct.objects.bulk_create([RelatedProduct(product_id=product_id, related_id=related_id,
+                                                               score=score, rank=rank)
+                                                for product_id, related_id, score, rank in rows],
+                                               batch_size=BATCH_SIZE)
+        written += len(rows)
+    return written
+
+
+def _top_related(orders: 'np.ndarray', products: 'np.ndarray', top_k: int) -> tuple['np.ndarray', ...]:
+    """
+    Counts the co-purchases of the (order, product) lines and returns the product, related, score
+    and rank arrays of the `top_k` best related products of each product.
+    """
+    product_values, product_codes = np.unique(products, return_inverse=True)
+    _, order_codes = np.unique(orders, return_inverse=True)
+    size = len(product_values)
+    # Distinct lines sorted by order, a product twice in an order counts once.
+    lines = np.unique(order_codes.astype(np.int64) * size + product_codes)
+    order_codes, product_codes = lines // size, lines % size
+
+    # Every line is paired with every line of its order: line i yields its order size pairs.
+    starts = np.flatnonzero(np.r_[True, order_codes[1:] != order_codes[:-1]])
+    sizes = np.diff(np.r_[starts, len(lines)])
+    line_sizes = np.repeat(sizes, sizes)
+    left = np.repeat(np.arange(len(lines)), line_sizes)
+    offsets = np.arange(len(left)) - np.repeat(np.cumsum(line_sizes) - line_sizes, line_sizes)
+    right = np.repeat(np.repeat(starts, sizes), line_sizes) + offsets
+    pairs = left != right
+    keys, scores = np.unique(product_codes[left[pairs]] * size + product_codes[right[pairs]], return_counts=True)
+    product, related = keys // size, keys % size
+
+    # Best scores first within each product, ties broken by the related product id.
+    order = np.lexsort((related, -scores, product))
+    product, related, scores = product[order], related[order], scores[order]
+    firsts = np.flatnonzero(np.r_[True, product[1:] != product[:-1]])
+    ranks = np.arange(len(product)) - np.repeat(firsts, np.diff(np.r_[firsts, len(product)]))
+    kept = ranks < top_k
+    return product_values[product[kept]], product_values[related[kept]], scores[kept], ranks[kept]
+
+
+def rebuild_related_products() -> int:
+    """
+    Recomputes the related products of the whole catalog and returns how many rows were written.
+    """
+    lines = OrderDetail.objects.order_by()
+    with transaction.atomic():
+        RelatedProduct.objects.all().delete()
+        if np is None:
+            return refresh_related(list(lines.values_list('product_id', flat=True).distinct()))
+
+        lines = np.fromiter(lines.values_list('order_id', 'product_id').iterator(chunk_size=READ_CHUNK_SIZE),
+                            dtype=[('order', np.int64), ('product', np.int64)])
+        if not len(lines):
+            return 0
+        columns = _top_related(lines['order'], lines['product'], get_top_k())
+        for start in range(0, len(columns[0]), BATCH_SIZE):
+            RelatedProduct.objects.bulk_create([
+                RelatedProduct(product_id=product_id, related_id=related_id, score=score, rank=rank)
+                for product_id, related_id, score, rank in zip(*(column[start:start + BATCH_SIZE].tolist()
+                                                                 for column in columns))
+            ])
+        return len(columns[0])
+
+
+@task
+def refresh_related_products(since: float, until: float) -> int:
+    """
+    Refreshes the related products of the products ordered between two timestamps.
+    """
+    product_ids = (OrderDetail.objects.filter(order__created_at__gte=datetime.fromtimestamp(since, timezone.utc),
+                                              order__created_at__lt=datetime.fromtimestamp(until, timezone.utc))
+                                      .order_by()
+                                      .values_list('product_id', flat=True)
+                                      .distinct())
+    return refresh_related(list(product_ids))
+
+
+def get_related_products(product: Product, limit: Optional[int] = None) -> list[Product]:
+    """
+    Returns the products most bought with `product`, completed with the newest products of its category.
+    """
+    limit = limit or getattr(settings, 'RELATED_PRODUCTS_COUNT', 4)
+    related = [row.related for row in RelatedProduct.objects.filter(product_id=product.id)
+                                                            .select_related('related__category')
+                                                            .order_by('rank')[:limit]]
+    if len(related) < limit:
+        related += (Product.objects.filter(category_id=product.category_id)
+                                   .exclude(pk__in=[product.id, *(item.id for item in related)])
+                                   .select_related('category')
+                                   .order_by('-created_at', '-id')[:limit - len(related)])
+    return related
@@ -0,0 +1,129 @@
+"""
+Local stand-in for Redis, to run the Redis cart storage without a Redis server.
+
+It speaks enough of the Redis protocol (RESP) for app.cart_storage: PING,
+AUTH, SELECT, GET, SET with EX/PX, DEL, EXPIRE, TTL and FLUSHDB, keeps the
+values in memory and expires keys when they are read. Each connection is
+served by its own thread. Start it with `python manage.py runcartstore`.
+"""
+
+# Python imports.
+import socketserver
+import threading
+import time
+from typing import Optional
+
+
+class RespStore:
+    """
+    In-memory numbered databases of bytes values with optional expiry times.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.databases: dict[int, dict[bytes, tuple[bytes, Optional[float]]]] = {}
+
+    def database(self, number: int) -> dict:
+        return self.databases.setdefault(number, {})
+
+    def get(self, number: int, key: bytes) -> Optional[tuple[bytes, Optional[float]]]:
+        """
+        Returns the value and expiry time of a live key, dropping it when it expired.
+        """
+        database = self.database(number)
+        item = database.get(key)
+        if item and item[1] is not None and item[1] <= time.monotonic():
+            del database[key]
+            return None
+        return item
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+    """
+    Serves the commands of one client connection.
+    """
+
+    def setup(self) -> None:
+        super().setup()
+        self.database = 0
+        self.authenticated = self.server.password is None
+
+    def handle(self) -> None:
+        while command := self.read_command():
+            try:
+                reply = self.execute(command[0].upper().decode(), command[1:])
+            except (ValueError, IndexError):
+                reply = b'-ERR syntax error\r\n'
+            self.wfile.write(reply)
+
+    def read_command(self) -> Optional[list[bytes]]:
+        line = self.rfile.readline()
+        if not line.startswith(b'*'):
+            return None
+        arguments = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            arguments.append(self.rfile.read(length + 2)[:-2])
+        return arguments or None
+
+    @staticmethod
+    def bulk(value: Optional[bytes]) -> bytes:
+        return b'$-1\r\n' if value is None else b'$%d\r\n%s\r\n' % (len(value), value)
+
+    def execute(self, name: str, arguments: list[bytes]) -> bytes:
+        store = self.server.store
+        if name == 'AUTH':
+            self.authenticated = arguments[-1].decode() == self.server.password
+            return b'+OK\r\n' if self.authenticated else b'-WRONGPASS invalid password\r\n'
+        if not self.authenticated:
+            return b'-NOAUTH Authentication required.\r\n'
+        if name == 'PING':
+            return b'+PONG\r\n'
+        if name == 'SELECT':
+            self.database = int(arguments[0])
+            return b'+OK\r\n'
+
+        with store.lock:
+            database = store.database(self.database)
+            if name == 'GET':
+                item = store.get(self.database, arguments[0])
+                return self.bulk(item[0] if item else None)
+            if name == 'SET':
+                key, value, options = arguments[0], arguments[1], [option.upper() for option in arguments[2:]]
+                expires = None
+                if b'EX' in options:
+                    expires = time.monotonic() + int(arguments[2 + options.index(b'EX') + 1])
+                elif b'PX' in options:
+                    expires = time.monotonic() + int(arguments[2 + options.index(b'PX') + 1]) / 1000
+                database[key] = (value, expires)
+                return b'+OK\r\n'
+            if name == 'DEL':
+                deleted = [database.pop(key) for key in arguments if store.get(self.database, key)]
+                return b':%d\r\n' % len(deleted)
+            if name == 'EXPIRE':
+                if not (item := store.get(self.database, arguments[0])):
+                    return b':0\r\n'
+                database[arguments[0]] = (item[0], time.monotonic() + int(arguments[1]))
+                return b':1\r\n'
+            if name == 'TTL':
+                if not (item := store.get(self.database, arguments[0])):
+                    return b':-2\r\n'
+                return b':%d\r\n' % (-1 if item[1] is None else round(item[1] - time.monotonic()))
+            if name == 'FLUSHDB':
+                database.clear()
+                return b'+OK\r\n'
+        return b"-ERR unknown command '%s'\r\n" % name.encode()
+
+
+class RespServer(socketserver.ThreadingTCPServer):
+    """
+    Threaded TCP server sharing one RespStore between its connections.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple[str, int], password: Optional[str] = None) -> None:
+        super().__init__(address, RespHandler)
+        self.store = RespStore()
+        self.password = password
@@ -0,0 +1,128 @@
+"""
+Full-text search index over the product name and description.
+
+On SQLite the index is an FTS5 virtual table kept in sync by signals, on
+PostgreSQL it is a GIN index over a `to_tsvector` expression that the
+database maintains by itself. Other backends fall back to `icontains`.
+Matches carry a `search_rank` annotation, lower is more relevant on every
+backend, so the catalog pages the results by relevance.
+"""
+
+# Python imports.
+import re
+from typing import Optional
+
+# Django imports.
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q, QuerySet, Value
+from django.db.models.expressions import RawSQL
+
+# Project imports.
+from app.models import Product
+
+
+FTS_TABLE = 'app_product_fts'
+PG_INDEX = 'app_product_search_gin'
+# Same expression as the GIN index, qualified so joins with other `name` columns stay unambiguous.
+PG_DOCUMENT = ("to_tsvector('simple', coalesce(app_product.name, '') || ' ' || "
+               "coalesce(app_product.description, ''))")
+
+
+def _terms(query: str) -> list[str]:
+    """
+    Splits a user query into the word terms the index understands.
+    """
+    return re.findall(r'\w+', query.lower())
+
+
+def index_product(product: Product) -> None:
+    """
+    Adds or refreshes a product in the index.
+    """
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product.pk])
+            cursor.execute(f'INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (%s, %s, %s)',
+                           [product.pk, product.name, product.description])
+
+
+def index_product_ids(product_ids: list[int]) -> None:
+    """
+    Adds or refreshes many products in the index with two statements, for bulk writes that skip the signals.
+    """
+    if connection.vendor == 'sqlite' and product_ids:
+        placeholders = ', '.join(['%s'] * len(product_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', product_ids)
+            cursor.execute(f'INSERT INTO {FTS_TABLE}(rowid, name, description) '
+                           f'SELECT id, name, description FROM app_product WHERE id IN ({placeholders})',
+                           product_ids)
+
+
+def unindex_product(product_id: int) -> None:
+    """
+    Removes a product from the index.
+    """
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product_id])
+
+
+def rebuild_index() -> int:
+    """
+    Rebuilds the whole index from the product table and returns the number of indexed products.
+    """
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(f'INSERT INTO {FTS_TABLE}(rowid, name, description) '
+                           'SELECT id, name, description FROM app_product')
+    elif connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'REINDEX INDEX {PG_INDEX}')
+    return Product.objects.count()
+
+
+def search_queryset(query: str, queryset: Optional[QuerySet] = None) -> QuerySet:
+    """
+    Returns the products matching every term of the query as a prefix, annotated with their `search_rank`.
+    """
+    queryset = Product.objects.all() if queryset is None else queryset
+    terms = _terms(query)
+    if not terms:
+        return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    if connection.vendor == 'sqlite':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        matches = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+        rank = RawSQL(f'SELECT rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid = app_product.id',
+                      [match], output_field=FloatField())
+        return queryset.filter(id__in=matches).annotate(search_rank=rank)
+    if connection.vendor == 'postgresql':
+        match = ' & '.join(f'{term}:*' for term in terms)
+        matches = RawSQL(f"{PG_DOCUMENT} @@ to_tsquery('simple', %s)", [match], output_field=BooleanField())
+        # ts_rank grows with relevance, negated to sort like the FTS5 rank.
+        rank = RawSQL(f"-ts_rank({PG_DOCUMENT}, to_tsquery('simple', %s))", [match], output_field=FloatField())
+        return queryset.filter(matches).annotate(search_rank=rank)
+
+    condition = Q()
+    for term in terms:
+        condition &= Q(name__icontains=term) | Q(description__icontains=term)
+    return queryset.filter(condition).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+def search_product_ids(query: str, limit: Optional[int] = None) -> list[int]:
+    """
+    Returns the ids of the products matching every term of the query as a prefix, best ranked first.
+    """
+    ids = search_queryset(query).order_by('search_rank', 'id').values_list('id', flat=True)
+    return list(ids[:limit] if limit else ids)
+
+
+def search_products(query: str, limit: Optional[int] = None) -> list[Product]:
+    """
+    Returns the matching products ordered by relevance.
+    """
+    ids = search_product_ids(query, limit)
+    products = Product.objects.select_related('category').in_bulk(ids)
+    return [products[pk] for pk in ids if pk in products]
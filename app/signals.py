@@ -0,0 +1,40 @@
+"""
+Signal receivers keeping the catalog caches and search index in sync with the models.
+"""
+
+# Django imports.
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+# Project imports.
+from app.models import Category, Product
+from app.catalog import invalidate_category_summary, bump_catalog_version
+from app.search import index_product, unindex_product
+from app.images import schedule_product_image
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Product)
+def catalog_changed(sender, **kwargs) -> None:
+    """
+    Invalidates the cached category summary and catalog pages when a category or product changes.
+    """
+    invalidate_category_summary()
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance: Product, **kwargs) -> None:
+    """
+    Refreshes the saved product in the search index and queues its image derivatives.
+    """
+    index_product(instance)
+    schedule_product_image(instance)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance: Product, **kwargs) -> None:
+    """
+    Removes the deleted product from the search index.
+    """
+    unindex_product(instance.pk)
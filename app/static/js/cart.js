@@ -0,0 +1,58 @@
+/*
+ * Cart interactions through the JSON cart API (app/api.py), updating the
+ * header cart in place instead of reloading the page.
+ */
+(function ($) {
+    'use strict';
+
+    function csrfToken() {
+        return $('meta[name="csrf-token"]').attr('content');
+    }
+
+    function escapeHtml(value) {
+        return $('<div>').text(value).html();
+    }
+
+    // The url templates end with an {id} placeholder, see includes/header_cart.html.
+    function urlFor(template, id) {
+        return template.replace('{id}', encodeURIComponent(id));
+    }
+
+    function renderHeaderCart(cart) {
+        var $cart = $('.h-cart');
+        var itemUrl = $cart.data('cart-item-url');
+        var productUrl = $cart.data('product-url');
+
+        $cart.find('.h-cart-icon span').text(cart.lines.length);
+        $cart.find('.h-cart-total').text('$' + cart.total_amount);
+        $cart.find('.total').html('<b>Total:</b> $' + escapeHtml(cart.total_amount));
+        $cart.find('.cart_list').html($.map(cart.lines, function (line) {
+            return '<li>' +
+                '<a href="#" data-cart-remove="' + urlFor(itemUrl, line.product_id) + '" class="remove">&times;</a>' +
+                '<a href="' + urlFor(productUrl, line.product_id) + '">' +
+                '<img src="' + escapeHtml(line.image) + '" alt="">' + escapeHtml(line.name) + '</a>' +
+                '<span class="quantity">' + line.quantity + ' &times; $' + escapeHtml(line.price) + '</span>' +
+                '</li>';
+        }).join(''));
+    }
+
+    function request(method, url, data) {
+        return $.ajax({
+            url: url,
+            method: method,
+            data: data ? JSON.stringify(data) : undefined,
+            contentType: 'application/json',
+            headers: {'X-CSRFToken': csrfToken()}
+        }).done(renderHeaderCart);
+    }
+
+    $(document).on('click', '[data-cart-add]', function (event) {
+        event.preventDefault();
+        request('POST', $(this).data('cart-add'), {quantity: 1});
+    });
+
+    $(document).on('click', '[data-cart-remove]', function (event) {
+        event.preventDefault();
+        request('DELETE', $(this).data('cart-remove'));
+    });
+})(jQuery);
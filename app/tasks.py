@@ -0,0 +1,238 @@
+"""
+Database backed task queue for the slow follow-up work of the storefront.
+
+Tasks are rows of the Task model inserted in the same transaction as the
+change that triggers them, so they are never lost nor run for rolled back
+work. The `run_tasks` management command drains them with a thread pool,
+retrying failures with exponential backoff.
+
+A running task keeps its lock fresh with a heartbeat, so only the tasks of a
+worker that died are handed to another worker. A task reclaimed that way may
+still run twice, handlers must be idempotent.
+"""
+
+# Python imports.
+import logging
+import threading
+import traceback
+from datetime import timedelta
+from typing import Callable, Optional
+
+# Django imports.
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import connection
+from django.utils import timezone
+
+# Project imports.
+from app.models import Order, Task
+
+
+logger = logging.getLogger(__name__)
+
+registry: dict[str, Callable] = {}
+
+
+def task(function: Callable) -> Callable:
+    """
+    Registers a function as a task runnable by the workers under its name.
+    """
+    registry[function.__name__] = function
+    return function
+
+
+def build_task(name: str, payload: Optional[dict] = None, idempotency_key: Optional[str] = None,
+               delay: int = 0, max_attempts: int = 5) -> Task:
+    """
+    Returns an unsaved task of a registered function, for enqueue_many.
+    """
+    if name not in registry:
+        raise KeyError(f'Unknown task {name}.')
+    return Task(name=name, payload=payload or {}, idempotency_key=idempotency_key, max_attempts=max_attempts,
+                run_at=timezone.now() + timedelta(seconds=delay))
+
+
+def enqueue_many(tasks: list[Task]) -> None:
+    """
+    Queues several tasks with one INSERT, skipping those whose idempotency key was already queued.
+
+    The database ignores the conflicting rows (ON CONFLICT DO NOTHING), so no
+    savepoint guards the insert. The tasks get no primary key back.
+    """
+    Task.objects.bulk_create(tasks, ignore_conflicts=True)
+
+
+def enqueue(name: str, payload: Optional[dict] = None, idempotency_key: Optional[str] = None,
+            delay: int = 0, max_attempts: int = 5) -> Task:
+    """
+    Queues a task, returning the existing one when a task with the same idempotency key was already queued.
+    """
+    queued = build_task(name, payload, idempotency_key, delay, max_attempts)
+    if idempotency_key is None:
+        queued.save(force_insert=True)
+        return queued
+    enqueue_many([queued])
+    return Task.objects.get(idempotency_key=idempotency_key)
+
+
+def backoff(attempts: int) -> timedelta:
+    """
+    Returns the delay before retrying a task that failed `attempts` times.
+    """
+    base = getattr(settings, 'TASK_RETRY_BACKOFF', 10)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), getattr(settings, 'TASK_RETRY_BACKOFF_MAX', 3600)))
+
+
+def claim_tasks(limit: int) -> list[Task]:
+    """
+    Atomically marks up to `limit` due tasks as running and returns them.
+
+    Every claim is a conditional UPDATE on the pending status, so concurrent
+    workers never run the same task twice.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=getattr(settings, 'TASK_LOCK_TIMEOUT', 300))
+    # Running tasks renew their lock (see LockHeartbeat), the stale ones were left by a crashed worker.
+    Task.objects.filter(status='Running', locked_at__lt=stale).update(status='Pending')
+
+    claimed = []
+    candidates = Task.objects.filter(status='Pending', run_at__lte=now).order_by('run_at').values_list('id', flat=True)
+    for task_id in candidates[:limit]:
+        if Task.objects.filter(pk=task_id, status='Pending').update(status='Running', locked_at=now):
+            claimed.append(task_id)
+    return list(Task.objects.filter(pk__in=claimed).order_by('run_at'))
+
+
+def renew_lock(queued: Task) -> bool:
+    """
+    Extends the lock of a claimed task, returns False when another worker reclaimed it meanwhile.
+    """
+    now = timezone.now()
+    if Task.objects.filter(pk=queued.pk, status='Running', locked_at=queued.locked_at).update(locked_at=now):
+        queued.locked_at = now
+        return True
+    return False
+
+
+class LockHeartbeat(threading.Thread):
+    """
+    Renews the lock of a running task every TASK_HEARTBEAT_INTERVAL seconds until stopped.
+    """
+
+    def __init__(self, queued: Task) -> None:
+        super().__init__(name=f'task-heartbeat-{queued.pk}', daemon=True)
+        self.queued = queued
+        self.interval = getattr(settings, 'TASK_HEARTBEAT_INTERVAL', 60)
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        try:
+            while not self.stopped.wait(self.interval):
+                if not renew_lock(self.queued):
+                    logger.warning('Task %s lost its lock while running.', self.queued)
+                    break
+        finally:
+            connection.close()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.join()
+
+
+def run_task(queued: Task) -> bool:
+    """
+    Executes a claimed task and records its outcome, returns whether it succeeded.
+
+    The outcome is only recorded while the task still holds its lock, a task
+    reclaimed by another worker is left to it.
+    """
+    queued.attempts += 1
+    heartbeat = LockHeartbeat(queued)
+    heartbeat.start()
+    try:
+        registry[queued.name](**queued.payload)
+    except Exception:
+        heartbeat.stop()
+        queued.last_error = traceback.format_exc()
+        if queued.attempts >= queued.max_attempts:
+            queued.status = 'Failed'
+            logger.error('Task %s failed permanently.', queued)
+        else:
+            queued.status = 'Pending'
+            queued.run_at = timezone.now() + backoff(queued.attempts)
+        _record_outcome(queued, 'attempts', 'status', 'run_at', 'last_error')
+        return False
+
+    heartbeat.stop()
+    queued.status = 'Done'
+    _record_outcome(queued, 'attempts', 'status')
+    return True
+
+
+def _record_outcome(queued: Task, *fields: str) -> None:
+    """
+    Saves the fields of a task and releases its lock, unless another worker reclaimed it.
+    """
+    values = {field: getattr(queued, field) for field in fields}
+    if not Task.objects.filter(pk=queued.pk, status='Running', locked_at=queued.locked_at).update(
+            locked_at=None, updated_at=timezone.now(), **values):
+        logger.warning('Task %s was reclaimed by another worker, its outcome is discarded.', queued)
+    queued.locked_at = None
+
+
+@task
+def send_order_received_email(order_id: int) -> None:
+    """
+    Emails the customer that the order was registered and is waiting for payment.
+    """
+    order = Order.objects.select_related('customer__user').get(pk=order_id)
+    if order.customer.user.email:
+        send_mail('Order received',
+                  f'Your order {order.order_number} for ${order.total_amount} was received.',
+                  settings.DEFAULT_FROM_EMAIL, [order.customer.user.email])
+
+
+@task
+def send_order_confirmation_email(order_id: int) -> None:
+    """
+    Emails the customer that the order payment was confirmed.
+    """
+    order = Order.objects.select_related('customer__user').get(pk=order_id)
+    if order.customer.user.email:
+        send_mail('Order Confirmation',
+                  f'Your order {order.order_number} has been confirmed.',
+                  settings.DEFAULT_FROM_EMAIL, [order.customer.user.email])
+
+
+@task
+def expire_order(order_id: int) -> None:
+    """
+    Cancels an order still waiting for payment, releasing its reserved stock.
+    """
+    from app.orders import change_orders_status
+    change_orders_status(Order.objects.filter(pk=order_id, status='Pending'), 'Canceled')
+
+
+def order_placed(order: Order) -> None:
+    """
+    Hook called when an order is created, queues its follow-up work.
+    """
+    # The related products of the orders placed in the same window are refreshed together, see app.recommendations,
+    # the first order of the window queues the refresh and the others coalesce into it.
+    window = getattr(settings, 'RELATED_PRODUCTS_WINDOW', 60)
+    created = order.created_at.timestamp()
+    slot = int(created // window)
+    enqueue_many([
+        build_task('send_order_received_email', {'order_id': order.id}, idempotency_key=f'order-received:{order.id}'),
+        build_task('expire_order', {'order_id': order.id}, idempotency_key=f'order-expire:{order.id}',
+                   delay=getattr(settings, 'ORDER_RESERVATION_TIMEOUT', 1800)),
+        build_task('refresh_related_products', {'since': slot * window, 'until': (slot + 1) * window},
+                   idempotency_key=f'related-products:{slot}', delay=int((slot + 1) * window - created) + 1),
+    ])
+
+
+def order_paid(order: Order) -> None:
+    """
+    Hook called when an order payment is confirmed, queues its follow-up work.
+    """
+    enqueue('send_order_confirmation_email', {'order_id': order.id}, idempotency_key=f'order-paid:{order.id}')
@@ -0,0 +1,38 @@
+"""
+Template helpers rendering responsive product images.
+"""
+
+# Django imports.
+from django import template
+from django.utils.html import format_html
+
+# Project imports.
+from app.images import variant_srcset, variant_url
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def product_picture(product, sizes: str = '100vw', width: int = 320) -> str:
+    """
+    Renders a <picture> with WebP and JPEG srcsets, falling back to the original image.
+    """
+    if not product.image:
+        return ''
+    if not product.image_variants.get('jpeg'):
+        return format_html('<img src="{}" alt="{}" loading="lazy">', product.image.url, product.name)
+    return format_html('<picture>'
+                       '<source type="image/webp" srcset="{}" sizes="{}">'
+                       '<img src="{}" srcset="{}" sizes="{}" alt="{}" loading="lazy">'
+                       '</picture>',
+                       variant_srcset(product, 'webp'), sizes,
+                       variant_url(product, width), variant_srcset(product, 'jpeg'), sizes, product.name)
+
+
+@register.simple_tag
+def product_image_url(product, width: int = 320, extension: str = 'jpeg') -> str:
+    """
+    Returns the url of the product image derivative closest to `width`.
+    """
+    return variant_url(product, width, extension)
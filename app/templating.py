@@ -0,0 +1,69 @@
+"""
+Jinja2 environment for the storefront templates in app/jinja2.
+
+The catalog and product pages can be rendered by Jinja2 instead of the
+Django template language (CATALOG_TEMPLATE_ENGINE = 'jinja2'). The globals
+below mirror the tags those templates use and values are finalized the way
+Django renders them (localized and escaped), so both engines produce the
+same HTML from the same context.
+"""
+
+# Python imports.
+from typing import Any, Callable, Optional
+
+# Django imports.
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.templatetags.static import static
+from django.urls import reverse
+from django.utils.formats import localize
+from django.utils.html import conditional_escape
+from django.utils.timezone import template_localtime
+from jinja2 import Environment
+from markupsafe import Markup
+
+# Project imports.
+from app.templatetags.product_images import product_picture, product_image_url
+
+
+def url(viewname: str, *args) -> str:
+    """
+    Jinja2 counterpart of the {% url %} tag.
+    """
+    return reverse(viewname, args=args)
+
+
+def cache(timeout: Optional[int], fragment_name: str, *vary_on, caller: Callable[[], str]) -> Markup:
+    """
+    Jinja2 counterpart of the {% cache %} tag, used as `{% call cache(timeout, 'name', ...) %}`.
+    """
+    try:
+        fragment_cache = caches['template_fragments']
+    except InvalidCacheBackendError:
+        fragment_cache = caches['default']
+    key = make_template_fragment_key(f'jinja2.{fragment_name}', vary_on)
+    value = fragment_cache.get(key)
+    if value is None:
+        value = caller()
+        fragment_cache.set(key, value, timeout)
+    return Markup(value)
+
+
+def finalize(value: Any) -> Any:
+    """
+    Renders values like the Django template language: localized and escaped unless already safe.
+    """
+    return conditional_escape(localize(template_localtime(value)))
+
+
+def environment(**options) -> Environment:
+    """
+    Builds the Jinja2 environment of the TEMPLATES 'jinja2' backend.
+    """
+    env = Environment(finalize=finalize, **options)
+    env.globals.update({'static': static,
+                        'url': url,
+                        'cache': cache,
+                        'product_picture': product_picture,
+                        'product_image_url': product_image_url})
+    return env
@@ -1,3 +1,1587 @@
-from django.test import TestCase
+"""
+Tests for the application.
+"""
 
-# Create your tests here.
+# Python imports.
+import base64
+import csv
+import gzip
+import os
+import re
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO
+from datetime import timedelta
+from decimal import Decimal
+from importlib.util import find_spec
+from unittest import skipUnless
+from unittest.mock import patch
+from urllib.parse import urlencode
+
+# Django imports.
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db import close_old_connections
+from asgiref.sync import async_to_sync, sync_to_async
+from django.template import engines
+from django.template.loader import render_to_string
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+# Project imports.
+from app.models import Category, Product, Customer, Order, Task, DailySales, IpnReconciliation, RelatedProduct
+from app.benchmarks import seed, LoadDriver
+from app.cart import Cart
+from app.cart_storage import RespClient, RespError, decode_lines, encode_lines, get_resp_client
+from app.resp_server import RespServer
+from app.catalog import CATEGORY_SUMMARY_KEY, get_cached_product, get_catalog_version, get_category_summary
+from app.instrumentation import QueryBudgetExceeded
+from app.orders import place_order, change_orders_status, EmptyOrderError, OrderNumberAllocator
+from app.inventory import OutOfStockError
+from app.analytics import record_order, record_status_change, rebuild_rollups, sales_report
+from app import views, tasks, images
+from app.admin import ProductAdmin
+from app.pagination import encode_cursor
+from app.payments import reconcile_payments
+from app.search import search_product_ids
+from app import recommendations
+from app.benchmarks import template_context, benchmark_templates, BENCHMARK_TEMPLATES
+from config.static import MEDIA_STAT_TTL, CompressedManifestStaticFilesStorage, StaticFilesApplication
+
+
+class KeysetPaginationTests(TestCase):
+    """
+    Checks the catalog cursors walk every product once, newest first, and reject tampered cursors.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        category = Category.objects.create(name='Category')
+        cls.products = [Product.objects.create(name=f'Product {number}', description='Description', price=10,
+                                               category=category) for number in range(5)]
+        # Products created in the same instant are ordered by id.
+        Product.objects.filter(pk__in=[product.pk for product in cls.products[1:4]]).update(
+            created_at=cls.products[1].created_at)
+
+    def page(self, **params) -> dict:
+        return self.client.get('/', {'format': 'json', 'page_size': 2, **params}).json()
+
+    def test_cursors_round_trip_with_ties(self) -> None:
+        expected = [self.products[4].id, self.products[3].id, self.products[2].id, self.products[1].id,
+                    self.products[0].id]
+        seen, pages, page = [], [], self.page()
+        while True:
+            pages.append(page)
+            seen += [product['id'] for product in page['products']]
+            if not page['next_cursor']:
+                break
+            page = self.page(after=page['next_cursor'])
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(pages), 3)
+
+        previous = self.page(before=pages[2]['previous_cursor'])
+        self.assertEqual(previous['products'], pages[1]['products'])
+        self.assertEqual(self.page(before=pages[1]['previous_cursor'])['previous_cursor'], None)
+
+    def test_tampered_cursor_is_a_bad_request(self) -> None:
+        oversized = base64.urlsafe_b64encode(b'2024-01-01T00:00:00+00:00|99999999999999999999999').decode()
+        for cursor in ('not-a-cursor', 'bm90IGEgZGF0ZXwx', '!!!', oversized, encode_cursor(timezone.now(), 0)):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get('/', {'after': cursor}).status_code, 400)
+                self.assertEqual(self.client.get('/', {'before': cursor, 'format': 'json'}).status_code, 400)
+
+
+class CategorySummaryTests(TestCase):
+    """
+    Checks the categories sidebar is aggregated once, cached and rebuilt when the catalog changes.
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.shoes, self.hats = Category.objects.create(name='Shoes'), Category.objects.create(name='Hats')
+        self.boot = Product.objects.create(name='Boot', description='Description', price=10, category=self.shoes)
+
+    def counts(self) -> dict:
+        return {category['name']: category['product_count'] for category in get_category_summary()}
+
+    def test_summary_is_cached_until_the_catalog_changes(self) -> None:
+        with self.assertNumQueries(1):
+            self.assertEqual(self.counts(), {'Hats': 0, 'Shoes': 1})
+        with self.assertNumQueries(0):
+            self.counts()
+
+        Product.objects.create(name='Cap', description='Description', price=5, category=self.hats)
+        self.assertEqual(self.counts(), {'Hats': 1, 'Shoes': 1})
+        self.boot.delete()
+        self.assertEqual(self.counts(), {'Hats': 1, 'Shoes': 0})
+        Category.objects.create(name='Bags')
+        self.assertEqual(self.counts(), {'Bags': 0, 'Hats': 1, 'Shoes': 0})
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                                           'LOCATION': 'django_cache'}})
+    def test_invalidation_reaches_every_process_through_the_shared_cache(self) -> None:
+        call_command('createcachetable', verbosity=0)
+        # A separate connection stands for another worker reading the same cache.
+        other_worker = caches.create_connection('default')
+        self.counts()
+        self.assertIsNotNone(other_worker.get(CATEGORY_SUMMARY_KEY))
+        Product.objects.create(name='Cap', description='Description', price=5, category=self.hats)
+        self.assertIsNone(other_worker.get(CATEGORY_SUMMARY_KEY))
+
+    def test_sidebar_lists_the_categories(self) -> None:
+        response = self.client.get('/')
+        self.assertEqual(response.context['categories'], get_category_summary())
+        self.assertContains(response, f'/products/category/{self.shoes.id}')
+        self.assertEqual(self.client.get('/products/category/0').status_code, 404)
+
+
+class SearchTests(TestCase):
+    """
+    Checks the full-text search matches prefixes, ranks by relevance and follows product changes.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        category = Category.objects.create(name='Category')
+        cls.boot = Product.objects.create(name='Leather boot', description='Boot for hiking, a boot for rain.',
+                                          price=10, category=category)
+        # Newer, so it would come first if the results were ordered by date.
+        cls.sock = Product.objects.create(name='Wool sock', description='Warm sock to wear under any boot or shoe '
+                                                                         'through the long cold winter nights.',
+                                          price=2, category=category)
+
+    def test_prefix_terms_are_ranked_by_relevance(self) -> None:
+        self.assertEqual(search_product_ids('boot'), [self.boot.id, self.sock.id])
+        self.assertEqual(search_product_ids('BOO'), [self.boot.id, self.sock.id])
+        self.assertEqual(search_product_ids('leath bo'), [self.boot.id])
+        self.assertEqual(search_product_ids('boot', limit=1), [self.boot.id])
+        self.assertEqual(search_product_ids('sandal'), [])
+        self.assertEqual(search_product_ids('!!'), [])
+
+    def test_catalog_pages_results_by_rank(self) -> None:
+        first = self.client.get('/', {'name': 'boot', 'format': 'json', 'page_size': 1}).json()
+        self.assertEqual([product['id'] for product in first['products']], [self.boot.id])
+        second = self.client.get('/', {'name': 'boot', 'format': 'json', 'page_size': 1,
+                                       'after': first['next_cursor']}).json()
+        self.assertEqual([product['id'] for product in second['products']], [self.sock.id])
+        self.assertIsNone(second['next_cursor'])
+        back = self.client.get('/', {'name': 'boot', 'format': 'json', 'page_size': 1,
+                                     'before': second['previous_cursor']}).json()
+        self.assertEqual(back['products'], first['products'])
+        self.assertContains(self.client.get('/', {'name': 'wool'}), 'Wool sock')
+
+    def test_index_follows_saves_and_deletes(self) -> None:
+        self.sock.name = 'Cotton sandal'
+        self.sock.description = 'Summer'
+        self.sock.save()
+        self.assertEqual(search_product_ids('sandal'), [self.sock.id])
+        self.assertEqual(search_product_ids('wool'), [])
+
+        self.boot.delete()
+        self.assertEqual(search_product_ids('boot'), [])
+        self.assertEqual(self.client.get('/products/search/suggest', {'q': 'cot'}).json()['products'][0]['id'],
+                         self.sock.id)
+
+
+class OrderPlacementTests(TestCase):
+    """
+    Checks orders are priced server-side, written in constant queries and all or nothing.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        category = Category.objects.create(name='Category')
+        cls.products = [Product.objects.create(name=f'Product {number}', description='Description',
+                                               price=f'{number + 1}.50', category=category,
+                                               image='products/product.jpg') for number in range(4)]
+        user = User.objects.create_user(username='customer', password='password')
+        cls.customer = Customer.objects.create(document_id='1', phone='1', address='Address', user=user)
+        other = User.objects.create_user(username='other', password='password')
+        cls.other = Customer.objects.create(document_id='2', phone='1', address='Address', user=other)
+
+    def test_queries_do_not_grow_with_lines(self) -> None:
+        # The first order of the day also creates the rollup rows of its products.
+        place_order(self.customer, {product.id: 1 for product in self.products})
+        with CaptureQueriesContext(connection) as one_line:
+            place_order(self.customer, {self.products[0].id: 1})
+        with CaptureQueriesContext(connection) as four_lines:
+            order = place_order(self.customer, {product.id: 2 for product in self.products})
+        self.assertEqual(len(four_lines), len(one_line))
+        self.assertEqual(order.total_amount, Decimal('24.00'))
+        self.assertEqual(order.details.count(), 4)
+
+    def test_failed_order_leaves_nothing_behind(self) -> None:
+        with patch('app.orders.OrderDetail.objects.bulk_create', side_effect=RuntimeError('Failure')):
+            with self.assertRaises(RuntimeError):
+                place_order(self.customer, {self.products[0].id: 1})
+        self.assertFalse(Order.objects.exists())
+        with self.assertRaises(EmptyOrderError):
+            place_order(self.customer, {0: 1, self.products[0].id: 0})
+
+    def test_checkout_views_require_a_logged_in_post(self) -> None:
+        self.assertRedirects(self.client.post('/order/confirm/'), '/users/login/?next=/order/confirm/')
+        self.assertRedirects(self.client.get('/order/thanks/', {'PayerID': 'PAYER'}),
+                             '/users/login/?next=/order/thanks/%3FPayerID%3DPAYER')
+
+        self.client.login(username='customer', password='password')
+        self.assertEqual(self.client.get('/order/confirm/').status_code, 405)
+        self.client.post(f'/cart/add/{self.products[1].id}', {'quantity': 2})
+        response = self.client.post('/order/confirm/')
+        self.assertEqual(response.context['order'].total_amount, Decimal('5.00'))
+        self.assertContains(self.client.get('/order/thanks/', {'PayerID': 'PAYER'}),
+                            response.context['order'].order_number)
+
+        # The order kept in the session is only shown to its customer.
+        self.client.login(username='other', password='password')
+        session = self.client.session
+        session['order_id'] = response.context['order'].id
+        session.save()
+        self.assertEqual(self.client.get('/order/thanks/', {'PayerID': 'PAYER'}).status_code, 404)
+
+
+class SessionCartTests(TestCase):
+    """
+    Checks the session cart only keeps quantities and is priced from the products on every request.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        category = Category.objects.create(name='Category')
+        cls.boot, cls.hat = (Product.objects.create(name=name, description='Description', price=price,
+                                                    category=category, image='products/product.jpg')
+                             for name, price in (('Boot', '10.00'), ('Hat', '2.50')))
+
+    def cart(self) -> Cart:
+        request = RequestFactory().get('/')
+        request.session = self.client.session
+        return Cart(request)
+
+    def test_session_holds_quantities_priced_server_side(self) -> None:
+        self.client.post(f'/cart/add/{self.boot.id}', {'quantity': 2})
+        self.client.post(f'/cart/add/{self.hat.id}')
+        self.client.post(f'/cart/add/{self.boot.id}')
+        self.assertEqual(self.cart().quantities(), {self.boot.id: 3, self.hat.id: 1})
+        self.assertNotIn('Boot', str(dict(self.client.session)))
+
+        Product.objects.filter(pk=self.boot.pk).update(price='12.00')
+        cart = self.cart()
+        with self.assertNumQueries(1):
+            self.assertEqual(cart.total_amount, Decimal('38.50'))
+            self.assertEqual([line.subtotal for line in cart], [Decimal('36.00'), Decimal('2.50')])
+        self.assertContains(self.client.get('/cart/'), '$38.50')
+
+    def test_deleted_products_and_legacy_carts(self) -> None:
+        session = self.client.session
+        # Carts stored as JSON objects with copied prices keep their quantities only.
+        session['cart'] = {str(self.boot.id): {'quantity': 2, 'price': '1.00'}, str(self.hat.id): 1}
+        session.save()
+        self.assertEqual(self.cart().total_amount, Decimal('22.50'))
+
+        self.hat.delete()
+        self.assertEqual([line.name for line in self.cart()], ['Boot'])
+
+
+class CartStorageTests(TestCase):
+    """
+    Checks the cart encoding, the quantity validation and the Redis storage against the local stand-in.
+    """
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.server = RespServer(('127.0.0.1', 0))
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        category = Category.objects.create(name='Category')
+        cls.product = Product.objects.create(name='Boot', description='Description', price='10.00',
+                                             category=category, image='products/product.jpg')
+        User.objects.create_user(username='customer', password='password')
+
+    def setUp(self) -> None:
+        self.url = f'redis://127.0.0.1:{self.server.server_address[1]}/1'
+        redis_settings = override_settings(CART_STORAGE='app.cart_storage.RedisCartStorage', CART_REDIS_URL=self.url)
+        redis_settings.enable()
+        self.addCleanup(redis_settings.disable)
+        self.addCleanup(lambda: get_resp_client(self.url).execute('FLUSHDB'))
+
+    def stored(self) -> dict:
+        return {key: decode_lines(value) for key, (value, _) in self.server.store.database(1).items()}
+
+    def test_encoding_round_trip_and_rejects_invalid_lines(self) -> None:
+        lines = {1: 1, 127: 128, 300: 999, 2 ** 40: 5}
+        self.assertEqual(decode_lines(encode_lines(lines)), lines)
+        self.assertEqual(len(encode_lines({1: 2})), 2)
+        for invalid in ({1: 0}, {1: -1}, {-5: 1}, {1: '2'}):
+            with self.subTest(lines=invalid), self.assertRaises(ValueError):
+                encode_lines(invalid)
+
+    def test_invalid_quantities_are_bad_requests(self) -> None:
+        for quantity in ('0', '-1', '1000', 'many', '2.5'):
+            with self.subTest(quantity=quantity):
+                self.assertEqual(self.client.post(f'/cart/add/{self.product.id}', {'quantity': quantity}).status_code,
+                                 400)
+        self.client.post(f'/cart/add/{self.product.id}', {'quantity': 999})
+        self.assertEqual(self.client.post(f'/cart/add/{self.product.id}').status_code, 400)
+        self.assertEqual(self.client.post('/cart/add/0').status_code, 404)
+
+    def test_unreachable_storage_only_fails_the_cart_views(self) -> None:
+        self.client.post(f'/cart/add/{self.product.id}', {'quantity': 2})
+        with socket.socket() as closed:
+            closed.bind(('127.0.0.1', 0))
+            port = closed.getsockname()[1]
+        with override_settings(CART_REDIS_URL=f'redis://127.0.0.1:{port}/1'):
+            with self.assertLogs('app.context_processors', 'WARNING'):
+                response = self.client.get(f'/products/{self.product.id}')
+            self.assertContains(response, '<p class="h-cart-total">$0</p>', html=True)
+            with self.assertRaises(ConnectionError):
+                self.client.get('/cart/')
+
+    def test_cart_round_trip_and_expiry(self) -> None:
+        self.client.post(f'/cart/add/{self.product.id}', {'quantity': 2})
+        self.assertEqual(list(self.stored().values()), [{self.product.id: 2}])
+        self.assertContains(self.client.get('/cart/'), '$20.00')
+
+        key, (value, expires) = next(iter(self.server.store.database(1).items()))
+        self.assertAlmostEqual(expires - time.monotonic(), settings.SESSION_COOKIE_AGE, delta=5)
+        self.server.store.database(1)[key] = (value, time.monotonic() - 1)
+        self.assertNotContains(self.client.get('/cart/'), '$20.00')
+
+        self.client.post(f'/cart/add/{self.product.id}')
+        self.client.get(f'/cart/remove/{self.product.id}')
+        self.assertEqual(self.stored(), {})
+
+    def test_cart_survives_login(self) -> None:
+        self.client.post(f'/cart/add/{self.product.id}', {'quantity': 3})
+        anonymous_session = self.client.session.session_key
+        self.client.post('/users/login/', {'username': 'customer', 'password': 'password', 'destination_page': ''})
+        self.assertNotEqual(self.client.session.session_key, anonymous_session)
+        self.assertContains(self.client.get('/cart/'), '$30.00')
+
+    def test_error_replies_are_not_retried(self) -> None:
+        client = RespClient(self.url)
+        self.addCleanup(client.close)
+        client.set('key', b'value', 60)
+        with patch.object(client, '_connect', wraps=client._connect) as connect:
+            with self.assertRaisesRegex(RespError, 'unknown command'):
+                client.execute('NOPE')
+            self.assertEqual(client.get('key'), b'value')
+        connect.assert_not_called()
+
+        with self.assertRaises(RespError):
+            RespClient(self.url.replace('redis://', 'redis://:wrong@')).execute('PING')
+
+    def test_threads_get_their_own_client(self) -> None:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            other_thread = executor.submit(get_resp_client, self.url).result()
+        self.assertIs(get_resp_client(self.url), get_resp_client(self.url))
+        self.assertIsNot(get_resp_client(self.url), other_thread)
+
+        def roundtrip(number: int) -> bytes:
+            client = get_resp_client(self.url)
+            client.set(f'key{number}', str(number).encode())
+            return client.get(f'key{number}')
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            self.assertEqual(list(executor.map(roundtrip, range(200))), [str(number).encode() for number in range(200)])
+
+
+class CatalogCacheTests(TestCase):
+    """
+    Checks the cached catalog grid, product fragments and products follow admin edits.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        category = Category.objects.create(name='Category')
+        cls.product = Product.objects.create(name='Boot', description='Description', price='10.00',
+                                             category=category, image='products/product.jpg')
+        User.objects.create_superuser(username='admin', password='password')
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_cached_pages_skip_the_catalog_queries(self) -> None:
+        self.client.get('/')
+        self.client.get(f'/products/{self.product.id}')
+        # The grid, the product and its related products all come from the cache.
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get('/'), '$10.00')
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(f'/products/{self.product.id}'), '$10.00')
+
+    def test_grid_is_keyed_on_the_catalog_parameters_only(self) -> None:
+        self.client.get('/', {'page_size': 10})
+        with self.assertNumQueries(0):
+            response = self.client.get('/', {'page_size': 10, 'utm_source': 'mail'})
+        self.assertContains(response, '$10.00')
+        self.assertEqual(views._catalog_fragment_key(response.wsgi_request), '/?page_size=10')
+        # Another page size is another grid.
+        with self.assertNumQueries(1):
+            self.client.get('/', {'page_size': 5})
+
+    def test_admin_price_edit_invalidates_the_cached_pages(self) -> None:
+        self.assertContains(self.client.get('/'), '$10.00')
+        self.assertContains(self.client.get(f'/products/{self.product.id}'), '$10.00')
+
+        self.client.login(username='admin', password='password')
+        url = f'/admin/app/product/{self.product.id}/change/'
+        form = self.client.get(url).context['adminform'].form
+        data = {name: value for name, value in form.initial.items() if value is not None and name != 'image'}
+        data.update(price='12.50', category=self.product.category_id, image_variants='{}')
+        self.assertRedirects(self.client.post(url, data), '/admin/app/product/')
+        self.client.logout()
+
+        self.assertContains(self.client.get('/'), '$12.50')
+        response = self.client.get(f'/products/{self.product.id}')
+        self.assertContains(response, '$12.50')
+        self.assertNotContains(response, '$10.00')
+
+
+class QueryPlanTests(TestCase):
+    """
+    Checks the hot lookups are answered from the composite indexes.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        category = Category.objects.create(name='Category')
+        Product.objects.create(name='Product', description='Description', price=10, category=category)
+        user = User.objects.create_user(username='customer', password='password')
+        cls.customer = Customer.objects.create(document_id='1', phone='1', address='Address', user=user)
+        Order.objects.create(order_number='PED-1', customer=cls.customer)
+
+    def assertUsesIndex(self, queryset, index_name: str) -> None:
+        if connection.vendor == 'postgresql':
+            # Tiny test tables are cheaper to scan, force the planner to consider the indexes.
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+        self.assertIn(index_name, queryset.explain())
+
+    def test_catalog_page_uses_created_index(self) -> None:
+        self.assertUsesIndex(Product.objects.order_by('-created_at', '-id')[:25], 'product_created_idx')
+
+    def test_category_page_uses_category_created_index(self) -> None:
+        category = Category.objects.get()
+        self.assertUsesIndex(category.products.order_by('-created_at', '-id')[:25], 'product_category_created_idx')
+
+    def test_customer_history_uses_customer_created_index(self) -> None:
+        self.assertUsesIndex(self.customer.orders.order_by('-created_at'), 'order_customer_created_idx')
+
+    def test_orders_by_status_use_status_created_index(self) -> None:
+        self.assertUsesIndex(Order.objects.filter(status='Pending').order_by('-created_at'), 'order_status_created_idx')
+
+
+class LoadDriverTests(TestCase):
+    """
+    Runs the benchmark flow end to end on a tiny seeded dataset.
+    """
+
+    def test_seed_indexes_the_catalog_and_invalidates_the_caches(self) -> None:
+        cache.clear()
+        self.assertEqual(get_category_summary(), [])
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            seed(categories=2, products=10, customers=1, orders=2)
+        self.assertEqual(sum(category['product_count'] for category in get_category_summary()), 10)
+        self.assertNotEqual(get_catalog_version(), version)
+        product = Product.objects.first()
+        self.assertIn(product.id, search_product_ids(product.name))
+
+    def test_flow_reports_every_endpoint_without_errors(self) -> None:
+        seed(categories=2, products=10, customers=1, orders=2)
+        report = LoadDriver(host='testserver').run(users=1, iterations=2)
+
+        self.assertEqual(set(report), {'index', 'search', 'products_by_category', 'product',
+                                       'add_to_cart', 'confirm_order', 'thanks'})
+        for stats in report.values():
+            self.assertEqual(stats['requests'], 2)
+            self.assertEqual(stats['errors'], 0, report)
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Checks the instrumentation headers and the query budget enforcement.
+    """
+
+    def test_server_timing_header(self) -> None:
+        response = self.client.get('/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", total;dur=')
+
+    @override_settings(INSTRUMENT_TEMPLATES=True)
+    def test_server_timing_header_with_template_time(self) -> None:
+        response = self.client.get('/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, total;dur=')
+
+    @override_settings(QUERY_BUDGET_RAISE=False)
+    def test_exceeding_budget_is_logged(self) -> None:
+        category = Category.objects.create(name='Category')
+        product = Product.objects.create(name='Product', description='Description', price=10, category=category)
+        with patch.object(views.get_product_by_id, 'query_budget', 0):
+            with self.assertLogs('app.instrumentation', 'WARNING') as logs:
+                response = self.client.get(f'/products/{product.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('budget is 0', logs.output[0])
+
+    def test_exceeding_budget_raises_in_tests(self) -> None:
+        category = Category.objects.create(name='Category')
+        product = Product.objects.create(name='Product', description='Description', price=10, category=category)
+        with patch.object(views.get_product_by_id, 'query_budget', 0):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(f'/products/{product.id}')
+
+    def test_metrics_endpoint_is_local_only(self) -> None:
+        self.client.get('/')
+        self.assertContains(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1'), 'view="app:index"')
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code, 404)
+
+
+class TaskQueueTests(TestCase):
+    """
+    Checks the idempotency, retries and backoff of the task queue.
+    """
+
+    def setUp(self) -> None:
+        self.calls = []
+
+        def flaky(fail: bool) -> None:
+            self.calls.append(fail)
+            if fail:
+                raise RuntimeError('Failure')
+
+        tasks.registry['flaky'] = flaky
+        self.addCleanup(tasks.registry.pop, 'flaky')
+
+    def test_idempotency_key_returns_existing_task(self) -> None:
+        first = tasks.enqueue('flaky', {'fail': False}, idempotency_key='key')
+        second = tasks.enqueue('flaky', {'fail': False}, idempotency_key='key')
+        self.assertEqual(first.pk, second.pk)
+
+    def test_successful_task_is_done(self) -> None:
+        queued = tasks.enqueue('flaky', {'fail': False})
+        self.assertTrue(all(tasks.run_task(claimed) for claimed in tasks.claim_tasks(10)))
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'Done')
+        self.assertEqual(tasks.claim_tasks(10), [])
+
+    def test_failed_task_is_retried_with_backoff_then_failed(self) -> None:
+        queued = tasks.enqueue('flaky', {'fail': True}, max_attempts=2)
+        tasks.run_task(tasks.claim_tasks(10)[0])
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'Pending')
+        self.assertGreater(queued.run_at, timezone.now())
+        self.assertEqual(tasks.claim_tasks(10), [])
+
+        Task.objects.update(run_at=timezone.now())
+        tasks.run_task(tasks.claim_tasks(10)[0])
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'Failed')
+        self.assertEqual(self.calls, [True, True])
+
+    def test_reclaimed_task_keeps_the_new_claim(self) -> None:
+        stolen = []
+
+        def stalled() -> None:
+            # The worker missed its heartbeats, another worker reclaims the stale task meanwhile.
+            Task.objects.update(locked_at=timezone.now() - timedelta(seconds=settings.TASK_LOCK_TIMEOUT + 1))
+            stolen.extend(tasks.claim_tasks(10))
+
+        tasks.registry['stalled'] = stalled
+        self.addCleanup(tasks.registry.pop, 'stalled')
+        queued = tasks.enqueue('stalled')
+        with self.assertLogs('app.tasks', 'WARNING'):
+            self.assertTrue(tasks.run_task(tasks.claim_tasks(10)[0]))
+        self.assertEqual([task.pk for task in stolen], [queued.pk])
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.locked_at), ('Running', stolen[0].locked_at))
+
+
+@override_settings(TASK_LOCK_TIMEOUT=0.5, TASK_HEARTBEAT_INTERVAL=0.1)
+class TaskHeartbeatTests(TransactionTestCase):
+    """
+    Checks a task running longer than the lock timeout keeps its lock.
+    """
+
+    def test_running_task_is_not_reclaimed(self) -> None:
+        reclaimed = []
+
+        def slow() -> None:
+            time.sleep(1)
+            reclaimed.extend(tasks.claim_tasks(10))
+
+        tasks.registry['slow'] = slow
+        self.addCleanup(tasks.registry.pop, 'slow')
+        queued = tasks.enqueue('slow')
+        self.assertTrue(tasks.run_task(tasks.claim_tasks(10)[0]))
+        self.assertEqual(reclaimed, [])
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts, queued.locked_at), ('Done', 1, None))
+
+
+@override_settings(ROOT_URLCONF='config.async_urls')
+class AsyncViewTests(TestCase):
+    """
+    Checks the async catalog, product and cart views served under ASGI.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        category = Category.objects.create(name='Category')
+        cls.product = Product.objects.create(name='Product', description='Description', price=10, category=category)
+
+    async def test_catalog_and_product(self) -> None:
+        response = await self.async_client.get('/', {'format': 'json'})
+        self.assertEqual([product['id'] for product in response.json()['products']], [self.product.id])
+        response = await self.async_client.get(f'/products/{self.product.id}')
+        self.assertContains(response, 'Product')
+        response = await self.async_client.get('/products/0')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_cart(self) -> None:
+        await self.async_client.post(f'/cart/add/{self.product.id}', {'quantity': 2})
+        self.assertContains(await self.async_client.get('/cart/'), '$20.00')
+        await self.async_client.get(f'/cart/remove/{self.product.id}')
+        self.assertNotContains(await self.async_client.get('/cart/'), '$20.00')
+        response = await self.async_client.post(f'/cart/add/{self.product.id}', {'quantity': 'many'})
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.post('/cart/add/0', {'quantity': 1})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_product_is_read_through_the_catalog_cache(self) -> None:
+        with patch('app.catalog.get_cached_product', wraps=get_cached_product) as cached:
+            response = await self.async_client.get(f'/products/{self.product.id}')
+        self.assertContains(response, 'Product')
+        cached.assert_called_once_with(self.product.id)
+
+    async def test_search_and_category(self) -> None:
+        response = await self.async_client.get('/', {'name': 'product', 'format': 'json'})
+        self.assertEqual([product['id'] for product in response.json()['products']], [self.product.id])
+        response = await self.async_client.get(f'/products/category/{self.product.category_id}', {'format': 'json'})
+        self.assertEqual([product['id'] for product in response.json()['products']], [self.product.id])
+        response = await self.async_client.get('/products/category/0')
+        self.assertEqual(response.status_code, 404)
+
+
+class CartApiTests(TestCase):
+    """
+    Checks the JSON cart API and its conditional requests.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        category = Category.objects.create(name='Category')
+        cls.product = Product.objects.create(name='Product', description='Description', price='2.50', category=category)
+
+    def test_add_update_remove_and_clear(self) -> None:
+        url = f'/api/cart/items/{self.product.id}'
+        summary = self.client.post(url, {'quantity': 2}, content_type='application/json').json()
+        self.assertEqual((summary['count'], summary['total_amount']), (1, '5.00'))
+
+        summary = self.client.put(url, {'quantity': 5}, content_type='application/json').json()
+        self.assertEqual(summary['lines'][0]['quantity'], 5)
+
+        summary = self.client.delete(url).json()
+        self.assertEqual(summary['count'], 0)
+
+        self.client.post(url)
+        self.assertEqual(self.client.delete('/api/cart/').json()['lines'], [])
+
+    def test_invalid_quantities(self) -> None:
+        url = f'/api/cart/items/{self.product.id}'
+        for method, quantity in (('post', 0), ('post', 'many'), ('put', -1), ('put', 1000), ('put', True)):
+            with self.subTest(method=method, quantity=quantity):
+                response = getattr(self.client, method)(url, {'quantity': quantity}, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+        response = self.client.put(url, '{oops', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/cart/').json()['count'], 0)
+
+    def test_put_zero_removes_the_line(self) -> None:
+        url = f'/api/cart/items/{self.product.id}'
+        self.client.post(url, {'quantity': 2}, content_type='application/json')
+        self.assertEqual(self.client.put(url, {'quantity': 0}, content_type='application/json').json()['count'], 0)
+
+    def test_header_cart_url_templates(self) -> None:
+        context, request = template_context()
+        for engine in ('django', 'jinja2'):
+            with self.subTest(engine=engine):
+                html = render_to_string('includes/header_cart.html', context, request, using=engine)
+                self.assertIn('data-cart-item-url="/api/cart/items/{id}" data-product-url="/products/{id}"', html)
+
+    def test_unknown_product(self) -> None:
+        self.assertEqual(self.client.post('/api/cart/items/0').status_code, 404)
+
+    def test_conditional_get(self) -> None:
+        etag = self.client.get('/api/cart/')['ETag']
+        self.assertEqual(self.client.get('/api/cart/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.post(f'/api/cart/items/{self.product.id}')
+        response = self.client.get('/api/cart/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class SalesRollupTests(TestCase):
+    """
+    Checks the incremental daily sales rollups match a full rebuild.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        category = Category.objects.create(name='Category')
+        cls.first = Product.objects.create(name='First', description='Description', price='2.00', category=category)
+        cls.second = Product.objects.create(name='Second', description='Description', price='5.00', category=category)
+        user = User.objects.create_user(username='customer', password='password')
+        cls.customer = Customer.objects.create(document_id='1', phone='1', address='Address', user=user)
+
+    def rollups(self) -> set:
+        return set(DailySales.objects.values_list('date', 'product_id', 'status', 'orders', 'quantity', 'revenue'))
+
+    def test_incremental_rollups_match_rebuild(self) -> None:
+        order = place_order(self.customer, {self.first.id: 2, self.second.id: 1})
+        place_order(self.customer, {self.first.id: 1})
+        order.status = 'Delivered'
+        order.save()
+        record_status_change(order, 'Pending')
+
+        incremental = self.rollups()
+        self.assertEqual(rebuild_rollups(), 3)
+        self.assertEqual(self.rollups(), incremental)
+        self.assertEqual(sales_report(1, 'status'), [
+            {'status': 'Delivered', 'orders': 2, 'quantity': 3, 'revenue': Decimal('9.00')},
+            {'status': 'Pending', 'orders': 1, 'quantity': 1, 'revenue': Decimal('2.00')},
+        ])
+
+    def test_rows_inserted_by_a_concurrent_order_are_added_to(self) -> None:
+        order = place_order(self.customer, {self.first.id: 1})
+        DailySales.objects.all().delete()
+        bulk_create = DailySales.objects.bulk_create
+
+        def insert_first(rows, **kwargs):
+            DailySales.objects.create(date=rows[0].date, status=rows[0].status, product=self.first,
+                                      category_id=self.first.category_id, orders=1, quantity=1, revenue=2)
+            return bulk_create(rows, **kwargs)
+
+        with patch.object(DailySales.objects, 'bulk_create', side_effect=insert_first):
+            record_order(order)
+        self.assertEqual(DailySales.objects.get().orders, 2)
+
+    def test_report_view_is_staff_only(self) -> None:
+        place_order(self.customer, {self.first.id: 1})
+        self.assertEqual(self.client.get('/reports/sales/').status_code, 302)
+
+        User.objects.create_user(username='staff', password='password', is_staff=True)
+        self.client.login(username='staff', password='password')
+        response = self.client.get('/reports/sales/', {'group': 'category', 'format': 'json'})
+        self.assertEqual(response.json()['rows'][0]['revenue'], '2.00')
+        self.assertContains(self.client.get('/reports/sales/'), '$2.00')
+
+
+class OrderAdminTests(TestCase):
+    """
+    Checks the order changelist query count is flat and the status actions keep the rollups right.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        category = Category.objects.create(name='Category')
+        cls.product = Product.objects.create(name='Product', description='Description', price='3.00',
+                                             category=category)
+        for number in range(3):
+            user = User.objects.create_user(username=f'customer{number}', password='password')
+            customer = Customer.objects.create(document_id=str(number), phone='1', address='Address', user=user)
+            place_order(customer, {cls.product.id: number + 1})
+        User.objects.create_superuser(username='admin', password='password')
+
+    def setUp(self) -> None:
+        self.client.login(username='admin', password='password')
+
+    def test_changelist_queries_do_not_grow_with_rows(self) -> None:
+        # Session user, count and page, plus the category filter choices on products.
+        for url, queries in (('/admin/app/order/', 3), ('/admin/app/product/', 4),
+                             ('/admin/app/customer/', 3), ('/admin/app/orderdetail/', 3)):
+            self.client.get(url)
+            with self.assertNumQueries(queries):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_status_action_moves_rollups(self) -> None:
+        selected = Order.objects.order_by('id').values_list('id', flat=True)[:2]
+        self.client.post('/admin/app/order/', {'action': 'mark_canceled', '_selected_action': list(selected)})
+
+        self.assertEqual(Order.objects.filter(status='Canceled').count(), 2)
+        self.assertCountEqual(sales_report(1, 'status'), [
+            {'status': 'Canceled', 'orders': 2, 'quantity': 3, 'revenue': Decimal('9.00')},
+            {'status': 'Pending', 'orders': 1, 'quantity': 3, 'revenue': Decimal('9.00')},
+        ])
+
+    def test_export_action_streams_csv(self) -> None:
+        selected = Order.objects.order_by('id').values_list('id', flat=True)[:2]
+        response = self.client.post('/admin/app/order/', {'action': 'export_orders_csv',
+                                                          '_selected_action': list(selected)})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[1].split(',')[-2:], ['1', '3.00'])
+
+
+class StockReservationTests(TestCase):
+    """
+    Checks orders take stock when placed and give it back when canceled.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        category = Category.objects.create(name='Category')
+        cls.product = Product.objects.create(name='Tracked', description='Description', price='2.00',
+                                             category=category, stock=3)
+        cls.untracked = Product.objects.create(name='Untracked', description='Description', price='2.00',
+                                               category=category)
+        user = User.objects.create_user(username='customer', password='password')
+        cls.customer = Customer.objects.create(document_id='1', phone='1', address='Address', user=user)
+
+    def stock(self) -> int:
+        return Product.objects.values_list('stock', flat=True).get(pk=self.product.pk)
+
+    def test_order_cannot_take_more_than_the_stock(self) -> None:
+        place_order(self.customer, {self.product.id: 2, self.untracked.id: 10})
+        self.assertEqual(self.stock(), 1)
+
+        with self.assertRaises(OutOfStockError) as raised:
+            place_order(self.customer, {self.product.id: 2, self.untracked.id: 1})
+        self.assertEqual(raised.exception.products, [self.product])
+        self.assertEqual(self.stock(), 1)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_expired_order_releases_its_stock(self) -> None:
+        order = place_order(self.customer, {self.product.id: 3})
+        expiry = Task.objects.get(name='expire_order')
+        self.assertGreater(expiry.run_at, timezone.now())
+
+        tasks.run_task(expiry)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'Canceled')
+        self.assertEqual(self.stock(), 3)
+
+        change_orders_status(Order.objects.filter(pk=order.pk), 'Pending')
+        self.assertEqual(self.stock(), 0)
+        with self.assertRaises(OutOfStockError):
+            place_order(self.customer, {self.product.id: 1})
+
+    def test_checkout_without_stock_returns_to_the_cart(self) -> None:
+        self.client.login(username='customer', password='password')
+        self.client.post(f'/cart/add/{self.product.id}', {'quantity': 4})
+
+        response = self.client.post('/order/confirm/', follow=True)
+        self.assertRedirects(response, '/cart/')
+        self.assertContains(response, 'Not enough stock of Tracked.')
+        self.assertFalse(Order.objects.exists())
+
+    def test_reservation_locks_in_primary_key_order_and_rolls_back(self) -> None:
+        second = Product.objects.create(name='Second', description='Description', price='2.00',
+                                        category=self.product.category, stock=1)
+        with CaptureQueriesContext(connection) as queries:
+            with self.assertRaises(OutOfStockError) as raised:
+                # The cart lists the products in reverse key order, the second one is short.
+                place_order(self.customer, {second.id: 2, self.product.id: 1})
+        self.assertEqual(raised.exception.products, [second])
+        locking = next(query['sql'] for query in queries if query['sql'].startswith('SELECT')
+                       and '"app_product"."stock" IS NOT NULL' in query['sql'])
+        self.assertTrue(locking.endswith('ORDER BY "app_product"."id" ASC'), locking)
+        self.assertFalse(any(query['sql'].startswith('UPDATE "app_product"') for query in queries))
+        self.assertEqual((self.stock(), Product.objects.get(pk=second.pk).stock), (3, 1))
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Task.objects.exists())
+
+    def test_admin_adjusts_the_stock_relatively(self) -> None:
+        User.objects.create_superuser(username='admin', password='password')
+        self.client.login(username='admin', password='password')
+        url = f'/admin/app/product/{self.product.id}/change/'
+        form = self.client.get(url).context['adminform'].form
+        self.assertNotIn('stock', form.fields)
+        data = {name: value for name, value in form.initial.items() if value is not None and name != 'image'}
+        data.update(category=self.product.category_id, image_variants='{}', stock_adjustment=5)
+        # An order takes stock between loading and saving the form.
+        place_order(self.customer, {self.product.id: 2})
+        self.assertRedirects(self.client.post(url, data), '/admin/app/product/')
+        self.assertEqual(self.stock(), 6)
+
+        data['stock_adjustment'] = -7
+        self.assertEqual(self.client.post(url, data).status_code, 200)
+        self.assertEqual(self.stock(), 6)
+        # New products are created with their initial stock.
+        self.assertContains(self.client.get('/admin/app/product/add/'), 'name="stock"')
+
+    def test_admin_keeps_the_status_without_stock(self) -> None:
+        order = place_order(self.customer, {self.product.id: 2})
+        change_orders_status(Order.objects.filter(pk=order.pk), 'Canceled')
+        place_order(self.customer, {self.product.id: 2})
+        User.objects.create_superuser(username='admin', password='password')
+        self.client.login(username='admin', password='password')
+        url = f'/admin/app/order/{order.id}/change/'
+        response = self.client.get(url)
+        formset = response.context['inline_admin_formsets'][0].formset
+        data = {'customer': self.customer.id, 'status': 'Delivered',
+                **{f'{formset.prefix}-{name}': value for name, value in formset.management_form.initial.items()},
+                **{form.add_prefix(name): value for form in formset for name, value in
+                   (('id', form.instance.pk), ('order', order.pk))}}
+
+        response = self.client.post(url, data, follow=True)
+        self.assertContains(response, 'Not enough stock of Tracked. The order stays canceled.')
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'Canceled')
+        self.assertEqual(self.stock(), 1)
+
+
+class OrderNumberTests(TestCase):
+    """
+    Checks order numbers come from disjoint per-worker blocks and resubmitted checkouts place one order.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        category = Category.objects.create(name='Category')
+        cls.product = Product.objects.create(name='Product', description='Description', price='2.00',
+                                             category=category, stock=5, image='products/product.jpg')
+        user = User.objects.create_user(username='customer', password='password')
+        cls.customer = Customer.objects.create(document_id='1', phone='1', address='Address', user=user)
+
+    def allocate(self, allocator: OrderNumberAllocator) -> str:
+        # The test runs in a transaction, the rest of a block is served once the reservation commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            return allocator.next()
+
+    @override_settings(ORDER_NUMBER_BLOCK_SIZE=2)
+    def test_workers_allocate_disjoint_blocks(self) -> None:
+        first, second = OrderNumberAllocator(), OrderNumberAllocator()
+        numbers = [self.allocate(allocator) for allocator in (first, second, first, first, second)]
+
+        prefix = f"PED-{timezone.localdate().strftime('%Y%m%d')}-"
+        self.assertEqual(numbers, [prefix + suffix for suffix in
+                                   ('0000001', '0000003', '0000002', '0000005', '0000004')])
+
+    @override_settings(ORDER_NUMBER_BLOCK_SIZE=5)
+    def test_block_of_a_rolled_back_transaction_is_not_served(self) -> None:
+        allocator = OrderNumberAllocator()
+        with self.captureOnCommitCallbacks(execute=True), self.assertRaises(EmptyOrderError):
+            with transaction.atomic():
+                number = allocator.next()
+                raise EmptyOrderError()
+        # The reservation was rolled back with the caller, its numbers are reserved again.
+        self.assertEqual(self.allocate(allocator), number)
+        self.assertEqual(self.allocate(OrderNumberAllocator()), number[:-7] + '0000006')
+
+    def test_checkout_tokens_are_unique_per_customer(self) -> None:
+        order = place_order(self.customer, {self.product.id: 1}, checkout_token='token')
+        user = User.objects.create_user(username='other', password='password')
+        other = Customer.objects.create(document_id='2', phone='1', address='Address', user=user)
+        self.assertNotEqual(place_order(other, {self.product.id: 1}, checkout_token='token'), order)
+
+        # A concurrent resubmission loses the race on the constraint and returns the placed order.
+        with patch('app.orders._placed_order', side_effect=[None, order]):
+            self.assertEqual(place_order(self.customer, {self.product.id: 1}, checkout_token='token'), order)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(Product.objects.values_list('stock', flat=True).get(pk=self.product.pk), 3)
+
+    def test_resubmitted_checkout_returns_the_same_order(self) -> None:
+        self.client.login(username='customer', password='password')
+        token = self.client.get('/order/register/').context['checkout_token']
+        self.client.post(f'/cart/add/{self.product.id}', {'quantity': 2})
+
+        first = self.client.post('/order/confirm/', {'checkout_token': token})
+        second = self.client.post('/order/confirm/', {'checkout_token': token})
+
+        self.assertEqual(first.context['order'], second.context['order'])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Product.objects.values_list('stock', flat=True).get(pk=self.product.pk), 3)
+
+
+@patch('paypal.standard.ipn.models.PayPalIPN._postback', return_value=b'VERIFIED')
+class PaymentReconciliationTests(TestCase):
+    """
+    Posts IPNs to the PayPal endpoint with the PayPal postback stubbed and reconciles them in a batch.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        category = Category.objects.create(name='Category')
+        cls.product = Product.objects.create(name='Product', description='Description', price='2.00',
+                                             category=category, stock=10)
+        user = User.objects.create_user(username='customer', password='password')
+        cls.customer = Customer.objects.create(document_id='1', phone='1', address='Address', user=user)
+
+    def ipn(self, order_number: str, payment_status: str, amount: str, txn_id: str, currency: str = 'USD') -> None:
+        response = self.client.post('/paypal/', urlencode({
+            'invoice': order_number, 'payment_status': payment_status, 'mc_gross': amount, 'mc_currency': currency,
+            'txn_id': txn_id, 'txn_type': 'web_accept', 'receiver_email': settings.PAYPAL_RECEIVER_EMAIL,
+            'charset': 'utf-8',
+        }), content_type='application/x-www-form-urlencoded')
+        self.assertEqual(response.status_code, 200)
+
+    def test_ipns_are_applied_in_one_batch(self, postback) -> None:
+        paid = place_order(self.customer, {self.product.id: 2})
+        underpaid = place_order(self.customer, {self.product.id: 1})
+        refunded = place_order(self.customer, {self.product.id: 3})
+
+        self.ipn(paid.order_number, 'Completed', '4.00', 'TXN1')
+        self.ipn(underpaid.order_number, 'Completed', '0.01', 'TXN2')
+        self.ipn('PED-UNKNOWN', 'Completed', '1.00', 'TXN3')
+        self.ipn(refunded.order_number, 'Completed', '6.00', 'TXN4')
+        self.ipn(refunded.order_number, 'Refunded', '-6.00', 'TXN5')
+
+        # The endpoint leaves the orders alone and queues a single reconciliation.
+        self.assertEqual(set(Order.objects.values_list('status', flat=True)), {'Pending'})
+        reconciliation = Task.objects.get(name='reconcile_payments')
+        self.assertTrue(tasks.run_task(reconciliation))
+
+        self.assertEqual(dict(Order.objects.values_list('order_number', 'status')), {
+            paid.order_number: 'Delivered', underpaid.order_number: 'Pending', refunded.order_number: 'Canceled',
+        })
+        self.assertEqual(Product.objects.values_list('stock', flat=True).get(pk=self.product.pk), 7)
+        self.assertEqual(list(IpnReconciliation.objects.order_by('ipn_id').values_list('status', flat=True)),
+                         ['Delivered', '', '', 'Delivered', 'Canceled'])
+        self.assertTrue(Task.objects.filter(name='send_order_confirmation_email',
+                                            payload={'order_id': paid.id}).exists())
+        self.assertEqual(reconcile_payments(), 0)
+
+    def test_ipn_in_another_currency_is_ignored(self, postback) -> None:
+        order = place_order(self.customer, {self.product.id: 2})
+        self.ipn(order.order_number, 'Completed', '4.00', 'TXN1', currency='EUR')
+        self.assertEqual(reconcile_payments(), 1)
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'Pending')
+        self.assertEqual(IpnReconciliation.objects.get().note, 'Paid in EUR for an order in USD.')
+        self.assertFalse(Task.objects.filter(name='send_order_confirmation_email').exists())
+
+
+class AccountTests(TestCase):
+    """
+    Checks the account page lists the order history in the same queries whatever its size.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        category = Category.objects.create(name='Category')
+        cls.products = [Product.objects.create(name=f'Product {number}', description='Description', price='2.00',
+                                               category=category) for number in range(3)]
+        user = User.objects.create_user(username='customer', password='password')
+        cls.customer = Customer.objects.create(document_id='1', phone='1', address='Address', user=user)
+
+    def setUp(self) -> None:
+        self.client.login(username='customer', password='password')
+
+    def place_orders(self, count: int) -> None:
+        for _ in range(count):
+            place_order(self.customer, {product.id: 1 for product in self.products})
+
+    @override_settings(ORDER_HISTORY_PAGE_SIZE=5)
+    def test_history_queries_do_not_grow_with_orders(self) -> None:
+        self.place_orders(2)
+        # User, customer, orders page and their details with products.
+        self.client.get('/users/account/')
+        with self.assertNumQueries(4):
+            self.client.get('/users/account/')
+
+        self.place_orders(10)
+        with self.assertNumQueries(4):
+            response = self.client.get('/users/account/')
+        self.assertEqual(len(response.context['orders']), 5)
+        self.assertContains(response, '1 x Product 2')
+
+        older = self.client.get('/users/account/' + response.context['next_url']())
+        self.assertEqual(len(older.context['orders']), 5)
+        self.assertNotEqual(older.context['orders'].object_list[0], response.context['orders'].object_list[0])
+
+
+class StaticFilesTests(SimpleTestCase):
+    """
+    Checks collected assets are hashed, precompressed and served without reaching Django.
+    """
+
+    def setUp(self) -> None:
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        os.makedirs(os.path.join(self.root.name, 'static', 'css'))
+        os.makedirs(os.path.join(self.root.name, 'media'))
+        with open(os.path.join(self.root.name, 'static', 'css', 'site.css'), 'w') as file:
+            file.write('body { background: url(missing.png); }\n' * 50)
+        os.makedirs(os.path.join(self.root.name, 'media', 'products', 'derived'))
+        for name in ('photo.jpg', 'products/derived/0123456789abcdef-160.jpeg'):
+            with open(os.path.join(self.root.name, 'media', name), 'wb') as file:
+                file.write(b'jpeg')
+
+        storage = CompressedManifestStaticFilesStorage(location=os.path.join(self.root.name, 'static'))
+        list(storage.post_process({'css/site.css': (storage, 'css/site.css')}))
+        self.hashed_name = storage.stored_name('css/site.css')
+
+        async def django(scope, receive, send) -> None:
+            await send({'type': 'http.response.start', 'status': 404, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b''})
+        self.application = StaticFilesApplication(django, '/static/', os.path.join(self.root.name, 'static'),
+                                                  '/media/', os.path.join(self.root.name, 'media'))
+
+    def request(self, path: str, headers: dict = None, extensions: dict = None) -> tuple[int, dict, list]:
+        messages = []
+
+        async def receive() -> dict:
+            return {'type': 'http.request'}
+
+        async def send(message: dict) -> None:
+            messages.append(message)
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'extensions': extensions or {},
+                 'headers': [(name.encode(), value.encode()) for name, value in (headers or {}).items()]}
+        async_to_sync(self.application)(scope, receive, send)
+        return messages[0]['status'], {name.decode(): value.decode() for name, value in messages[0]['headers']}, \
+            messages[1:]
+
+    def test_serves_the_precompressed_variant(self) -> None:
+        status, headers, body = self.request(f'/static/{self.hashed_name}', {'accept-encoding': 'gzip, deflate'})
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['content-encoding'], 'gzip')
+        self.assertEqual(headers['vary'], 'Accept-Encoding')
+        self.assertIn('immutable', headers['cache-control'])
+        self.assertIn(b'url(missing.png)', gzip.decompress(b''.join(message['body'] for message in body)))
+
+        status, headers, body = self.request(f'/static/{self.hashed_name}', extensions={'http.response.pathsend': {}})
+        self.assertNotIn('content-encoding', headers)
+        self.assertEqual(body, [{'type': 'http.response.pathsend',
+                                 'path': os.path.join(os.path.realpath(self.root.name), 'static', self.hashed_name)}])
+
+        status, headers, _ = self.request(f'/static/{self.hashed_name}', {'if-none-match': headers['etag']})
+        self.assertEqual(status, 304)
+
+    def test_accept_encoding_quality_values(self) -> None:
+        url = f'/static/{self.hashed_name}'
+        for accept_encoding, encoding in (('gzip;q=0, deflate', None), ('GZIP;q=0.5', 'gzip'), ('x-gzip', None),
+                                          ('br;q=0, gzip', 'gzip'), ('*, br;q=0', 'gzip'), ('*;q=0', None), ('', None)):
+            with self.subTest(accept_encoding=accept_encoding):
+                headers = self.request(url, {'accept-encoding': accept_encoding})[1]
+                self.assertEqual(headers.get('content-encoding'), encoding)
+
+    def test_every_encoding_has_its_own_etag(self) -> None:
+        url = f'/static/{self.hashed_name}'
+        gzip_etag = self.request(url, {'accept-encoding': 'gzip'})[1]['etag']
+        identity_etag = self.request(url)[1]['etag']
+        self.assertNotEqual(gzip_etag, identity_etag)
+
+        self.assertEqual(self.request(url, {'accept-encoding': 'gzip', 'if-none-match': gzip_etag})[0], 304)
+        # A cached gzip body does not validate the identity one.
+        status, headers, _ = self.request(url, {'if-none-match': gzip_etag})
+        self.assertEqual((status, headers['etag']), (200, identity_etag))
+
+    def test_media_and_unknown_paths(self) -> None:
+        status, headers, _ = self.request('/media/photo.jpg')
+        self.assertEqual((status, headers['content-type']), (200, 'image/jpeg'))
+        self.assertNotIn('immutable', headers['cache-control'])
+        derivative = self.request('/media/products/derived/0123456789abcdef-160.jpeg')[1]
+        self.assertIn('immutable', derivative['cache-control'])
+        with patch('config.static.os.stat', wraps=os.stat) as stat:
+            self.assertEqual(self.request('/media/photo.jpg')[0], 200)
+        stat.assert_not_called()
+        with patch('config.static.time.monotonic', return_value=time.monotonic() + MEDIA_STAT_TTL + 1):
+            os.remove(os.path.join(self.root.name, 'media', 'photo.jpg'))
+            self.assertEqual(self.request('/media/photo.jpg')[0], 404)
+        self.assertEqual(self.request('/media/../static/css/site.css')[0], 404)
+        self.assertEqual(self.request('/static/css/unknown.css')[0], 404)
+
+
+@skipUnless(find_spec('jinja2'), 'Jinja2 is not installed.')
+class TemplateEngineTests(TestCase):
+    """
+    Checks the Jinja2 storefront templates render the same HTML as the Django ones.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        category = Category.objects.create(name='Shoes & Boots')
+        cls.products = [Product.objects.create(name=f'Product <{number}>', description='Description', price='12.50',
+                                               category=category, image='products/product.jpg')
+                        for number in range(3)]
+
+    @staticmethod
+    def normalize(html: str) -> str:
+        # CSRF tokens are masked differently on every render.
+        html = re.sub(r'(csrf-token" content|csrfmiddlewaretoken" value)="[^"]+"', r'\1=""', html)
+        return ' '.join(html.split())
+
+    def test_engines_render_the_same_html(self) -> None:
+        context, request = template_context()
+        for name in BENCHMARK_TEMPLATES:
+            with self.subTest(template=name):
+                django = engines['django'].get_template(name).render(context, request)
+                jinja2 = engines['jinja2'].get_template(name).render(context, request)
+                self.assertEqual(self.normalize(jinja2), self.normalize(django))
+                self.assertNotIn('<0>', jinja2)
+
+    def test_views_render_with_jinja2(self) -> None:
+        with override_settings(CATALOG_TEMPLATE_ENGINE='jinja2'):
+            catalog = self.client.get('/')
+            product = self.client.get(f'/products/{self.products[0].id}')
+        self.assertContains(catalog, 'Product &lt;2&gt;')
+        self.assertContains(catalog, 'Shoes &amp; Boots')
+        self.assertContains(product, 'name="csrfmiddlewaretoken"')
+
+    def test_benchmark_reports_every_engine(self) -> None:
+        report = benchmark_templates(iterations=2)
+        self.assertEqual(set(report), {'django', 'jinja2'})
+        self.assertEqual(set(report['jinja2']), set(BENCHMARK_TEMPLATES))
+
+
+@override_settings(PRODUCT_IMAGE_SYNC=True)
+class CatalogImportExportTests(TestCase):
+    """
+    Checks catalog files are upserted by SKU in batches and exported back.
+    """
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        Category.objects.create(name='Shoes')
+
+    def write(self, name: str, content: str) -> str:
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as file:
+            file.write(content)
+        return path
+
+    def test_import_upserts_by_sku(self) -> None:
+        path = self.write('catalog.csv', 'sku,name,description,price,stock,category,image\n'
+                                         'A-1,Boot,Leather boot,10.5,3,Shoes,\n'
+                                         'A-2,Hat,Wool hat,5,,Hats,\n'
+                                         'A-3,Broken,,not a price,1,Hats,\n'
+                                         'A-1,Boot v2,Leather boot,12,4,Shoes,\n')
+        output, errors = StringIO(), StringIO()
+        call_command('import_catalog', path, '--batch-size', '2', stdout=output, stderr=errors)
+        self.assertIn('Imported 3 products', output.getvalue())
+        self.assertIn("Line 4: Invalid price 'not a price'.", errors.getvalue())
+        # Rows of the same SKU in different batches update the product created by the first one.
+        boot = Product.objects.get(sku='A-1')
+        self.assertEqual((boot.name, boot.price, boot.stock, boot.category.name), ('Boot v2', Decimal('12.00'), 4, 'Shoes'))
+        # A new product with an empty stock cell is not tracked.
+        self.assertIsNone(Product.objects.get(sku='A-2').stock)
+        self.assertEqual(Category.objects.count(), 2)
+        self.assertEqual(search_product_ids('boot'), [boot.id])
+
+        # JSON lines may leave columns out, those keep their values.
+        path = self.write('update.jsonl', '{"sku": "A-2", "name": "Cap", "price": "6", "category": "Hats"}\n{oops\n')
+        call_command('import_catalog', path, stdout=StringIO(), stderr=StringIO())
+        hat = Product.objects.get(sku='A-2')
+        self.assertEqual((hat.name, hat.description, hat.price), ('Cap', 'Wool hat', Decimal('6.00')))
+        self.assertEqual(Product.objects.count(), 2)
+
+        # Empty stock and image cells keep the stock and the image of an existing product.
+        Product.objects.filter(sku='A-1').update(image='products/boot.jpg')
+        path = self.write('restock.csv', 'sku,name,price,stock,category,image\nA-1,Boot v3,12,,Shoes,\n')
+        call_command('import_catalog', path, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(Product.objects.values_list('name', 'stock', 'image').get(sku='A-1'),
+                         ('Boot v3', 4, 'products/boot.jpg'))
+
+    def test_import_reports_the_first_errors(self) -> None:
+        path = self.write('broken.csv', 'sku,name,price,category\n' + 'B-1,Broken,free,Shoes\n' * 3)
+        output, errors = StringIO(), StringIO()
+        with patch('app.catalog_io.MAX_ERRORS', 2):
+            call_command('import_catalog', path, stdout=output, stderr=errors)
+        self.assertEqual(errors.getvalue().splitlines(), ["Line 2: Invalid price 'free'.",
+                                                          "Line 3: Invalid price 'free'.", '1 more invalid rows.'])
+        self.assertIn('skipped 3 rows', output.getvalue())
+
+    def test_import_attaches_images(self) -> None:
+        source_dir = os.path.join(self.directory.name, 'images')
+        os.makedirs(os.path.join(source_dir, 'winter'))
+        with override_settings(MEDIA_ROOT=os.path.join(self.directory.name, 'media')):
+            # An unrelated upload already uses the plain file name.
+            default_storage.save('products/boot.jpg', ContentFile(b'other'))
+            Image.new('RGB', (40, 20), 'red').save(os.path.join(source_dir, 'boot.jpg'))
+            Image.new('RGB', (40, 20), 'blue').save(os.path.join(source_dir, 'winter', 'boot.jpg'))
+            path = self.write('catalog.csv', 'sku,name,price,category,image\nA-1,Boot,10,Shoes,boot.jpg\n'
+                                             'A-2,Boot 2,10,Shoes,boot.jpg\nA-3,Boot 3,10,Shoes,winter/boot.jpg\n')
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                call_command('import_catalog', path, '--images', source_dir, stdout=StringIO())
+            first, second, winter = Product.objects.order_by('id')
+            self.assertRegex(first.image.name, r'^products/boot-[0-9a-f]{16}\.jpg$')
+            self.assertEqual(second.image.name, first.image.name)
+            self.assertRegex(winter.image.name, r'^products/boot-[0-9a-f]{16}\.jpg$')
+            self.assertNotEqual(winter.image.name, first.image.name)
+            with default_storage.open('products/boot.jpg') as file:
+                self.assertEqual(file.read(), b'other')
+            # Both products sharing an image get its derivatives generated once.
+            self.assertEqual([callback.args for callback in callbacks if getattr(callback, 'func', None) is images.process_images],
+                             [({first.image.name: [first.id, second.id], winter.image.name: [winter.id]},)])
+            for product in (first, second, winter):
+                self.assertEqual(product.image_variants['source'], product.image.name)
+
+    def test_export_round_trip(self) -> None:
+        category = Category.objects.get(name='Shoes')
+        Product.objects.create(sku='A-1', name='Boot, "classic"', description='Line\nbreak', price='10.00',
+                               stock=2, category=category)
+        for format in ('csv', 'jsonl'):
+            with self.subTest(format=format):
+                path = os.path.join(self.directory.name, f'catalog.{format}')
+                call_command('export_catalog', path, stdout=StringIO())
+                Product.objects.update(name='Changed', stock=None)
+                call_command('import_catalog', path, stdout=StringIO())
+                product = Product.objects.get()
+                self.assertEqual((product.name, product.description, product.stock),
+                                 ('Boot, "classic"', 'Line\nbreak', 2))
+
+
+class ProductImageTests(TestCase):
+    """
+    Checks the image derivatives are generated by the task workers and rendered as srcsets.
+    """
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name, PRODUCT_IMAGE_WIDTHS=[20, 40])
+        media.enable()
+        self.addCleanup(media.disable)
+        buffer = BytesIO()
+        Image.new('RGB', (30, 10), 'red').save(buffer, 'JPEG')
+        self.name = default_storage.save('products/boot.jpg', ContentFile(buffer.getvalue()))
+        self.category = Category.objects.create(name='Shoes')
+
+    def test_saving_a_product_queues_one_task_per_batch(self) -> None:
+        boot = Product.objects.create(name='Boot', description='Description', price=10, category=self.category,
+                                      image=self.name)
+        queued = Task.objects.get(name='process_images')
+        self.assertEqual(queued.payload, {'images': {self.name: [boot.id]}})
+
+        with patch('app.images.bump_catalog_version') as bump:
+            self.assertTrue(all(tasks.run_task(claimed) for claimed in tasks.claim_tasks(10)))
+        bump.assert_called_once_with()
+
+        boot.refresh_from_db()
+        # Widths above the original are capped to it.
+        self.assertEqual(set(boot.image_variants['jpeg']), {'20', '30'})
+        self.assertEqual(set(boot.image_variants['webp']), {'20', '30'})
+        for path in boot.image_variants['jpeg'].values():
+            self.assertTrue(default_storage.exists(path))
+        with default_storage.open(boot.image_variants['jpeg']['20']) as derivative, Image.open(derivative) as image:
+            self.assertEqual(image.size, (20, 7))
+
+    def test_admin_save_keeps_the_derivatives_stored_meanwhile(self) -> None:
+        boot = Product.objects.create(name='Boot', description='Description', price=10, category=self.category,
+                                      image=self.name)
+        User.objects.create_superuser(username='admin', password='password')
+        self.client.login(username='admin', password='password')
+        url = f'/admin/app/product/{boot.id}/change/'
+        form = self.client.get(url).context['adminform'].form
+        data = {name: value for name, value in form.initial.items() if value is not None and name != 'image'}
+        data.update(name='Boot v2', category=self.category.id)
+        get_object = ProductAdmin.get_object
+
+        def load_then_process(*args, **kwargs) -> Product:
+            # The derivatives are stored between loading and saving the product.
+            product = get_object(*args, **kwargs)
+            images.process_images({self.name: [boot.id]})
+            return product
+
+        with patch.object(ProductAdmin, 'get_object', load_then_process):
+            self.assertRedirects(self.client.post(url, data), '/admin/app/product/')
+        boot.refresh_from_db()
+        self.assertEqual(boot.name, 'Boot v2')
+        self.assertEqual(set(boot.image_variants['jpeg']), {'20', '30'})
+
+    def test_transparency_is_kept_in_webp_and_white_in_jpeg(self) -> None:
+        buffer = BytesIO()
+        Image.new('RGBA', (20, 20), (255, 0, 0, 0)).save(buffer, 'PNG')
+        name = default_storage.save('products/logo.png', ContentFile(buffer.getvalue()))
+        variants = images.generate_variants(name)
+
+        with default_storage.open(variants['webp']['20']) as derivative, Image.open(derivative) as image:
+            self.assertEqual(image.convert('RGBA').getpixel((10, 10))[3], 0)
+        with default_storage.open(variants['jpeg']['20']) as derivative, Image.open(derivative) as image:
+            self.assertTrue(all(channel > 250 for channel in image.getpixel((10, 10))))
+
+    def test_picture_renders_srcsets(self) -> None:
+        boot = Product.objects.create(name='Boot', description='Description', price=10, category=self.category,
+                                      image=self.name)
+        template = engines['django'].from_string('{% load product_images %}{% product_picture product width=25 %}')
+        self.assertEqual(template.render({'product': boot}), f'<img src="/media/{self.name}" alt="Boot" loading="lazy">')
+
+        images.process_images({self.name: [boot.id]})
+        boot.refresh_from_db()
+        html = template.render({'product': boot})
+        jpeg, webp = boot.image_variants['jpeg'], boot.image_variants['webp']
+        self.assertIn(f'<source type="image/webp" srcset="/media/{webp["20"]} 20w, /media/{webp["30"]} 30w"', html)
+        self.assertIn(f'<img src="/media/{jpeg["30"]}" srcset="/media/{jpeg["20"]} 20w, /media/{jpeg["30"]} 30w"', html)
+
+
+class OrderExportTests(TestCase):
+    """
+    Checks the orders CSV export is streamed in chunks of constant queries and filtered.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        category = Category.objects.create(name='Category')
+        products = [Product.objects.create(name=f'Product {number}', description='Description', price='2.00',
+                                           sku=f'SKU-{number}', category=category) for number in range(2)]
+        user = User.objects.create_user(username='customer', password='password', first_name='Ana',
+                                        last_name='Diaz', email='ana@example.com')
+        customer = Customer.objects.create(document_id='1', phone='1', address='Address', user=user)
+        cls.orders = [place_order(customer, {product.id: 1 for product in products}) for _ in range(5)]
+        change_orders_status(Order.objects.filter(pk=cls.orders[0].pk), 'Canceled')
+        User.objects.create_user(username='staff', password='password', is_staff=True)
+
+    def setUp(self) -> None:
+        self.client.login(username='staff', password='password')
+
+    def rows(self, response) -> list[list[str]]:
+        return list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+
+    @override_settings(ORDER_EXPORT_CHUNK_SIZE=2)
+    def test_export_streams_chunks(self) -> None:
+        response = self.client.get('/reports/orders.csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        # Orders and lines of 3 chunks, plus the empty chunk ending the export.
+        with self.assertNumQueries(7):
+            rows = self.rows(response)
+        self.assertEqual(rows[0][:3], ['order_number', 'created_at', 'status'])
+        self.assertEqual(len(rows), 11)
+        self.assertEqual(rows[1][0], self.orders[0].order_number)
+        self.assertEqual(rows[1][2:10], ['Canceled', '1', 'Ana Diaz', 'ana@example.com', '4.00',
+                                         str(self.orders[0].details.first().product_id), 'SKU-0', 'Product 0'])
+
+    def test_order_without_lines_is_exported(self) -> None:
+        empty = Order.objects.create(order_number='PED-EMPTY', customer=self.orders[0].customer)
+        rows = self.rows(self.client.get('/reports/orders.csv'))
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(rows[-1][0], empty.order_number)
+        self.assertEqual(rows[-1][6:], ['0.00', '', '', '', '', ''])
+
+    def test_formulas_are_exported_as_text(self) -> None:
+        customer = self.orders[0].customer
+        User.objects.filter(pk=customer.user_id).update(first_name='=HYPERLINK("http://example.com")', last_name='',
+                                                       email='@SUM(A1)')
+        Customer.objects.filter(pk=customer.pk).update(document_id='-1+1')
+        rows = self.rows(self.client.get('/reports/orders.csv'))
+        self.assertEqual(rows[1][3:6], ["'-1+1", '\'=HYPERLINK("http://example.com")', "'@SUM(A1)"])
+
+    def test_export_filters(self) -> None:
+        today = timezone.localdate()
+        self.assertEqual(len(self.rows(self.client.get('/reports/orders.csv', {'status': 'Canceled'}))), 3)
+        self.assertEqual(len(self.rows(self.client.get('/reports/orders.csv', {'since': today, 'until': today}))), 11)
+        self.assertEqual(len(self.rows(self.client.get('/reports/orders.csv', {'until': today - timedelta(days=1)}))), 1)
+        self.assertEqual(self.client.get('/reports/orders.csv', {'since': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get('/reports/orders.csv', {'status': 'Lost'}).status_code, 400)
+
+        self.client.logout()
+        self.assertEqual(self.client.get('/reports/orders.csv').status_code, 302)
+
+    @override_settings(ROOT_URLCONF='config.async_urls')
+    async def test_export_is_async_under_asgi(self) -> None:
+        client = AsyncClient()
+        await sync_to_async(client.force_login)(await User.objects.aget(username='staff'))
+        response = await client.get('/reports/orders.csv', {'status': 'Pending'})
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(content.decode().splitlines()), 9)
+
+
+class RelatedProductsTests(TestCase):
+    """
+    Checks related products are ranked by co-purchases, refreshed by placed orders and served with a fallback.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        shoes, hats = Category.objects.create(name='Shoes'), Category.objects.create(name='Hats')
+        cls.boot, cls.sandal, cls.sneaker = (Product.objects.create(name=name, description='Description', price='2.00',
+                                                                    category=shoes, image='products/product.jpg')
+                                             for name in ('Boot', 'Sandal', 'Sneaker'))
+        cls.cap = Product.objects.create(name='Cap', description='Description', price='2.00', category=hats,
+                                         image='products/product.jpg')
+        user = User.objects.create_user(username='customer', password='password')
+        cls.customer = Customer.objects.create(document_id='1', phone='1', address='Address', user=user)
+        for products in ((cls.boot, cls.cap), (cls.boot, cls.cap), (cls.boot, cls.sandal), (cls.cap, cls.sandal)):
+            place_order(cls.customer, {product.id: 1 for product in products})
+
+    def related(self) -> set[tuple]:
+        return set(RelatedProduct.objects.values_list('product_id', 'related_id', 'score', 'rank'))
+
+    def test_rebuild_ranks_co_purchases(self) -> None:
+        self.assertEqual(recommendations.rebuild_related_products(), 6)
+        self.assertEqual(self.related(), {
+            (self.boot.id, self.cap.id, 2, 0), (self.boot.id, self.sandal.id, 1, 1),
+            (self.cap.id, self.boot.id, 2, 0), (self.cap.id, self.sandal.id, 1, 1),
+            (self.sandal.id, self.boot.id, 1, 0), (self.sandal.id, self.cap.id, 1, 1),
+        })
+        with patch.object(recommendations, 'np', None):
+            numpy_rows = self.related()
+            recommendations.rebuild_related_products()
+            self.assertEqual(self.related(), numpy_rows)
+
+    def test_placed_orders_refresh_their_products(self) -> None:
+        recommendations.rebuild_related_products()
+        place_order(self.customer, {self.sandal.id: 1, self.cap.id: 1})
+        order = place_order(self.customer, {self.sandal.id: 1, self.cap.id: 1})
+        # Orders of the same window share one task, queued with the order tasks in one INSERT.
+        Task.objects.filter(payload__order_id=order.id).delete()
+        with self.assertNumQueries(1):
+            tasks.order_placed(order)
+        queued = Task.objects.filter(name='refresh_related_products')
+        self.assertLessEqual(len(queued), 2)
+        self.assertTrue(all(tasks.run_task(task) for task in queued))
+        self.assertEqual(RelatedProduct.objects.get(product=self.sandal, rank=0).related_id, self.cap.id)
+        self.assertEqual(RelatedProduct.objects.get(product=self.cap, rank=0).score, 3)
+
+    def test_product_page_shows_related_products(self) -> None:
+        recommendations.rebuild_related_products()
+        self.assertEqual(recommendations.get_related_products(self.boot), [self.cap, self.sandal, self.sneaker])
+        response = self.client.get(f'/products/{self.boot.id}')
+        self.assertContains(response, 'Related Products')
+        self.assertContains(response, f'href="/products/{self.cap.id}"')
+        # Without co-purchases the newest products of the same category are shown.
+        with self.assertNumQueries(2):
+            self.assertEqual(recommendations.get_related_products(self.sneaker), [self.sandal, self.boot])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'SQLite serializes writers with a database lock.')
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """
+    Races many checkouts of the same products, which must neither oversell nor deadlock.
+    """
+
+    def test_concurrent_checkouts_never_oversell(self) -> None:
+        category = Category.objects.create(name='Category')
+        first = Product.objects.create(name='First', description='Description', price=1, category=category, stock=10)
+        second = Product.objects.create(name='Second', description='Description', price=1, category=category,
+                                        stock=10)
+        customers = []
+        for number in range(40):
+            user = User.objects.create_user(username=f'customer{number}', password='password')
+            customers.append(Customer.objects.create(document_id=str(number), phone='1', address='A', user=user))
+
+        def checkout(number: int) -> str:
+            close_old_connections()
+            # Half of the carts list the products the other way round.
+            quantities = {first.id: 1, second.id: 1} if number % 2 else {second.id: 1, first.id: 1}
+            try:
+                place_order(customers[number], quantities)
+                return 'placed'
+            except OutOfStockError:
+                return 'out of stock'
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            outcomes = list(executor.map(checkout, range(40), timeout=30))
+
+        self.assertEqual(outcomes.count('placed'), 10)
+        self.assertEqual(outcomes.count('out of stock'), 30)
+        self.assertEqual(set(Product.objects.values_list('stock', flat=True)), {0})
+        self.assertEqual(Order.objects.count(), 10)
@@ -6,7 +6,8 @@ Url router for the main application.
 from django.urls import path
 
 # Project imports.
-from app import views
+from app import views, api
+from app.instrumentation import metrics_view
 
 
 app_name = 'app'
@@ -14,12 +15,15 @@ app_name = 'app'
 urlpatterns = [
     path('', views.index, name='index'),
     path('products/category/<int:category_id>', views.products_by_category, name='products_by_category'),
+    path('products/search/suggest', views.search_suggestions, name='search_suggestions'),
     # path('products/filter', views.products_by_name, name='products_by_name'),
     path('products/<int:product_id>', views.get_product_by_id, name='product_details'),
     path('cart/', views.get_cart, name='cart'),
     path('cart/add/<int:product_id>', views.add_to_cart, name='add_to_cart'),
     path('cart/remove/<int:product_id>', views.remove_from_cart, name='remove_from_cart'),
     path('cart/clear/', views.clear_cart, name='clear_cart'),
+    path('api/cart/', api.cart, name='api_cart'),
+    path('api/cart/items/<int:product_id>', api.cart_item, name='api_cart_item'),
     path('users/login/', views.login_user, name='login_user'),
     path('users/logout/', views.logout_user, name='logout_user'),
     path('users/create/', views.create_user, name='create_user'),
@@ -27,4 +31,7 @@ urlpatterns = [
     path('order/register/', views.register_order, name='register_order'),
     path('order/confirm/', views.confirm_order, name='confirm_order'),
     path('order/thanks/', views.thanks, name='thanks'),
+    path('reports/sales/', views.sales_report_view, name='sales_report'),
+    path('reports/orders.csv', views.order_export_view, name='order_export'),
+    path('metrics', metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -2,42 +2,130 @@
 Views for the product catalog.
 """
 
+# Python imports.
+import secrets
+from datetime import date
+from typing import Optional
+from urllib.parse import urlencode
+
 # Django imports.
-from django.shortcuts import render, redirect
+from django.conf import settings
+from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
-from django.http import HttpRequest, HttpResponse
+from django.http import HttpRequest, HttpResponse, HttpResponseBadRequest, JsonResponse, Http404
+from django.db.models import Prefetch, QuerySet, prefetch_related_objects
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
+from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
+from django.utils.functional import SimpleLazyObject
 from paypal.standard.forms import PayPalPaymentsForm
-from django.core.mail import send_mail
 
 # Project imports.
 from app.models import Category, Product, Customer, Order, OrderDetail
-from app.cart import Cart
+from app.cart import Cart, parse_quantity
+from app.customers import get_customer, set_customer
 from app.forms import CustomerForm
+from app.pagination import CursorPage, RankedPage, get_page_size
+from app.catalog import get_category_summary, get_catalog_version, get_cached_product
+from app.search import search_queryset, search_products
+from app.orders import place_order, EmptyOrderError
+from app.inventory import OutOfStockError
+from app.instrumentation import query_budget
+from app.analytics import sales_report, REPORT_GROUPS
+from app.exports import filter_orders, orders_csv_response
+from app.recommendations import get_related_products
+
+
+# Query parameters of the catalog pages, the cached grid and its page links ignore any other.
+CATALOG_PARAMS = ('name', 'page_size', 'after', 'before')
+
+
+def _catalog_page(request: HttpRequest, products: QuerySet, page_class: type = CursorPage) -> CursorPage:
+    """
+    Returns the (lazy) cursor paginated page of the catalog requested.
+    """
+    return page_class(products.select_related('category'),
+                      after=request.GET.get('after'),
+                      before=request.GET.get('before'),
+                      page_size=get_page_size(request.GET.get('page_size')))
+
+
+def _catalog_json(page: CursorPage) -> JsonResponse:
+    """
+    Returns a page of the catalog as JSON (`?format=json`).
+    """
+    return JsonResponse({
+        'products': [{'id': product.id,
+                      'name': product.name,
+                      'price': str(product.price),
+                      'image': product.image.url if product.image else '',
+                      'category': product.category.name,
+                      'created_at': product.created_at.isoformat()} for product in page],
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+    })
+
+
+def _catalog_fragment_key(request: HttpRequest) -> str:
+    """
+    Returns what the cached catalog grid varies on: the path and the CATALOG_PARAMS of the query string.
+    """
+    return request.path + '?' + urlencode([(name, request.GET[name]) for name in CATALOG_PARAMS
+                                           if name in request.GET])
 
 
+def _catalog_html(request: HttpRequest, page: CursorPage, categories: list[dict]) -> HttpResponse:
+    """
+    Renders a page of the catalog as HTML.
+    """
+    # Lazy values, only evaluated when the catalog fragment is not cached.
+    return render(request, 'index.html', {'products': page,
+                                          'page': page,
+                                          'categories': categories,
+                                          'catalog_version': get_catalog_version(),
+                                          'catalog_cache_timeout': settings.CATALOG_CACHE_TIMEOUT,
+                                          'catalog_fragment_key': _catalog_fragment_key(request),
+                                          'next_url': lambda: page.url(request, 'next', CATALOG_PARAMS),
+                                          'previous_url': lambda: page.url(request, 'previous', CATALOG_PARAMS)},
+                  using=settings.CATALOG_TEMPLATE_ENGINE)
+
+
+def _render_catalog(request: HttpRequest, products: QuerySet, categories: list[dict],
+                    page_class: type = CursorPage) -> HttpResponse:
+    """
+    Renders a cursor paginated page of the catalog as HTML or JSON (`?format=json`).
+    """
+    page = _catalog_page(request, products, page_class)
+    if request.GET.get('format') == 'json':
+        return _catalog_json(page)
+    return _catalog_html(request, page, categories)
+
+
+@query_budget(5)
 def index(request: HttpRequest) -> HttpResponse:
     """
     View function for the product catalog index page
     """
+    categories = get_category_summary()
     if name := request.GET.get('name'):
-        products = Product.objects.filter(name__icontains=name)
-    else:
-        products = Product.objects.all()
-    categories = Category.objects.all()
-    return render(request, 'index.html', {'products': products, 'categories': categories})
+        # Search results are paged by relevance.
+        return _render_catalog(request, search_queryset(name), categories, RankedPage)
+    return _render_catalog(request, Product.objects.all(), categories)
 
 
+@query_budget(5)
 def products_by_category(request: HttpRequest, category_id: int) -> HttpResponse:
     """
     View function for the product catalog by category id.
     """
-    category = Category.objects.get(pk=category_id)
-    products = category.products.all()
-    categories = Category.objects.all()
-    return render(request, 'index.html', {'products': products, 'categories': categories})
+    categories = get_category_summary()
+    if not any(category['id'] == category_id for category in categories):
+        raise Http404('Category not found.')
+    products = Product.objects.filter(category_id=category_id)
+    return _render_catalog(request, products, categories)
 
 
 # def products_by_name(request: HttpRequest) -> HttpResponse:
@@ -51,32 +139,66 @@ def products_by_category(request: HttpRequest, category_id: int) -> HttpResponse
 #     return index()
 
 
-def get_product_by_id(request: HttpRequest, product_id: int) -> HttpResponse:
+@query_budget(4)
+def search_suggestions(request: HttpRequest) -> JsonResponse:
     """
-    View function for the product catalog by product id.
+    View function returning the best ranked prefix matches for typeahead.
     """
-    product = Product.objects.get(pk=product_id)
-    return render(request, 'product.html', {'product': product})
+    limit = getattr(settings, 'SEARCH_SUGGESTIONS', 10)
+    products = search_products(request.GET.get('q', ''), limit=limit)
+    return JsonResponse({'products': [{'id': product.id,
+                                       'name': product.name,
+                                       'price': str(product.price),
+                                       'url': reverse('app:product_details', args=[product.id])}
+                                      for product in products]})
 
 
+@query_budget(4)
+def get_product_by_id(request: HttpRequest, product_id: int) -> HttpResponse:
+    """
+    View function for the product catalog by product id.
+    """
+    try:
+        product = get_cached_product(product_id)
+    except Product.DoesNotExist:
+        raise Http404('Product not found.')
+    # Lazy, only queried when the related products fragment is not cached.
+    related_products = SimpleLazyObject(lambda: get_related_products(product))
+    return render(request, 'product.html', {'product': product,
+                                            'related_products': related_products,
+                                            'catalog_version': get_catalog_version(),
+                                            'catalog_cache_timeout': settings.CATALOG_CACHE_TIMEOUT},
+                  using=settings.CATALOG_TEMPLATE_ENGINE)
+
+
+@query_budget(4)
 def get_cart(request: HttpRequest) -> HttpResponse:
     """
     View function for the cart page
     """
-    return render(request, 'cart.html')
+    # Built here rather than by the context processor, so an unreachable cart storage fails the page.
+    return render(request, 'cart.html', {'cart': Cart(request)})
 
 
+@query_budget(8)
 def add_to_cart(request: HttpRequest, product_id: int) -> HttpResponse:
     """
     View function to add a product to the cart.
     """
-    quantity = int(request.POST.get('quantity', 1))
-    product = Product.objects.get(pk=product_id)
+    try:
+        quantity = parse_quantity(request.POST.get('quantity', 1))
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    product = get_object_or_404(Product, pk=product_id)
     cart = Cart(request)
-    cart.add(product, quantity)
+    try:
+        cart.add(product, quantity)
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
     return redirect(request.META.get('HTTP_REFERER', '/'))
 
 
+@query_budget(4)
 def remove_from_cart(request: HttpRequest, product_id: int) -> HttpResponse:
     """
     View function to remove a product from the cart.
@@ -86,6 +208,7 @@ def remove_from_cart(request: HttpRequest, product_id: int) -> HttpResponse:
     return redirect(request.META.get('HTTP_REFERER', '/'))
 
 
+@query_budget(4)
 def clear_cart(request: HttpRequest) -> HttpResponse:
     """
     View function to clear the cart.
@@ -140,12 +263,27 @@ def create_user(request: HttpRequest) -> HttpResponse:
     return render(request, 'login.html')
 
 
+def _order_history(request: HttpRequest, customer: Optional[Customer]) -> Optional[CursorPage]:
+    """
+    Returns the (lazy) cursor paginated order history of the customer, newest first.
+    """
+    if customer is None:
+        return None
+    details = OrderDetail.objects.select_related('product').order_by('id')
+    return CursorPage(customer.orders.prefetch_related(Prefetch('details', queryset=details)),
+                      after=request.GET.get('after'),
+                      before=request.GET.get('before'),
+                      page_size=settings.ORDER_HISTORY_PAGE_SIZE)
+
+
 @login_required(login_url='/users/login/')
+@query_budget(8)
 def get_account(request: HttpRequest) -> HttpResponse:
     """
-    View function to handle user account.
+    View function to handle user account and its order history.
     """
     user = request.user
+    customer = get_customer(request)
     user_data = {'first_name': user.first_name,
                  'last_name': user.last_name,
                  'email': user.email}
@@ -162,19 +300,25 @@ def get_account(request: HttpRequest) -> HttpResponse:
                     customer_data.pop(field)
             user.save()
 
-            Customer.objects.update_or_create(defaults=customer_data, user=user)
+            customer, _ = Customer.objects.update_or_create(defaults=customer_data, user=user)
+            set_customer(request, customer)
 
-    elif customer := Customer.objects.filter(user=user).first():
+    elif customer:
         user_data['document_id'] = customer.document_id
         user_data['gender'] = customer.gender
         user_data['birthdate'] = customer.birthdate
         user_data['phone'] = customer.phone
         user_data['address'] = customer.address
-        
-    return render(request, 'account.html', {'customer_form': CustomerForm(user_data)})
+
+    orders = _order_history(request, customer)
+    return render(request, 'account.html', {'customer_form': CustomerForm(user_data),
+                                            'orders': orders,
+                                            'next_url': lambda: orders.url(request, 'next'),
+                                            'previous_url': lambda: orders.url(request, 'previous')})
 
 
 @login_required(login_url='/users/login/')
+@query_budget(5)
 def register_order(request: HttpRequest) -> HttpResponse:
     """
     View function to handle order registration.
@@ -184,70 +328,109 @@ def register_order(request: HttpRequest) -> HttpResponse:
                  'last_name': user.last_name,
                  'email': user.email}
     
-    if customer := Customer.objects.filter(user=user).first():
+    if customer := get_customer(request):
         user_data['phone'] = customer.phone
         user_data['address'] = customer.address
     
-    return render(request, 'order.html', {'customer_form': CustomerForm(user_data)})
+    return render(request, 'order.html', {'customer_form': CustomerForm(user_data),
+                                          'checkout_token': secrets.token_hex(16),
+                                          'cart': Cart(request)})
 
 
-login_required(login_url='/users/login/')
+@login_required(login_url='/users/login/')
+@require_POST
+@query_budget(25)
 def confirm_order(request: HttpRequest) -> HttpResponse:
     """
     View function to handle order confirmation.
     """
-    if request.method == 'POST':
-        order_customer = Customer.objects.get(user=request.user)
-        total_amount = float(request.session.get('cart_total_amount'))
-        new_order = Order()
-        new_order.customer = order_customer
-        new_order.total_amount = total_amount
-        new_order.save()
-
-        order_cart = request.session.get('cart')
-        for product_id, product in order_cart.items():
-            detail = OrderDetail()
-            detail.order = new_order
-            detail.product = Product.objects.get(pk=product_id)
-            detail.quantity = product['quantity']
-            detail.subtotal = product['subtotal']
-            detail.save()
-
-        new_order.order_number = 'PED-' + new_order.created_at.strftime('%Y%m%d') + '-' + str(new_order.id)
-        new_order.save()
-
-        request.session['order_id'] = new_order.id
-
-        paypal_dict = {
-            "business": "sb-fhdlw34638368@business.example.com",
-            "amount": total_amount,
-            "item_name": 'Order - ' + new_order.order_number,
-            "invoice": new_order.order_number,
-            "notify_url": request.build_absolute_uri(reverse('paypal-ipn')),
-            "return": request.build_absolute_uri('/order/thanks'),
-            "cancel_return": request.build_absolute_uri('/'),
-        }
-
-        cart = Cart(request)
-        cart.clear()
-
-        paypal_form = PayPalPaymentsForm(initial=paypal_dict)
+    order_customer = get_customer(request)
+    if order_customer is None:
+        return redirect('app:account')
+    cart = Cart(request)
+    try:
+        new_order = place_order(order_customer, cart.quantities(),
+                                request.POST.get('checkout_token', '')[:32] or None)
+    except EmptyOrderError:
+        return redirect('app:cart')
+    except OutOfStockError as error:
+        messages.error(request, str(error))
+        return redirect('app:cart')
+    total_amount = new_order.total_amount
+
+    request.session['order_id'] = new_order.id
+
+    paypal_dict = {
+        "business": settings.PAYPAL_RECEIVER_EMAIL,
+        "amount": total_amount,
+        "currency_code": settings.PAYPAL_CURRENCY,
+        "item_name": 'Order - ' + new_order.order_number,
+        "invoice": new_order.order_number,
+        "notify_url": request.build_absolute_uri(reverse('paypal-ipn')),
+        "return": request.build_absolute_uri('/order/thanks'),
+        "cancel_return": request.build_absolute_uri('/'),
+    }
+
+    cart.clear()
+
+    paypal_form = PayPalPaymentsForm(initial=paypal_dict)
+    prefetch_related_objects([new_order], Prefetch('details', queryset=OrderDetail.objects.select_related(
+        'product__category')))
 
     return render(request, 'purchase.html', {'order': new_order, 'paypal_form': paypal_form})
 
 
-login_required(login_url='/users/login/')
+@login_required(login_url='/users/login/')
+@query_budget(4)
 def thanks(request: HttpRequest) -> HttpResponse:
     """
-    View function to handle the order confirmation.
+    View function for the page PayPal returns to after the payment.
+
+    The order is only read here, its status is set from the PayPal IPN by app.payments.
     """
     if request.GET.get('PayerID'):
-        order = Order.objects.get(pk=request.session.get('order_id'))
-        order.status = 'Delivered'
-        order.save()
-        # send_mail('Order Confirmation',
-        #           f'Your order {order.order_number} has been confirmed.',
-        #           'emitter@mail.com', [request.user.email])
+        order = get_object_or_404(Order, pk=request.session.get('order_id'), customer__user=request.user)
         return render(request, 'thanks.html', {'order': order})
     return redirect('app:index')
 
+
+@staff_member_required
+@query_budget(4)
+def sales_report_view(request: HttpRequest) -> HttpResponse:
+    """
+    View function for the sales report of the last days, read from the daily rollups.
+    """
+    group = request.GET.get('group', 'day')
+    if group not in REPORT_GROUPS:
+        group = 'day'
+    try:
+        days = max(1, min(int(request.GET.get('days', settings.SALES_REPORT_DAYS)), 366))
+    except ValueError:
+        days = settings.SALES_REPORT_DAYS
+    status = request.GET.get('status') or None
+    rows = sales_report(days, group, status)
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'group': group, 'days': days, 'status': status, 'rows': rows})
+    return render(request, 'sales_report.html', {'rows': rows, 'group': group, 'days': days, 'status': status,
+                                                 'groups': list(REPORT_GROUPS),
+                                                 'statuses': [value for value, _ in Order.STATUS_CHOICES]})
+
+
+@staff_member_required
+@query_budget(4)
+def order_export_view(request: HttpRequest) -> HttpResponse:
+    """
+    View function streaming the orders and their lines as CSV, filtered by `since`, `until` and `status`.
+    """
+    try:
+        since = date.fromisoformat(request.GET['since']) if request.GET.get('since') else None
+        until = date.fromisoformat(request.GET['until']) if request.GET.get('until') else None
+    except ValueError:
+        return HttpResponseBadRequest('Dates must be formatted YYYY-MM-DD.')
+    status = request.GET.get('status') or None
+    if status and status not in dict(Order.STATUS_CHOICES):
+        return HttpResponseBadRequest(f'Unknown status {status!r}.')
+    orders = filter_orders(Order.objects.all(), since, until, status)
+    filename = f"orders-{since or 'start'}-{until or 'now'}{f'-{status.lower()}' if status else ''}.csv"
+    return orders_csv_response(request, orders, filename)
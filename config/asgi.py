@@ -9,8 +9,21 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+os.environ.setdefault('DJANGO_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
+
+if settings.DEBUG:
+    from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
+
+    application = ASGIStaticFilesHandler(application)
+else:
+    # Static and media files are answered before Django, see config.static.
+    from config.static import StaticFilesApplication
+
+    application = StaticFilesApplication(application, settings.STATIC_URL, settings.STATIC_ROOT,
+                                         settings.MEDIA_URL, settings.MEDIA_ROOT)
@@ -0,0 +1,26 @@
+"""
+Production entry point serving the project through ASGI with uvicorn.
+
+Run it with `python -m config.server`. It is configured by environment:
+HOST, PORT, WEB_CONCURRENCY (worker processes, defaults to the CPU count),
+WEB_KEEP_ALIVE (seconds) and WEB_LOG_LEVEL.
+"""
+
+import os
+
+import uvicorn
+
+
+def main() -> None:
+    uvicorn.run('config.asgi:application',
+                host=os.environ.get('HOST', '0.0.0.0'),
+                port=int(os.environ.get('PORT', 8000)),
+                workers=int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1)),
+                timeout_keep_alive=int(os.environ.get('WEB_KEEP_ALIVE', 5)),
+                log_level=os.environ.get('WEB_LOG_LEVEL', 'info'),
+                lifespan='off',
+                proxy_headers=True)
+
+
+if __name__ == '__main__':
+    main()
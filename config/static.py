@@ -0,0 +1,267 @@
+"""
+Production static and media serving.
+
+`collectstatic` copies the assets with content hashed names through
+CompressedManifestStaticFilesStorage, which also writes gzip and brotli
+siblings of the text assets. StaticFilesApplication wraps the ASGI
+application and answers /static/ and /media/ before Django: hashed assets
+are cached for a year, the precompressed variant matching Accept-Encoding
+is picked from an index built once at startup (media files are stat'ed at
+most once per MEDIA_STAT_TTL seconds, image derivatives are cached for a
+year too), and the file body is handed to the server with the ASGI
+pathsend/zerocopysend extensions when it offers them, so asset traffic
+never reaches the Django workers.
+"""
+
+import asyncio
+import gzip
+import json
+import mimetypes
+import os
+import time
+from collections import OrderedDict
+from email.utils import formatdate
+from typing import Callable, Optional
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional, gzip is always written.
+    brotli = None
+
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.txt', '.json', '.xml', '.html', '.map', '.eot', '.otf', '.ttf')
+MIN_COMPRESS_SIZE = 256
+CHUNK_SIZE = 64 * 1024
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Encodings by preference with the suffix of their precompressed files.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+# Seconds a media file lookup is reused and how many lookups are kept.
+MEDIA_STAT_TTL = 60
+MEDIA_CACHE_SIZE = 1024
+# Media written under content hashed names, see app.images, never change once written.
+IMMUTABLE_MEDIA_PREFIXES = ('products/derived/',)
+
+
+def _compress_file(path: str) -> None:
+    """
+    Writes the .gz and .br siblings of a file when they are smaller than it.
+    """
+    with open(path, 'rb') as source:
+        content = source.read()
+    variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(content, quality=11)))
+    for suffix, compressed in variants:
+        if len(compressed) < len(content):
+            with open(path + suffix, 'wb') as target:
+                target.write(compressed)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest storage that also precompresses the hashed text assets with gzip and brotli.
+    """
+
+    def url_converter(self, name, hashed_files, template=None):
+        converter = super().url_converter(name, hashed_files, template)
+
+        def converter_or_original(matchobj):
+            # The bundled theme stylesheets reference a few images that were never shipped,
+            # those references are kept as they are instead of failing the whole build.
+            try:
+                return converter(matchobj)
+            except ValueError:
+                return matchobj['matched']
+        return converter_or_original
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(self.hashed_files.values()):
+            path = self.path(name)
+            if name.endswith(COMPRESSIBLE_EXTENSIONS) and os.path.getsize(path) >= MIN_COMPRESS_SIZE:
+                _compress_file(path)
+
+
+def parse_accept_encoding(header: str) -> dict[str, float]:
+    """
+    Returns the quality value of every coding listed in an Accept-Encoding header.
+    """
+    qualities = {}
+    for item in header.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    return qualities
+
+
+def _accepts(qualities: dict[str, float], encoding: str) -> bool:
+    quality = qualities.get(encoding, qualities.get('*', 0.0))
+    return quality > 0
+
+
+class StaticFile:
+    """
+    A servable file with its precompressed variants and response headers.
+
+    Every variant has its own ETag, a cached gzip body must not validate a brotli one.
+    """
+
+    __slots__ = ('path', 'headers', 'etag', 'variants')
+
+    def __init__(self, path: str, cache_control: str) -> None:
+        stat = os.stat(path)
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.path = path
+        self.etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        self.headers = [(b'content-type', content_type.encode()),
+                        (b'cache-control', cache_control.encode()),
+                        (b'last-modified', formatdate(stat.st_mtime, usegmt=True).encode())]
+        self.variants = [(encoding, path + suffix, os.path.getsize(path + suffix), f'{self.etag[:-1]}-{encoding}"')
+                         for encoding, suffix in ENCODINGS if os.path.exists(path + suffix)]
+        self.variants.append((None, path, stat.st_size, self.etag))
+        if len(self.variants) > 1:
+            self.headers.append((b'vary', b'Accept-Encoding'))
+
+    def select(self, accept_encoding: str) -> tuple[Optional[str], str, int, str]:
+        """
+        Returns the encoding, path, size and ETag of the smallest variant the client accepts.
+        """
+        qualities = parse_accept_encoding(accept_encoding)
+        for variant in self.variants[:-1]:
+            if _accepts(qualities, variant[0]):
+                return variant
+        # The identity is served even when refused, rather than a 406.
+        return self.variants[-1]
+
+
+def _resolve(root: str, relative: str) -> Optional[str]:
+    """
+    Returns the absolute path of `relative` inside `root`, None when it escapes it.
+    """
+    path = os.path.realpath(os.path.join(root, relative))
+    return path if os.path.commonpath([root, path]) == root and os.path.isfile(path) else None
+
+
+class StaticFilesApplication:
+    """
+    ASGI application serving the collected static files and the media uploads in front of `application`.
+    """
+
+    def __init__(self, application: Callable, static_url: str, static_root: str,
+                 media_url: str, media_root: str, media_cache_control: str = 'public, max-age=86400') -> None:
+        self.application = application
+        self.static_prefix = '/' + static_url.strip('/') + '/'
+        self.media_prefix = '/' + media_url.strip('/') + '/'
+        self.media_root = os.path.realpath(media_root)
+        self.media_cache_control = media_cache_control
+        self.static_files = self._index(os.path.realpath(static_root))
+        # Media lookups by relative path with their expiry, least recently used first.
+        self.media_files: OrderedDict[str, tuple[float, StaticFile]] = OrderedDict()
+
+    @staticmethod
+    def _index(root: str) -> dict[str, StaticFile]:
+        """
+        Indexes the collected files once, they do not change until the next deployment.
+        """
+        try:
+            with open(os.path.join(root, 'staticfiles.json')) as manifest:
+                hashed = set(json.load(manifest)['paths'].values())
+        except (OSError, ValueError, KeyError):
+            hashed = set()
+        files = {}
+        for directory, _, names in os.walk(root):
+            for name in names:
+                if name.endswith(('.gz', '.br')):
+                    continue
+                path = os.path.join(directory, name)
+                relative = os.path.relpath(path, root).replace(os.sep, '/')
+                files[relative] = StaticFile(path, IMMUTABLE if relative in hashed else 'public, max-age=60')
+        return files
+
+    def lookup(self, path: str) -> Optional[StaticFile]:
+        """
+        Returns the file served at a url path, None when it is not a static or media file.
+        """
+        if path.startswith(self.static_prefix):
+            return self.static_files.get(path[len(self.static_prefix):])
+        if path.startswith(self.media_prefix):
+            return self._media_file(path[len(self.media_prefix):])
+        return None
+
+    def _media_file(self, relative: str) -> Optional[StaticFile]:
+        """
+        Returns a media file, stat'ed again after MEDIA_STAT_TTL seconds since uploads change at runtime.
+        """
+        now = time.monotonic()
+        if (cached := self.media_files.get(relative)) and cached[0] > now:
+            self.media_files.move_to_end(relative)
+            return cached[1]
+        self.media_files.pop(relative, None)
+        # Missing files are not remembered, an upload is served as soon as it is written.
+        if not (filename := _resolve(self.media_root, relative)):
+            return None
+        static_file = StaticFile(filename, IMMUTABLE if relative.startswith(IMMUTABLE_MEDIA_PREFIXES)
+                                 else self.media_cache_control)
+        self.media_files[relative] = (now + MEDIA_STAT_TTL, static_file)
+        if len(self.media_files) > MEDIA_CACHE_SIZE:
+            self.media_files.popitem(last=False)
+        return static_file
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+            if static_file := self.lookup(scope['path']):
+                return await self.serve(static_file, scope, send)
+        await self.application(scope, receive, send)
+
+    async def serve(self, static_file: StaticFile, scope: dict, send: Callable) -> None:
+        request_headers = dict(scope['headers'])
+        encoding, path, size, etag = static_file.select(request_headers.get(b'accept-encoding', b'').decode('latin-1'))
+        if_none_match = request_headers.get(b'if-none-match', b'').decode('latin-1')
+        if etag in (tag.strip() for tag in if_none_match.split(',')) or if_none_match.strip() == '*':
+            await send({'type': 'http.response.start', 'status': 304,
+                        'headers': static_file.headers + [(b'etag', etag.encode())]})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        headers = static_file.headers + [(b'etag', etag.encode()), (b'content-length', str(size).encode())]
+        if encoding:
+            headers.append((b'content-encoding', encoding.encode()))
+        await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+        if scope['method'] == 'HEAD':
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        extensions = scope.get('extensions') or {}
+        if 'http.response.pathsend' in extensions:
+            await send({'type': 'http.response.pathsend', 'path': path})
+        elif 'http.response.zerocopysend' in extensions:
+            with open(path, 'rb') as file:
+                await send({'type': 'http.response.zerocopysend', 'file': file.fileno()})
+        else:
+            await self._stream(path, send)
+
+    @staticmethod
+    async def _stream(path: str, send: Callable) -> None:
+        """
+        Sends the file in chunks read off the event loop, for servers without a sendfile extension.
+        """
+        with open(path, 'rb') as file:
+            while True:
+                chunk = await asyncio.to_thread(file.read, CHUNK_SIZE)
+                more = len(chunk) == CHUNK_SIZE
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': more})
+                if not more:
+                    break
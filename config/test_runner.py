@@ -0,0 +1,25 @@
+"""
+Test runner failing the views that exceed their query budget.
+
+Outside the tests a view exceeding its budget is only logged, see
+app.instrumentation, the runner enables QUERY_BUDGET_RAISE for the whole
+run so a query regression fails the suite instead.
+"""
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """
+    DiscoverRunner raising QueryBudgetExceeded when a view exceeds its query budget.
+    """
+
+    def setup_test_environment(self, **kwargs) -> None:
+        super().setup_test_environment(**kwargs)
+        self.query_budgets = override_settings(QUERY_BUDGET_RAISE=True)
+        self.query_budgets.enable()
+
+    def teardown_test_environment(self, **kwargs) -> None:
+        self.query_budgets.disable()
+        super().teardown_test_environment(**kwargs)